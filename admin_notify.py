@@ -0,0 +1,212 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Заголовки сводок по видам событий
+TITLES = {
+    'payment': '💰 Новые оплаченные заказы',
+    'error': '⚠️ Ошибки',
+}
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+def error_fingerprint(error):
+    # Одинаковые ошибки с разными числами (id, суммы, время) считаются одной
+    return f"{type(error).__name__}: {re.sub(r'[0-9]+', 'N', str(error))}"
+
+
+def _clip(text):
+    return text if len(text) <= MAX_MESSAGE_LENGTH else text[:MAX_MESSAGE_LENGTH - 1] + "…"
+
+
+class _Window:
+    __slots__ = ('opened', 'started', 'entries', 'total')
+
+    def __init__(self, opened, started):
+        self.opened = opened  # time.monotonic(), по нему закрывается окно
+        self.started = started  # time.time() того же момента, для журнала
+        self.entries = {}  # отпечаток -> [сколько раз, текст последнего, строка для сводки]
+        self.total = 0
+
+
+# ===== УВЕДОМЛЕНИЯ АДМИНИСТРАТОРУ =====
+class AdminNotifier:
+    # Обработчики только кладут событие в память, отправкой занимается фоновый поток.
+    # Первое событие вида открывает окно (windows[вид] секунд, по умолчанию
+    # default_window); всё, что пришло за окно, уходит одной сводкой. В сводке
+    # каждое событие - полным текстом (у оплаченного заказа это все его данные);
+    # только события с одинаковым отпечатком (повторы одной ошибки) схлопываются
+    # в короткую строку summary с числом повторов. Сводка длиннее лимита
+    # Telegram уходит несколькими сообщениями.
+    #
+    # path - журнал ещё не отправленных событий (строка JSON на событие): окно
+    # сводки переживает падение и перезапуск бота, после запуска события
+    # загружаются и уходят в срок своего окна. Когда сводка отдана send(),
+    # журнал переписывается без неё, поэтому send должен сохранять сообщение
+    # сам (журнал исходящих) или дожидаться отправки. Если бот упал между
+    # send() и перезаписью журнала, сводка придёт дважды.
+    #
+    # post() не ждёт диска: строка пишется в файл (переживает падение процесса),
+    # fsync делает фоновый поток раз в sync_interval секунд - общий для всех
+    # строк за это время, как в журнале исходящих (outbox.py).
+    def __init__(self, send=None, windows=None, default_window=60, path=None, sync_interval=0.05):
+        # send(chat_id, text) - как отправить сообщение; пока не задан, сводки копятся
+        self.send = send
+        self.windows = dict(windows or {})
+        self.default_window = default_window
+        self.path = path
+        self.sync_interval = sync_interval
+        self._pending = {}  # (chat_id, вид) -> _Window
+        self._file = None
+        self._written = 0
+        self._synced = 0
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='AdminNotifier', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def post(self, chat_id, kind, text, fingerprint=None, summary=None):
+        now = time.time()
+        with self._lock:
+            self._add(chat_id, kind, fingerprint or text, text, summary or text, 1, now)
+            if self._file is not None:
+                self._write(self._file, chat_id, kind, fingerprint or text, text, summary or text, 1, now)
+                self._written += 1
+
+    def _add(self, chat_id, kind, key, text, summary, count, started):
+        # Под self._lock
+        window = self._pending.get((chat_id, kind))
+        if window is None:
+            # Окно из журнала закроется в свой срок, а не через полное окно после запуска
+            opened = time.monotonic() - max(0, time.time() - started)
+            window = self._pending[(chat_id, kind)] = _Window(opened, started)
+        entry = window.entries.setdefault(key, [0, text, summary])
+        entry[0] += count
+        entry[1] = text
+        entry[2] = summary
+        window.total += count
+
+    # ===== ЖУРНАЛ НЕОТПРАВЛЕННЫХ СОБЫТИЙ =====
+    @staticmethod
+    def _write(f, chat_id, kind, key, text, summary, count, started):
+        record = {'chat_id': chat_id, 'kind': kind, 'key': key, 'text': text, 'summary': summary,
+                  'count': count, 'time': started}
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        f.flush()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после сбоя
+                        break
+                    self._add(record['chat_id'], record['kind'], record['key'], record['text'],
+                              record['summary'], record['count'], record['time'])
+        except FileNotFoundError:
+            pass
+        if self._pending:
+            logger.info(f"Сводки администратору: {len(self._pending)} неотправленных после перезапуска")
+        self._rewrite()
+
+    def _rewrite(self):
+        # Под self._lock (или до запуска потока): журнал = то, что ещё не отправлено
+        if self._file is not None:
+            self._file.close()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for (chat_id, kind), window in self._pending.items():
+                for key, (count, text, summary) in window.entries.items():
+                    self._write(f, chat_id, kind, key, text, summary, count, window.started)
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._synced = self._written
+
+    def _sync(self):
+        with self._lock:
+            if self._file is None or self._synced >= self._written:
+                return
+            target = self._written
+            # Копия дескриптора: перезапись журнала может закрыть файл, пока идёт fsync
+            fd = os.dup(self._file.fileno())
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._lock:
+            self._synced = max(self._synced, target)
+
+    def _run(self):
+        flushed = time.monotonic()
+        while not self._stop.wait(self.sync_interval):
+            self._sync()
+            if time.monotonic() - flushed >= 1:
+                flushed = time.monotonic()
+                self.flush()
+
+    def flush(self, force=False):
+        if self.send is None:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            due = [key for key, window in self._pending.items()
+                   if force or now - window.opened >= self.windows.get(key[1], self.default_window)]
+            ready = [(key, self._pending.pop(key)) for key in due]
+        for (chat_id, kind), window in ready:
+            try:
+                for text in self.digest(kind, window):
+                    result = self.send(chat_id, text)
+                    # При остановке бота дожидаемся, пока сводка уйдёт
+                    if force and hasattr(result, 'result'):
+                        result.result(timeout=5)
+            except Exception as e:
+                logger.error(f"Не удалось отправить сводку администратору: {str(e)}")
+                # События остаются до следующего окна
+                with self._lock:
+                    for key, (count, text, summary) in window.entries.items():
+                        self._add(chat_id, kind, key, text, summary, count, time.time())
+        if ready and self.path is not None:
+            with self._lock:
+                self._rewrite()
+        return len(ready)
+
+    def digest(self, kind, window):
+        # Тексты сообщений сводки: одиночное событие - как есть
+        if window.total == 1:
+            return [_clip(next(iter(window.entries.values()))[1])]
+        # Повторы идут первыми, остальные события - в порядке поступления
+        entries = sorted(window.entries.values(), key=lambda entry: -entry[0])
+        blocks = [text if count == 1 else f"• {summary} (×{count})" for count, text, summary in entries]
+        messages = []
+        current = f"{TITLES.get(kind, kind)}: {window.total}"
+        for block in blocks:
+            block = _clip(block)
+            if len(current) + 2 + len(block) > MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = block
+            else:
+                current += "\n\n" + block
+        messages.append(current)
+        return messages
+
+    def close(self):
+        self._stop.set()
+        self.flush(force=True)
+        self._sync()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,529 @@
+import asyncio
+import os
+import logging
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_filters import StateFilter
+from config import (PAYMENT_TOKEN, ADMIN_ID, ERROR_REPORT_ID, ADMIN_DIGEST_WINDOWS, ADMIN_DIGEST_JOURNAL,
+                    ORDER_STORE, ORDER_DB_PATH, ORDER_TTL, INVOICE_TTL,
+                    INTAKE_DIR, INTAKE_MAX_PENDING, MAX_FILE_SIZE,
+                    UPLOAD_CACHE_DIR, UPLOAD_CACHE_SIZE, VOLUME_DISCOUNTS,
+                    PAYMENT_LEDGER_DIR, PAYMENT_LEDGER_SEGMENT_SIZE,
+                    LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_INTERVAL, LOG_QUEUE_SIZE,
+                    METRICS_LISTEN, METRICS_PORT)
+from order_store import create_order_store, AsyncOrderStore
+from order_model import OrderFile, PaperFormat, PrintType, Side
+from payment_ledger import PaymentLedger, payment_entry
+from invoices import create_invoice_index, AsyncInvoiceIndex, InvoiceRejected
+from file_intake import AsyncFileIntake, FileTooLarge, IntakeBusy, remove_file, sweep_orphans
+from page_counter import PageCounter
+from upload_cache import UploadCache
+from pricing import prices, PriceTable, format_rub
+from text_router import TextRouter
+from bot_logging import setup_logging, user_fields, dropped_records
+from admin_notify import AdminNotifier, error_fingerprint
+from metrics import Registry, MetricsServer
+from order_states import OrderStates, AsyncOrderStateStorage, check_transition, check_step
+from order_flow import (MAX_PAGE_COUNT, parse_page_count, needs_sides, file_pages, sides_after_file,
+                        page_count_notice, confirmable, order_total, summary_text, invoice_description,
+                        invoice_error_report, payment_texts)
+
+# Версия бота на asyncio: тот же сценарий заказа, что и в newmain.py,
+# но все обращения к Telegram и к диску не занимают потоки.
+
+# Настройки логирования
+setup_logging(
+    LOG_FILE,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    rotate_interval=LOG_ROTATE_INTERVAL,
+    queue_size=LOG_QUEUE_SIZE
+)
+logger = logging.getLogger(__name__)
+
+
+# Вспомогательные функции для логирования
+def log_user_action(message, action, order_id=None):
+    logger.info(action, extra=user_fields(message, action=action, order_id=order_id))
+
+def log_user_error(message, error, order_id=None):
+    logger.error(error, extra=user_fields(message, order_id=order_id))
+
+# Шаги заказа
+async def set_step(message, state):
+    current = await bot.get_state(message.from_user.id, message.chat.id)
+    await bot.set_state(message.from_user.id, check_transition(current, state), message.chat.id)
+
+async def expect_step(message, state):
+    check_step(await bot.get_state(message.from_user.id, message.chat.id), state)
+
+# Файл заказа лежит в INTAKE_DIR, пока жив черновик, а после подтверждения -
+# пока не оплачен или не истёк счёт
+def discard_order_file(order):
+    if order is not None and order.file:
+        remove_file(order.file.path)
+
+def discard_invoice_file(invoice):
+    if invoice is not None:
+        remove_file(invoice.get('file_path'))
+
+# База данных заказов, в ней же хранится текущий шаг разговора
+if ORDER_STORE == 'sqlite':
+    orders = AsyncOrderStore(create_order_store('sqlite', path=ORDER_DB_PATH, ttl=ORDER_TTL,
+                                                on_expire=discard_order_file))
+else:
+    orders = AsyncOrderStore(create_order_store('memory', ttl=ORDER_TTL, on_expire=discard_order_file))
+if ORDER_STORE == 'sqlite':
+    invoices = AsyncInvoiceIndex(create_invoice_index('sqlite', path=ORDER_DB_PATH, ttl=INVOICE_TTL,
+                                                      on_expire=discard_invoice_file))
+else:
+    invoices = AsyncInvoiceIndex(create_invoice_index('memory', ttl=INVOICE_TTL, on_expire=discard_invoice_file))
+ledger = PaymentLedger(PAYMENT_LEDGER_DIR, segment_size=PAYMENT_LEDGER_SEGMENT_SIZE)
+price_table = PriceTable(prices, VOLUME_DISCOUNTS)
+
+# Инициализация бота
+bot = AsyncTeleBot(os.getenv('TELEGRAM_TOKEN'), state_storage=AsyncOrderStateStorage(orders))
+bot.add_custom_filter(StateFilter(bot))
+intake = AsyncFileIntake(
+    bot.token,
+    directory=INTAKE_DIR,
+    max_pending=INTAKE_MAX_PENDING,
+    max_size=MAX_FILE_SIZE
+)
+uploads = UploadCache(UPLOAD_CACHE_DIR, max_bytes=UPLOAD_CACHE_SIZE)
+# Кнопки подключаются к боту в конце файла, после обработчиков шагов заказа:
+# пока бот ждёт число, файл или комментарий, текст кнопки тоже идёт в шаг
+buttons = TextRouter()
+
+# Уведомления администратору копятся и уходят сводками; отправку задаёт main()
+admin = AdminNotifier(windows=ADMIN_DIGEST_WINDOWS, path=ADMIN_DIGEST_JOURNAL)
+
+# Метрики заказов и платежей, те же имена, что в newmain.py. Сервер метрик
+# работает в своём потоке и в цикл событий не заходит
+registry = Registry()
+invoice_count = registry.counter('bot_invoices', "Выставленные счета", labels=('result',))
+pre_checkout_count = registry.counter('bot_pre_checkouts', "Ответы на pre-checkout", labels=('result',))
+payment_count = registry.counter('bot_payments', "Полученные платежи", labels=('result',))
+registry.gauge('bot_draft_orders', "Черновики заказов", lambda: len(orders.store))
+registry.gauge('bot_abandoned_orders', "Черновики, удалённые по ORDER_TTL с запуска", lambda: orders.store.purged)
+registry.gauge('bot_open_invoices', "Выставленные и ещё не оплаченные счета", lambda: len(invoices.index))
+registry.gauge('bot_log_dropped', "Записи лога, отброшенные из-за переполненной очереди", dropped_records)
+
+# ===== ОСНОВНЫЕ КОМАНДЫ =====
+@bot.message_handler(commands=['start'])
+async def start(message):
+    try:
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('🖨 Начать заказ')
+        await bot.send_message(
+            message.chat.id,
+            "Добро пожаловать в сервис печати от Володи!",
+            reply_markup=markup
+        )
+        log_user_action(message, "Пользователь начал работу с ботом")
+    except Exception as e:
+        log_user_error(message, f"Ошибка в команде /start: {str(e)}")
+
+# ===== СИСТЕМА ЗАКАЗА =====
+@buttons.handler('🖨 Начать заказ')
+async def start_order(message):
+    try:
+        chat_id = message.chat.id
+        # Новый заказ заменяет недооформленный, его файл больше не нужен
+        await asyncio.to_thread(discard_order_file, await orders.delete(chat_id))
+        await orders.create(chat_id)
+        await ask_color_type(message)
+        log_user_action(message, "Начал оформление заказа")
+    except Exception as e:
+        log_user_error(message, f"Ошибка при начале заказа: {str(e)}")
+
+async def ask_color_type(message):
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add('Черно-белая', 'Цветная')
+    await bot.send_message(message.chat.id, "Выберите тип печати:", reply_markup=markup)
+    await set_step(message, OrderStates.color)
+
+@buttons.handler('Черно-белая', 'Цветная')
+async def select_color_type(message):
+    try:
+        chat_id = message.chat.id
+        await expect_step(message, OrderStates.color)
+        color_type = PrintType.BW if message.text == 'Черно-белая' else PrintType.COLOR
+        await orders.update(chat_id, type=color_type)
+        log_user_action(message, f"Выбрал тип печати: {color_type}")
+        await ask_page_count(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка выбора типа печати: {str(e)}")
+
+async def ask_page_count(message):
+    try:
+        markup = types.ReplyKeyboardRemove()
+        await bot.send_message(
+            message.chat.id,
+            "Введите количество страниц (число):",
+            reply_markup=markup
+        )
+        await set_step(message, OrderStates.pages)
+    except Exception as e:
+        log_user_error(message, f"Ошибка запроса количества страниц: {str(e)}")
+
+@bot.message_handler(state=OrderStates.pages, content_types=['text', 'document', 'photo'])
+async def process_page_count(message):
+    try:
+        chat_id = message.chat.id
+        page_count = parse_page_count(message.text)
+
+        await orders.update(chat_id, page_count=page_count)
+        log_user_action(message, f"Указал количество страниц: {page_count}")
+        await ask_format(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка обработки количества страниц: {str(e)}")
+        await bot.send_message(chat_id, f"Пожалуйста, введите число от 1 до {MAX_PAGE_COUNT}!")
+        await ask_page_count(message)
+
+async def ask_format(message):
+    try:
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('A5', 'A4', 'A3', 'A2')
+        await bot.send_message(
+            message.chat.id,
+            "Выберите формат бумаги:",
+            reply_markup=markup
+        )
+        await set_step(message, OrderStates.format)
+    except Exception as e:
+        log_user_error(message, f"Ошибка запроса формата бумаги: {str(e)}")
+
+@buttons.handler('A5', 'A4', 'A3', 'A2')
+async def select_format(message):
+    try:
+        chat_id = message.chat.id
+        await expect_step(message, OrderStates.format)
+        paper_format = PaperFormat.parse(message.text)
+        order = await orders.update(chat_id, format=paper_format)
+        log_user_action(message, f"Выбрал формат бумаги: {paper_format}")
+
+        if needs_sides(order):
+            await ask_side_type(message)
+        else:
+            await ask_file(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка выбора формата бумаги: {str(e)}")
+
+async def ask_side_type(message):
+    try:
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('Односторонняя', 'Двухсторонняя')
+        await bot.send_message(
+            message.chat.id,
+            "Выберите тип печати:",
+            reply_markup=markup
+        )
+        await set_step(message, OrderStates.sides)
+    except Exception as e:
+        log_user_error(message, f"Ошибка запроса типа печати: {str(e)}")
+
+@buttons.handler('Односторонняя', 'Двухсторонняя')
+async def select_side_type(message):
+    try:
+        chat_id = message.chat.id
+        await expect_step(message, OrderStates.sides)
+        side_type = Side.parse(message.text)
+        order = await orders.update(chat_id, side=side_type)
+        log_user_action(message, f"Выбрал тип печати: {side_type}")
+        # Стороны спрошены после файла (страниц в нём оказалось больше)
+        if order.file:
+            await ask_comment(message)
+        else:
+            await ask_file(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка выбора типа печати: {str(e)}")
+
+async def ask_file(message):
+    try:
+        await bot.send_message(
+            message.chat.id,
+            "Пожалуйста, прикрепите файл для печати (PDF, DOCX, JPG):"
+        )
+        await set_step(message, OrderStates.file)
+    except Exception as e:
+        log_user_error(message, f"Ошибка запроса файла: {str(e)}")
+
+@bot.message_handler(state=OrderStates.file, content_types=['text', 'document', 'photo'])
+async def process_file(message):
+    try:
+        chat_id = message.chat.id
+        if message.document:
+            # Этот файл уже присылали - берём его и анализ из кеша без обращения к Telegram
+            path, cached = await asyncio.to_thread(uploads.checkout, message.document.file_unique_id, INTAKE_DIR)
+            if cached:
+                await attach_file(message, path, cached['analysis'])
+                return
+
+            # Файл скачивается кусками, страницы считаются прямо по ходу скачивания
+            counter = PageCounter(message.document.file_name)
+            path = await intake.download(
+                message.document.file_id,
+                file_size=message.document.file_size,
+                file_name=message.document.file_name,
+                on_chunk=counter.feed
+            )
+            try:
+                analysis = await asyncio.to_thread(counter.finish, path)
+                await asyncio.to_thread(uploads.put, message.document.file_unique_id, path, analysis)
+            except Exception:
+                # Файл не разобрался и в заказ не попадёт
+                await asyncio.to_thread(remove_file, path)
+                raise
+            await attach_file(message, path, analysis)
+        else:
+            await bot.send_message(chat_id, "Пожалуйста, прикрепите файл!")
+            await ask_file(message)
+    except FileTooLarge as e:
+        log_user_error(message, f"Слишком большой файл: {str(e)}")
+        await bot.send_message(chat_id, f"Файл слишком большой. Максимум {MAX_FILE_SIZE // (1024 * 1024)} МБ.")
+        await ask_file(message)
+    except IntakeBusy as e:
+        log_user_error(message, f"Очередь загрузок переполнена: {str(e)}")
+        await bot.send_message(chat_id, "Сейчас загружается много файлов. Отправьте файл ещё раз через минуту.")
+        await ask_file(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка обработки файла: {str(e)}")
+
+async def attach_file(message, path, analysis):
+    previous = await orders.get(message.chat.id)
+    try:
+        await orders.update(message.chat.id, file=OrderFile(
+            message.document.file_name,
+            message.document.file_id,
+            path,
+            analysis['kind'],
+            file_pages(analysis)
+        ))
+    except Exception:
+        # Черновик отменён или удалён по ORDER_TTL, пока файл качался
+        await asyncio.to_thread(remove_file, path)
+        raise
+    # Клиент прислал файл ещё раз, пока качался первый: остаётся последний
+    if previous is not None and previous.file and previous.file.path != path:
+        await asyncio.to_thread(remove_file, previous.file.path)
+    log_user_action(message, f"Загрузил файл: {message.document.file_name}")
+    if await verify_page_count(message, analysis):
+        await ask_side_type(message)
+    else:
+        await ask_comment(message)
+
+async def verify_page_count(message, analysis):
+    # Сверяем указанное клиентом количество страниц с документом, картинки не трогаем.
+    # True - нужно спросить стороны печати
+    pages = file_pages(analysis)
+    if pages is None:
+        return False
+    chat_id = message.chat.id
+    order = await orders.get(chat_id)
+    if order.page_count != pages:
+        await orders.update(chat_id, page_count=pages)
+        log_user_action(message, f"Количество страниц исправлено по файлу: {order.page_count} -> {pages}")
+        await bot.send_message(chat_id, page_count_notice(pages))
+    return sides_after_file(order, pages)
+
+async def ask_comment(message):
+    try:
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('Пропустить')
+        await bot.send_message(
+            message.chat.id,
+            "Хотите добавить комментарий к заказу?",
+            reply_markup=markup
+        )
+        await set_step(message, OrderStates.comment)
+    except Exception as e:
+        log_user_error(message, f"Ошибка запроса комментария: {str(e)}")
+
+@bot.message_handler(state=OrderStates.comment, content_types=['text', 'document', 'photo'])
+async def process_comment(message):
+    try:
+        chat_id = message.chat.id
+        if message.text != 'Пропустить':
+            await orders.update(chat_id, comment=message.text)
+            log_user_action(message, f"Добавил комментарий: {message.text}")
+        else:
+            log_user_action(message, "Пропустил добавление комментария")
+
+        await show_order_summary(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка обработки комментария: {str(e)}")
+
+async def show_order_summary(message):
+    try:
+        chat_id = message.chat.id
+        order = await orders.get(chat_id)
+
+        # Расчет стоимости (в копейках), сохраняется в заказе для оплаты
+        total = price_table.quote(order)
+        await orders.update(chat_id, total=total)
+
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('✅ Подтвердить заказ', '❌ Отменить')
+        await bot.send_message(chat_id, summary_text(order, total), reply_markup=markup)
+        await set_step(message, OrderStates.summary)
+
+        log_user_action(message, f"Показал итог заказа. Сумма: {format_rub(total)}")
+    except Exception as e:
+        log_user_error(message, f"Ошибка показа итогов заказа: {str(e)}")
+
+# ===== ОПЛАТА И КОРЗИНА =====
+@buttons.handler('✅ Подтвердить заказ')
+async def confirm_order(message):
+    try:
+        chat_id = message.chat.id
+        order = await orders.get(chat_id)
+
+        if not confirmable(order):
+            await bot.send_message(chat_id, "Ошибка: заказ не найден")
+            return
+
+        total = order_total(order, price_table)  # Важно: целое число в копейках
+
+        # Счёт получает свой номер и снимок заказа; черновик освобождается,
+        # и можно оформлять следующий заказ, не оплатив этот
+        invoice = await invoices.issue(chat_id, message.from_user.id, order, total, currency="RUB")
+
+        await bot.send_invoice(
+            chat_id,
+            title="Оплата печати",
+            description=invoice_description(order),
+            invoice_payload=invoice['payload'],
+            provider_token=PAYMENT_TOKEN,
+            start_parameter="print_order",
+            currency="RUB",
+            prices=[types.LabeledPrice("Печать", total)],
+            need_email=True,
+            need_phone_number=True
+        )
+        await orders.delete(chat_id)
+        invoice_count.labels('sent').inc()
+        log_user_action(message, f"Выставлен счёт на {format_rub(total)}", order_id=invoice['order_id'])
+
+    except Exception as e:
+        invoice_count.labels('failed').inc()
+        logger.error(f"Ошибка создания инвойса: {str(e)}", exc_info=True)
+        await bot.send_message(chat_id, "Извините, произошла ошибка. Мы уже работаем над её устранением.")
+
+        # Отправляем уведомление себе; одинаковые ошибки попадут в сводку одной строкой
+        text, summary = invoice_error_report(message.from_user.username, e)
+        await asyncio.to_thread(admin.post, ERROR_REPORT_ID, 'error', text,
+                                fingerprint=error_fingerprint(e), summary=summary)
+
+@bot.pre_checkout_query_handler(func=lambda query: True)
+async def process_pre_checkout(pre_checkout_query):
+    try:
+        user_id = pre_checkout_query.from_user.id
+        try:
+            invoice = await invoices.verify(
+                pre_checkout_query.invoice_payload,
+                user_id,
+                pre_checkout_query.total_amount,
+                pre_checkout_query.currency
+            )
+        except InvoiceRejected as e:
+            await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False, error_message=str(e))
+            pre_checkout_count.labels('rejected').inc()
+            logger.error(f"Недействительный pre-checkout запрос: {str(e)}", extra={'user_id': user_id})
+        else:
+            await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
+            pre_checkout_count.labels('ok').inc()
+            logger.info("Подтвержден pre-checkout запрос",
+                        extra={'user_id': user_id, 'order_id': invoice['order_id']})
+    except Exception as e:
+        pre_checkout_count.labels('error').inc()
+        logger.error(f"Ошибка обработки pre-checkout: {str(e)}")
+        await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False,
+                                            error_message="Произошла ошибка")
+
+@bot.message_handler(content_types=['successful_payment'])
+async def process_successful_payment(message):
+    try:
+        chat_id = message.chat.id
+        payment = message.successful_payment
+        invoice = await invoices.get(payment.invoice_payload)
+
+        # Сначала платёж попадает в журнал, уведомления - после него. Если Telegram
+        # доставит то же обновление повторно, запись уже есть: уведомления
+        # отправляются, только если в прошлый раз до них не дошло
+        entry, created = await asyncio.to_thread(ledger.record, payment_entry(message, invoice))
+        if not created and await asyncio.to_thread(ledger.notified, entry['charge_id']):
+            payment_count.labels('duplicate').inc()
+            log_user_action(message, f"Повторная доставка платежа {payment.telegram_payment_charge_id}",
+                            order_id=entry['order_id'])
+            return
+
+        if not entry['order']:
+            payment_count.labels('unknown_invoice').inc()
+            await bot.send_message(chat_id, "Ошибка: данные заказа не найдены")
+            log_user_error(message, f"Оплата без сохраненного счёта: {payment.invoice_payload}")
+            await asyncio.to_thread(ledger.mark_notified, entry['charge_id'])
+            return
+
+        payment_count.labels('recorded' if created else 'resumed').inc()
+        # Текст уведомлений - из записи журнала: при повторной доставке счёта уже может не быть
+        customer_text, owner_text, summary = payment_texts(entry)
+        await bot.send_message(chat_id, customer_text, reply_markup=types.ReplyKeyboardRemove())
+
+        # Уведомление владельцу
+        await asyncio.to_thread(admin.post, ADMIN_ID, 'payment', owner_text, summary=summary)
+        await asyncio.to_thread(ledger.mark_notified, entry['charge_id'])
+
+        log_user_action(message, f"Успешная оплата заказа. Сумма: {format_rub(entry['amount'])}",
+                        order_id=entry['order_id'])
+
+        # Счёт оплачен, повторно оплатить его нельзя
+        await asyncio.to_thread(discard_invoice_file, await invoices.delete(payment.invoice_payload))
+    except Exception as e:
+        log_user_error(message, f"Ошибка обработки оплаты: {str(e)}")
+
+@buttons.handler('❌ Отменить')
+async def cancel_order(message):
+    try:
+        chat_id = message.chat.id
+        await asyncio.to_thread(discard_order_file, await orders.delete(chat_id))
+        await bot.send_message(chat_id, "Заказ отменен", reply_markup=types.ReplyKeyboardRemove())
+        await start(message)
+        log_user_action(message, "Отменил заказ")
+    except Exception as e:
+        log_user_error(message, f"Ошибка отмены заказа: {str(e)}")
+
+@buttons.handler('✏️ Изменить')
+async def edit_order(message):
+    try:
+        chat_id = message.chat.id
+        await asyncio.to_thread(discard_order_file, await orders.delete(chat_id))
+        await start_order(message)
+        log_user_action(message, "Редактирование заказа")
+    except Exception as e:
+        log_user_error(message, f"Ошибка редактирования заказа: {str(e)}")
+
+buttons.attach(bot)
+
+async def main():
+    loop = asyncio.get_running_loop()
+    # Сводки собирает фоновый поток, а отправляются они в цикле событий бота.
+    # Поток ждёт отправки: до неё сводка остаётся в журнале AdminNotifier
+    admin.send = lambda chat_id, text: asyncio.run_coroutine_threadsafe(
+        bot.send_message(chat_id, text), loop).result(timeout=60)
+    try:
+        await bot.infinity_polling()
+    finally:
+        await asyncio.to_thread(admin.flush, True)
+
+if __name__ == '__main__':
+    logger.info("===== БОТ ЗАПУЩЕН (asyncio) =====")
+    # Файлы, оставшиеся от заказов до перезапуска или падения
+    removed = sweep_orphans(INTAKE_DIR, orders.store.file_paths() | invoices.index.file_paths())
+    if removed:
+        logger.info(f"Удалено файлов без заказа: {removed}")
+    orders.store.start_sweeper()
+    invoices.index.start_sweeper()
+    if METRICS_PORT is not None:
+        MetricsServer(registry, listen=METRICS_LISTEN, port=METRICS_PORT).start()
+    asyncio.run(main())
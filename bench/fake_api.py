@@ -0,0 +1,241 @@
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# ===== ЛОКАЛЬНАЯ ЗАМЕНА BOT API =====
+class FakeBotApi:
+    # HTTP-сервер, который отвечает боту вместо api.telegram.org: getUpdates,
+    # sendMessage, sendInvoice, getFile, скачивание файла, answerPreCheckoutQuery.
+    # Остальные методы просто отвечают ok. Бот направляется сюда через
+    # apihelper.API_URL / FILE_URL (install()).
+    #
+    # latency - задержка каждого ответа в секундах (число или пара (от, до)),
+    # error_rate - доля ответов 500, throttle_rate - доля ответов 429 с retry_after.
+    # getUpdates ошибок не получает, иначе замеряется пауза поллинга, а не бот.
+    #
+    # Всё, что бот отправил, раскладывается по чатам: wait_for() ждёт нужный
+    # ответ - на этом построен замкнутый цикл в bench.load.
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, file_size=64 * 1024, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.file_size = file_size
+        self.files = {}  # file_id -> размер
+        self.calls = defaultdict(int)
+        self.injected = defaultdict(int)
+        self.connections = 0  # принятых TCP-соединений: сколько раз клиент открывал новое
+        self._random = random.Random(seed)
+        self._updates = deque()
+        self._next_update_id = 1
+        self._updates_cond = threading.Condition()
+        self._inbox = defaultdict(deque)
+        self._inbox_lock = threading.Lock()
+        self._inbox_conds = {}  # у каждого чата своё условие, чтобы не будить всех клиентов
+        self._queries = {}  # pre_checkout_query_id -> chat_id
+        self._message_id = 0
+        self._server = None
+
+    # --- управление ---
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят одним пакетом, иначе Nagle + отложенный ACK
+            # добавляют ~40 мс к каждому ответу и замер показывает сеть, а не бота
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                api.connections += 1
+
+            def do_GET(self):
+                api._handle(self)
+
+            do_POST = do_GET
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name='FakeBotApi', daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def install(self, *helpers):
+        # По умолчанию - синхронный apihelper; asyncio_helper можно передать явно
+        if not helpers:
+            from telebot import apihelper
+            helpers = (apihelper,)
+        for helper in helpers:
+            helper.API_URL = self.url + "/bot{0}/{1}"
+            helper.FILE_URL = self.url + "/file/bot{0}/{1}"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # --- входящие обновления ---
+
+    def push_update(self, update):
+        # update - словарь без update_id, как его прислал бы Telegram
+        with self._updates_cond:
+            update = dict(update, update_id=self._next_update_id)
+            self._next_update_id += 1
+            if 'pre_checkout_query' in update:
+                query = update['pre_checkout_query']
+                self._queries[query['id']] = query['from']['id']
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+        return update['update_id']
+
+    def wait_for(self, chat_id, method, text=None, timeout=10):
+        # Ждёт вызов method для чата (и text в тексте сообщения, если задан;
+        # кортеж - любой из вариантов). Вызовы до него отбрасываются.
+        # Возвращает параметры вызова.
+        texts = (text,) if isinstance(text, str) else text
+        deadline = time.monotonic() + timeout
+        with self._inbox_lock:
+            inbox = self._inbox[chat_id]
+            cond = self._chat_cond(chat_id)
+            while True:
+                while inbox:
+                    name, params = inbox.popleft()
+                    if name == method and (texts is None or any(t in params.get('text', '') for t in texts)):
+                        return params
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"{method} для чата {chat_id} не пришёл за {timeout} с")
+                cond.wait(remaining)
+
+    def forget(self, chat_id):
+        with self._inbox_lock:
+            self._inbox.pop(chat_id, None)
+            self._inbox_conds.pop(chat_id, None)
+
+    def _chat_cond(self, chat_id):
+        cond = self._inbox_conds.get(chat_id)
+        if cond is None:
+            cond = self._inbox_conds[chat_id] = threading.Condition(self._inbox_lock)
+        return cond
+
+    # --- обработка запросов бота ---
+
+    def _handle(self, request):
+        url = urlparse(request.path)
+        body = request.rfile.read(int(request.headers.get('Content-Length') or 0))
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if body:
+            params.update({key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+
+        if url.path.startswith('/file/'):
+            self._delay()
+            file_id = url.path.rsplit('/', 1)[1]
+            return self._reply(request, 200, b'\0' * self.files.get(file_id, self.file_size),
+                               'application/octet-stream')
+
+        method = url.path.rsplit('/', 1)[1]
+        self.calls[method] += 1
+        if method == 'getUpdates':
+            return self._reply_json(request, 200, {'ok': True, 'result': self._get_updates(params)})
+
+        self._delay()
+        roll = self._random.random()
+        if roll < self.throttle_rate:
+            self.injected[429] += 1
+            return self._reply_json(request, 429, {
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests: retry later',
+                'parameters': {'retry_after': self.retry_after}
+            })
+        if roll < self.throttle_rate + self.error_rate:
+            self.injected[500] += 1
+            return self._reply_json(request, 500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+
+        result = self._result(method, params)
+        self._deliver(method, params)
+        return self._reply_json(request, 200, {'ok': True, 'result': result})
+
+    def _delay(self):
+        latency = self.latency
+        if isinstance(latency, (tuple, list)):
+            latency = self._random.uniform(*latency)
+        if latency:
+            time.sleep(latency)
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._updates_cond:
+            while self._updates and self._updates[0]['update_id'] < offset:
+                self._updates.popleft()
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._updates_cond.wait(remaining)
+                while self._updates and self._updates[0]['update_id'] < offset:
+                    self._updates.popleft()
+            return list(self._updates)[:limit]
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'}
+        if method == 'getFile':
+            file_id = params.get('file_id')
+            return {'file_id': file_id, 'file_unique_id': file_id,
+                    'file_size': self.files.get(file_id, self.file_size), 'file_path': f"documents/{file_id}"}
+        if method.startswith('send'):
+            chat_id = params.get('chat_id', '0')
+            with self._inbox_lock:
+                self._message_id += 1
+                message_id = self._message_id
+            return {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(chat_id) if chat_id.lstrip('-').isdigit() else 0, 'type': 'private'},
+                'text': params.get('text', ''),
+            }
+        return True
+
+    def _deliver(self, method, params):
+        if method == 'answerPreCheckoutQuery':
+            chat_id = self._queries.pop(params.get('pre_checkout_query_id'), None)
+        else:
+            chat_id = params.get('chat_id')
+            chat_id = int(chat_id) if chat_id and chat_id.lstrip('-').isdigit() else None
+        if chat_id is None:
+            return
+        with self._inbox_lock:
+            self._inbox[chat_id].append((method, params))
+            self._chat_cond(chat_id).notify_all()
+
+    @staticmethod
+    def _reply_json(request, status, payload):
+        return FakeBotApi._reply(request, status, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    @staticmethod
+    def _reply(request, status, body, content_type):
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
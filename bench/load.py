@@ -0,0 +1,302 @@
+"""Нагрузочный прогон newmain.py против локальной замены Bot API.
+
+Каждый синтетический клиент проходит весь заказ: /start -> цвет -> страницы ->
+формат -> стороны -> файл -> комментарий -> подтверждение -> pre-checkout ->
+оплата. Следующий шаг отправляется только после ответа бота на предыдущий
+(замкнутый цикл), одновременно активно не больше --concurrency клиентов.
+
+    python -m bench.load --customers 2000 --concurrency 200 --latency 0.02
+
+Бот запускается в отдельной временной папке (--workdir), поэтому bot.log,
+загрузки и журнал платежей рабочей копии не трогаются.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.fake_api import FakeBotApi
+from bench.stats import summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_CHAT_ID = 10 ** 9
+
+
+def user(chat_id):
+    return {'id': chat_id, 'is_bot': False, 'first_name': 'Клиент', 'username': f"customer{chat_id}"}
+
+
+def message_update(chat_id, **fields):
+    message = {
+        'message_id': int(time.time() * 1000) % 10 ** 9,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': user(chat_id),
+    }
+    message.update(fields)
+    return {'message': message}
+
+
+# Шаги заказа: (имя, что отправить, какой вызов бота считать ответом)
+def order_steps(chat_id, file_size, pages=10):
+    document = {
+        'file_id': f"file{chat_id}",
+        'file_unique_id': f"unique{chat_id}",
+        'file_name': 'order.txt',
+        'file_size': file_size,
+    }
+    return [
+        ('start', message_update(chat_id, text='/start'), ('sendMessage', 'Добро пожаловать')),
+        ('order', message_update(chat_id, text='🖨 Начать заказ'), ('sendMessage', 'Выберите тип печати')),
+        ('color', message_update(chat_id, text='Цветная'), ('sendMessage', 'количество страниц')),
+        ('pages', message_update(chat_id, text=str(pages)), ('sendMessage', 'формат бумаги')),
+        ('format', message_update(chat_id, text='A4'), ('sendMessage', 'Выберите тип печати')),
+        ('sides', message_update(chat_id, text='Односторонняя'), ('sendMessage', 'прикрепите файл')),
+        ('file', message_update(chat_id, document=document), ('sendMessage', 'комментарий')),
+        ('comment', message_update(chat_id, text='Пропустить'), ('sendMessage', 'Ваш заказ')),
+        ('confirm', message_update(chat_id, text='✅ Подтвердить заказ'), ('sendInvoice', None)),
+    ]
+
+
+def payment_steps(chat_id, invoice):
+    payload = invoice['payload']
+    amount = int(json.loads(invoice['prices'])[0]['amount'])
+    query = {
+        'id': f"query{chat_id}",
+        'from': user(chat_id),
+        'currency': invoice.get('currency', 'RUB'),
+        'total_amount': amount,
+        'invoice_payload': payload,
+    }
+    payment = {
+        'currency': invoice.get('currency', 'RUB'),
+        'total_amount': amount,
+        'invoice_payload': payload,
+        'telegram_payment_charge_id': f"charge{chat_id}",
+        'provider_payment_charge_id': f"provider{chat_id}",
+        'order_info': {'email': 'bench@example.com', 'phone_number': '70000000000'},
+    }
+    return [
+        ('pre_checkout', {'pre_checkout_query': query}, ('answerPreCheckoutQuery', None)),
+        ('payment', message_update(chat_id, successful_payment=payment), ('sendMessage', 'Оплата прошла')),
+    ]
+
+
+class LoadRun:
+    def __init__(self, api, customers, concurrency, step_timeout, file_size):
+        self.api = api
+        self.customers = customers
+        self.concurrency = concurrency
+        self.step_timeout = step_timeout
+        self.file_size = file_size
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self._lock = threading.Lock()
+
+    def _step(self, chat_id, name, update, expect):
+        method, text = expect
+        started = time.monotonic()
+        self.api.push_update(update)
+        try:
+            params = self.api.wait_for(chat_id, method, text, timeout=self.step_timeout)
+        except TimeoutError:
+            with self._lock:
+                self.errors[name] += 1
+            return None
+        with self._lock:
+            self.latencies[name].append(time.monotonic() - started)
+        return params
+
+    def customer(self, chat_id):
+        try:
+            params = None
+            for name, update, expect in order_steps(chat_id, self.file_size):
+                params = self._step(chat_id, name, update, expect)
+                if params is None:
+                    return False
+            for name, update, expect in payment_steps(chat_id, params):
+                reply = self._step(chat_id, name, update, expect)
+                if reply is None:
+                    return False
+                if name == 'pre_checkout' and reply.get('ok') != 'True':
+                    with self._lock:
+                        self.errors['pre_checkout_rejected'] += 1
+                    return False
+            with self._lock:
+                self.completed += 1
+            return True
+        finally:
+            self.api.forget(chat_id)
+
+    def run(self):
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='Customer') as pool:
+            list(pool.map(self.customer, range(FIRST_CHAT_ID, FIRST_CHAT_ID + self.customers)))
+        return time.monotonic() - started
+
+    def report(self, elapsed):
+        steps = sum(len(samples) for samples in self.latencies.values())
+        failed_steps = sum(self.errors.values())
+        return {
+            'customers': self.customers,
+            'concurrency': self.concurrency,
+            'elapsed_s': round(elapsed, 3),
+            'completed': self.completed,
+            'failed': self.customers - self.completed,
+            'orders_per_s': round(self.completed / elapsed, 2) if elapsed else None,
+            'steps_per_s': round(steps / elapsed, 2) if elapsed else None,
+            'step_error_rate': round(failed_steps / (steps + failed_steps), 4) if steps + failed_steps else 0,
+            'steps': {name: summarize(samples) for name, samples in self.latencies.items()},
+            'errors': dict(self.errors),
+            'api_calls': dict(self.api.calls),
+            'api_injected_errors': {str(code): count for code, count in self.api.injected.items()},
+            'api_connections': self.api.connections,
+        }
+
+
+def print_steps(steps, errors):
+    print(f"{'шаг':<14}{'n':>8}{'p50, мс':>12}{'p90, мс':>12}{'p99, мс':>12}{'max, мс':>12}{'ошибок':>9}")
+    for name, summary in steps.items():
+        print(f"{name:<14}{summary['count']:>8}{summary['p50']:>12}{summary['p90']:>12}"
+              f"{summary['p99']:>12}{summary['max']:>12}{errors.get(name, 0):>9}")
+    for name, count in errors.items():
+        if name not in steps:
+            print(f"{name:<14}{'':>8}{'':>12}{'':>12}{'':>12}{'':>12}{count:>9}")
+
+
+def print_counters(report):
+    if report['api_injected_errors']:
+        print(f"\nВнесённые ошибки API: {report['api_injected_errors']}")
+    if 'api_connections' in report:
+        print(f"\nСоединений с API: {report['api_connections']}")
+    for name in ('executor', 'outbound', 'outbox', 'transport', 'resilience'):
+        if name in report:
+            print(f"{name}: {report[name]}")
+
+
+def print_report(report):
+    print(f"Клиентов: {report['customers']}, одновременно: {report['concurrency']}, "
+          f"время: {report['elapsed_s']} с")
+    print(f"Оплачено заказов: {report['completed']}, не дошли до оплаты: {report['failed']}")
+    print(f"Пропускная способность: {report['orders_per_s']} заказов/с, {report['steps_per_s']} шагов/с")
+    print(f"Доля шагов без ответа: {report['step_error_rate']:.2%}")
+    print()
+    print_steps(report['steps'], report['errors'])
+    print_counters(report)
+
+
+def add_bot_arguments(parser):
+    # Параметры локального API и бота, общие для bench.load и bench.replay
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа API, с")
+    parser.add_argument('--jitter', type=float, default=0.0, help="разброс задержки API, с")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument('--file-size', type=int, default=64 * 1024)
+    parser.add_argument('--step-timeout', type=float, default=30.0)
+    parser.add_argument('--no-chat-limit', action='store_true',
+                        help="снять лимит 1 сообщение/с на чат в исходящей очереди")
+    parser.add_argument('--global-rate', type=float, default=None,
+                        help="лимит исходящих сообщений в секунду на бота (по умолчанию из config)")
+    parser.add_argument('--lazy-updates', action='store_true',
+                        help="разбирать обновления через lazy_types.py (как LAZY_UPDATES = True)")
+    parser.add_argument('--no-pooled-transport', action='store_true',
+                        help="ходить в API через сессии requests telebot (как HTTP_POOLED_TRANSPORT = False)")
+    parser.add_argument('--no-resilience', action='store_true',
+                        help="без повторов и предохранителей resilience.py")
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--json', dest='json_path', default=None, help="сохранить отчёт в JSON")
+
+
+def import_newmain(workdir=None):
+    # newmain.py импортируется во временной папке: bot.log, загрузки и журнал
+    # платежей не попадают в рабочую копию. Возвращает (папка, модуль)
+    workdir = workdir or tempfile.mkdtemp(prefix='bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('TELEGRAM_TOKEN', '123456:bench')
+    import newmain
+    return workdir, newmain
+
+
+def start_bot(args):
+    # Поднимает локальный API и запускает newmain.py в папке args.workdir.
+    # Возвращает (api, модуль newmain); остановка - newmain.bot.stop_polling()
+    latency = (max(0.0, args.latency - args.jitter), args.latency + args.jitter) if args.jitter else args.latency
+    api = FakeBotApi(latency=latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+                     file_size=args.file_size, seed=args.seed).start()
+    api.install()
+
+    args.workdir, newmain = import_newmain(args.workdir)
+    from outbound import TokenBucket
+
+    if args.no_chat_limit:
+        newmain.outbound.chat_rate = newmain.outbound.chat_burst = 10 ** 6
+    if args.global_rate:
+        newmain.outbound._global = TokenBucket(args.global_rate, args.global_rate)
+    if args.lazy_updates:
+        from lazy_types import use_lazy_updates
+        use_lazy_updates(newmain.bot)
+    if args.no_pooled_transport and newmain.transport is not None:
+        newmain.transport.uninstall()
+        newmain.intake.transport = None
+    if args.no_resilience:
+        newmain.resilience.uninstall()
+    poller = threading.Thread(
+        target=newmain.bot.infinity_polling,
+        kwargs={'timeout': 10, 'long_polling_timeout': 1},
+        name='BenchPolling',
+        daemon=True
+    )
+    poller.start()
+    return api, newmain
+
+
+def absolute_paths(args, *names):
+    # Бот работает во временной папке: пути к отчётам считаем от папки запуска
+    for name in names:
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон заказа через локальный Bot API")
+    parser.add_argument('--customers', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    add_bot_arguments(parser)
+    args = parser.parse_args(argv)
+    absolute_paths(args, 'json_path')
+
+    api, newmain = start_bot(args)
+    load = LoadRun(api, args.customers, args.concurrency, args.step_timeout, args.file_size)
+    elapsed = load.run()
+    report = load.report(elapsed)
+    report['executor'] = newmain.executor.stats()
+    report['outbound'] = newmain.outbound.stats()
+    report['outbox'] = newmain.outbox.stats()
+    report['resilience'] = newmain.resilience.stats()
+    if newmain.transport is not None and not args.no_pooled_transport:
+        report['transport'] = newmain.transport.stats()
+    report['workdir'] = args.workdir
+
+    newmain.bot.stop_polling()
+    print_report(report)
+    if args.json_path:
+        save_report(report, args.json_path)
+    return report
+
+
+if __name__ == '__main__':
+    main()
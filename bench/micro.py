@@ -0,0 +1,226 @@
+"""Микробенчмарки горячих путей newmain.py.
+
+Каждый замер повторяется --repeat раз; число вызовов в повторе подбирается так,
+чтобы повтор шёл не меньше --min-time секунд. В отчёте - время одной операции
+в наносекундах (p50, среднее, разброс) и операций в секунду.
+
+    python -m bench.micro --save-baseline bench-micro.json
+    python -m bench.micro --baseline bench-micro.json --filter dispatch
+
+С --baseline медианы сравниваются с сохранённым отчётом; при росте больше
+--tolerance код выхода 1.
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+import timeit
+
+from bench.load import absolute_paths, import_newmain, message_update, payment_steps, save_report
+from bench.stats import compare, print_comparison, summarize
+
+CHAT_ID = 500000001
+
+ORDER = {
+    'type': 'цветная',
+    'page_count': 45,
+    'format': 'A4',
+    'side': 'двухсторонняя',
+    'file': {'file_name': 'order.pdf', 'file_id': 'file', 'path': 'uploads/order.pdf', 'kind': 'pdf', 'pages': 45},
+    'comment': 'нужно все сделать красиво',
+}
+
+
+# ===== ЗАМЕРЫ =====
+def dispatch_cases(newmain):
+    # Поиск обработчика так же, как в telebot: фильтры обработчиков по порядку
+    # до первого совпадения (сюда входит и чтение шага заказа из хранилища)
+    from telebot import types
+    bot = newmain.bot
+    newmain.orders.create(CHAT_ID, dict(ORDER, state=newmain.OrderStates.summary.name))
+
+    def dispatch(message):
+        for handler in bot.message_handlers:
+            if bot._test_message_handler(handler, message):
+                return handler
+        return None
+
+    texts = ['/start'] + list(newmain.buttons.routes) + ['нужно все сделать красиво']
+    for text in texts:
+        message = types.Message.de_json(message_update(CHAT_ID, text=text)['message'])
+        yield f"dispatch:{text}", (lambda message=message: dispatch(message)), 1
+
+
+def keyboard_cases(newmain):
+    from telebot import types
+
+    def build():
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add('A5', 'A4', 'A3', 'A2')
+        return markup
+
+    markup = build()
+    yield 'keyboard:build', build, 1
+    yield 'keyboard:serialize', markup.to_json, 1
+    yield 'keyboard:build+serialize', lambda: build().to_json(), 1
+
+
+def pricing_cases(newmain):
+    from order_model import Order
+    price_table = newmain.price_table
+    order = Order.from_dict(ORDER)
+    total = price_table.quote(order)
+    yield 'pricing:quote', lambda: price_table.quote(order), 1
+    yield 'pricing:format_rub', lambda: newmain.format_rub(total), 1
+
+
+def order_cases(newmain, threads=8, ops=2000):
+    orders = newmain.orders
+
+    def contended(chat_ids):
+        # threads потоков по ops изменений; время делится на все операции
+        barrier = threading.Barrier(len(chat_ids))
+
+        def worker(chat_id):
+            barrier.wait()
+            for page_count in range(ops):
+                orders.update(chat_id, page_count=page_count)
+
+        workers = [threading.Thread(target=worker, args=(chat_id,)) for chat_id in chat_ids]
+        for worker_thread in workers:
+            worker_thread.start()
+        for worker_thread in workers:
+            worker_thread.join()
+
+    own_chats = [CHAT_ID + 1 + i for i in range(threads)]
+    for chat_id in own_chats:
+        orders.create(chat_id, ORDER)
+    yield 'orders:update', lambda: orders.update(CHAT_ID, page_count=10), 1
+    yield 'orders:get', lambda: orders.get(CHAT_ID), 1
+    yield f"orders:update x{threads} chats", lambda: contended(own_chats), threads * ops
+    yield f"orders:update x{threads} one chat", lambda: contended([CHAT_ID] * threads), threads * ops
+
+
+def logging_cases(newmain):
+    from telebot import types
+    from bot_logging import BatchingFileHandler, JsonLinesFormatter
+    message = types.Message.de_json(message_update(CHAT_ID, text='10')['message'])
+    message.received_at = time.monotonic()
+    # Путь обработчика: поля пользователя, запись в очередь (файл пишет другой поток)
+    yield 'log:user_action', lambda: newmain.log_user_action(message, "Указал количество страниц: 10"), 1
+
+    # Путь потока записи: JSON и строка в файл
+    handler = BatchingFileHandler('bench-micro.log', max_bytes=0, rotate_interval=0)
+    handler.setFormatter(JsonLinesFormatter())
+    record = logging.LogRecord(newmain.logger.name, logging.INFO, __file__, 0,
+                               "Указал количество страниц: 10", None, None)
+    for field, value in newmain.user_fields(message, action="Указал количество страниц: 10").items():
+        setattr(record, field, value)
+    yield 'log:format+write', lambda: handler.emit(record), 1
+
+
+def update_payloads():
+    # Обновления, которые приходят за время заказа: текст, файл, pre-checkout, оплата
+    invoice = {'payload': 'order_0123456789ab', 'currency': 'RUB',
+               'prices': json.dumps([{'label': 'Печать', 'amount': 135000}])}
+    pre_checkout, payment = (update for _, update, _ in payment_steps(CHAT_ID, invoice))
+    payloads = {
+        'text': message_update(CHAT_ID, text='🖨 Начать заказ'),
+        'document': message_update(CHAT_ID, document={
+            'file_id': 'BQACAgIAAxkBAAIBZ2abc', 'file_unique_id': 'AgADabc',
+            'file_name': 'TTK.docx', 'file_size': 183042,
+            'mime_type': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        }),
+        'pre_checkout_query': pre_checkout,
+        'successful_payment': payment,
+    }
+    return {name: dict(payload, update_id=1) for name, payload in payloads.items()}
+
+
+def update_cases(newmain):
+    from telebot import types
+    from lazy_types import LazyUpdate
+    for name, payload in update_payloads().items():
+        # telebot получает ответ getUpdates уже разобранным JSON: de_json от словаря
+        yield f"de_json:{name}", lambda payload=payload: types.Update.de_json(payload), 1
+        yield f"lazy:{name}", lambda payload=payload: LazyUpdate.de_json(payload), 1
+
+
+SUITES = (dispatch_cases, keyboard_cases, pricing_cases, order_cases, logging_cases, update_cases)
+
+
+def measure(func, ops=1, repeat=7, min_time=0.2):
+    # Время одной операции в секундах по каждому повтору
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / 10:
+            break
+        number *= 10
+    number = max(1, int(number * min_time / elapsed))
+    return [elapsed / (number * ops) for elapsed in timer.repeat(repeat, number)], number
+
+
+def run(newmain, name_filter=None, repeat=7, min_time=0.2):
+    cases = {}
+    for suite in SUITES:
+        for name, func, ops in suite(newmain):
+            if name_filter and name_filter not in name:
+                continue
+            samples, number = measure(func, ops, repeat, min_time)
+            summary = summarize(samples, scale=1e9)
+            summary['number'] = number * ops
+            summary['ops_per_s'] = round(1e9 / summary['p50']) if summary['p50'] else None
+            cases[name] = summary
+            print(f"{name:<36}{summary['p50']:>14}{summary['mean']:>14}{summary['stdev']:>12}"
+                  f"{summary['ops_per_s']:>14}", flush=True)
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих путей бота")
+    parser.add_argument('--filter', default=None, help="только замеры, в имени которых есть подстрока")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2, help="минимальная длительность повтора, с")
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--json', dest='json_path', default=None, help="сохранить отчёт в JSON")
+    parser.add_argument('--baseline', default=None, help="отчёт, с которым сравнить медианы")
+    parser.add_argument('--save-baseline', default=None, help="сохранить отчёт как базовый")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--min-delta-ns', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    absolute_paths(args, 'json_path', 'baseline', 'save_baseline')
+
+    workdir, newmain = import_newmain(args.workdir)
+    print(f"{'замер':<36}{'p50, нс':>14}{'среднее, нс':>14}{'разброс':>12}{'опер./с':>14}")
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'ns/op',
+        'repeat': args.repeat,
+        'cases': run(newmain, args.filter, args.repeat, args.min_time),
+        # Записи, не поместившиеся в очередь логов: log:user_action мерил отбрасывание, а не запись
+        'log_dropped': sum(getattr(handler, 'dropped', 0) for handler in logging.getLogger().handlers),
+        'workdir': workdir,
+    }
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            rows = compare(report['cases'], json.load(f).get('cases', {}), args.tolerance, args.min_delta_ns,
+                           metrics=('p50',))
+        print_comparison(rows, unit='нс', width=36)
+        report['regressions'] = [{'case': name, 'metric': metric, 'baseline': old, 'current': new}
+                                 for name, metric, old, new, regressed in rows if regressed]
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+    if args.json_path:
+        save_report(report, args.json_path)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main().get('regressions') else 0)
@@ -0,0 +1,168 @@
+"""Память на черновики заказов: прежние словари против order_model.Order.
+
+В хранилище в памяти кладётся --drafts черновиков (по умолчанию 100 000) так же,
+как их собирают обработчики newmain.py, и tracemalloc считает, сколько байт
+занимает один черновик вместе с записью хранилища. Прежний вариант повторяет
+старый код: словарь со строками из message.text и вложенный словарь файла.
+Для SQLite сравнивается размер строки: JSON против Order.to_bytes.
+
+    python -m bench.orders --drafts 100000 --json bench-orders.json
+"""
+import argparse
+import gc
+import json
+import platform
+import threading
+import time
+import tracemalloc
+
+from bench.load import absolute_paths, save_report
+from order_model import Order, OrderFile, PaperFormat, PrintType, Side
+from order_store import MemoryOrderStore
+
+FIRST_CHAT_ID = 10 ** 9
+
+
+# Черновики на разных шагах: брошенный в самом начале и дошедший до итога
+def legacy_draft(i, stage):
+    # Как собирал заказ прежний код: тип - строковая константа, формат и стороны -
+    # строки из сообщения (у каждого заказа свои), файл - вложенный словарь
+    order = {'state': 'color', 'type': 'цветная'}
+    if stage == 'summary':
+        order.update(
+            state='summary',
+            page_count=10 + i % 500,
+            format=''.join(['A', '4']),
+            side='Двухсторонняя'.lower(),
+            file={
+                'file_name': f"document_{i}.pdf",
+                'file_id': f"BQACAgIAAxkBAAI{i:012d}",
+                'path': f"uploads/{i:012d}_document_{i}.pdf",
+                'kind': 'pdf',
+                'pages': 10 + i % 500,
+            },
+            comment=f"Заказ {i}: нужно все сделать красиво",
+            total=3000 * (10 + i % 500),
+        )
+    return order
+
+
+def typed_draft(i, stage):
+    order = Order(state='color', type=PrintType.COLOR)
+    if stage == 'summary':
+        order.update(
+            state='summary',
+            page_count=10 + i % 500,
+            format=PaperFormat.parse(''.join(['A', '4'])),
+            side=Side.parse('Двухсторонняя'),
+            file=OrderFile(f"document_{i}.pdf", f"BQACAgIAAxkBAAI{i:012d}",
+                           f"uploads/{i:012d}_document_{i}.pdf", 'pdf', 10 + i % 500),
+            comment=f"Заказ {i}: нужно все сделать красиво",
+            total=3000 * (10 + i % 500),
+        )
+    return order
+
+
+class LegacyStore:
+    # Прежнее хранилище в памяти: шарды словарей, запись - (время, словарь заказа)
+    def __init__(self, shards=16):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def create(self, chat_id, order):
+        data, lock = self._shards[hash(chat_id) % len(self._shards)]
+        with lock:
+            data[chat_id] = (time.time(), dict(order))
+
+
+def store_memory(store, build, drafts, stage):
+    # Байт на черновик: черновики строятся по одному и сразу кладутся в хранилище
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for i in range(drafts):
+            store.create(FIRST_CHAT_ID + i, build(i, stage))
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return {
+        'bytes_per_draft': round((current - before) / drafts, 1),
+        'total_mb': round((current - before) / 2 ** 20, 1),
+        'create_us': round(elapsed / drafts * 1e6, 3),
+    }
+
+
+def row_size(stage, samples=1000):
+    # Средний размер строки SQLite и время кодирования/разбора одного заказа
+    orders = [typed_draft(i, stage) for i in range(samples)]
+    result = {}
+    for name, encode, decode in (
+            ('json', lambda order: json.dumps(order.to_dict(), ensure_ascii=False),
+             lambda data: Order.from_dict(json.loads(data))),
+            ('binary', Order.to_bytes, Order.from_bytes)):
+        started = time.perf_counter()
+        encoded = [encode(order) for order in orders]
+        encoded_at = time.perf_counter()
+        decoded = [decode(data) for data in encoded]
+        decoded_at = time.perf_counter()
+        assert decoded == orders
+        size = sum(len(data.encode('utf-8') if isinstance(data, str) else data) for data in encoded)
+        result[name] = {
+            'bytes_per_row': round(size / samples, 1),
+            'encode_us': round((encoded_at - started) / samples * 1e6, 3),
+            'decode_us': round((decoded_at - encoded_at) / samples * 1e6, 3),
+        }
+    return result
+
+
+def run(drafts):
+    report = {}
+    for stage in ('color', 'summary'):
+        report[stage] = {
+            'dict': store_memory(LegacyStore(), legacy_draft, drafts, stage),
+            'order': store_memory(MemoryOrderStore(), typed_draft, drafts, stage),
+            'sqlite_row': row_size(stage),
+        }
+        memory = report[stage]
+        memory['order_vs_dict'] = round(memory['order']['bytes_per_draft'] / memory['dict']['bytes_per_draft'], 2)
+    return report
+
+
+def print_report(report, drafts):
+    print(f"Черновиков: {drafts}")
+    print(f"{'шаг':<10}{'вариант':<10}{'Б/черновик':>12}{'всего, МБ':>12}{'create, мкс':>13}")
+    for stage, memory in report.items():
+        for name in ('dict', 'order'):
+            row = memory[name]
+            print(f"{stage:<10}{name:<10}{row['bytes_per_draft']:>12}{row['total_mb']:>12}{row['create_us']:>13}")
+        print(f"{'':<10}{'order/dict':<10}{memory['order_vs_dict']:>12}")
+    print(f"\n{'шаг':<10}{'SQLite':<10}{'Б/строку':>12}{'кодир., мкс':>13}{'разбор, мкс':>13}")
+    for stage, memory in report.items():
+        for name, row in memory['sqlite_row'].items():
+            print(f"{stage:<10}{name:<10}{row['bytes_per_row']:>12}{row['encode_us']:>13}{row['decode_us']:>13}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Память на черновики заказов: словари против Order")
+    parser.add_argument('--drafts', type=int, default=100000)
+    parser.add_argument('--json', dest='json_path', default=None, help="сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+    absolute_paths(args, 'json_path')
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'drafts': args.drafts,
+        'stages': run(args.drafts),
+    }
+    print_report(report['stages'], args.drafts)
+    if args.json_path:
+        save_report(report, args.json_path)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""Воспроизведение реальных сессий клиентов из bot.log против локального Bot API.
+
+Журнал разбирается на сессии по чатам: каждое действие клиента ("Начал оформление
+заказа", "Указал количество страниц: 45", "Загрузил файл: ...") превращается
+в сообщение, которое клиент тогда отправил боту. Понимает:
+  - старый текстовый bot.log ("... - UserID:1 ChatID:1 Username:@name - действие");
+  - JSON lines из bot_logging (поле action);
+  - журнал сырых обновлений: строки {"time": unix-время, "update": {...}};
+  - уже разобранные сценарии (--scripts), по сессии в строке.
+
+Сессии проигрываются с исходными паузами (--speed 1), в N раз быстрее
+(--speed N, --speed inf - без пауз) или наложенными друг на друга для пиковой
+нагрузки (--overlay: все сессии стартуют в пределах --spread секунд,
+--copies N - каждая сессия N раз). Следующий шаг сессии уходит не раньше ответа
+бота на предыдущий. Задержка шага - от отправки обновления до ответа бота.
+
+    python -m bench.replay bot.log --speed 20 --save-baseline baseline.json
+    python -m bench.replay bot.log --overlay --copies 50 --spread 10 --baseline baseline.json
+
+С --baseline перцентили каждого шага сравниваются с сохранённым отчётом;
+при росте больше --tolerance код выхода 1.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from bench.load import (FIRST_CHAT_ID, absolute_paths, add_bot_arguments, message_update, payment_steps, print_counters,
+                        print_steps, save_report, start_bot)
+from bench.stats import compare, print_comparison, summarize
+
+TEXT_LINE = re.compile(
+    r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \S+ - \w+ - '
+    r'UserID:(?P<user_id>\d+) ChatID:(?P<chat_id>-?\d+) Username:@\S* - (?P<action>.*?)\s*$'
+)
+# Самые первые версии бота писали /start так
+OLD_START_LINE = re.compile(
+    r'^(?P<time>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \S+ - \w+ - '
+    r'Пользователь (?P<chat_id>\d+) запустил бот'
+)
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S,%f'
+
+# Кнопки и команды -> шаг сценария
+BUTTONS = {
+    '/start': 'start',
+    '🖨 Начать заказ': 'order',
+    'Черно-белая': 'color',
+    'Цветная': 'color',
+    'Односторонняя': 'sides',
+    'Двухсторонняя': 'sides',
+    'A5': 'format',
+    'A4': 'format',
+    'A3': 'format',
+    'A2': 'format',
+    'Пропустить': 'comment',
+    '✅ Подтвердить заказ': 'confirm',
+    '❌ Отменить': 'cancel',
+    '✏️ Изменить': 'edit',
+}
+
+PRINT_TYPES = {
+    'чб': 'Черно-белая',
+    'цветная': 'Цветная',
+    'односторонняя': 'Односторонняя',
+    'двухсторонняя': 'Двухсторонняя',
+}
+
+# Запись в журнале -> текст, который клиент отправил боту
+# (None - текст берётся из самой записи после двоеточия)
+ACTIONS = (
+    ('Пользователь начал работу с ботом', '/start'),
+    ('Начал оформление заказа', '🖨 Начать заказ'),
+    ('Выбрал тип печати:', None),
+    ('Указал количество страниц:', None),
+    ('Выбрал формат бумаги:', None),
+    ('Загрузил файл:', None),
+    ('Добавил комментарий:', None),
+    ('Пропустил добавление комментария', 'Пропустить'),
+    ('Выставлен счёт', '✅ Подтвердить заказ'),
+    ('Отменил заказ', '❌ Отменить'),
+    ('Редактирование заказа', '✏️ Изменить'),
+)
+
+# Отмена и редактирование сами вызывают /start и начало заказа, и те пишут
+# в журнал раньше: такую запись надо убрать, клиент её не отправлял
+NESTED = {'cancel': 'start', 'edit': 'order'}
+
+# Какой ответ бота завершает шаг
+EXPECT = {
+    'start': ('sendMessage', 'Добро пожаловать'),
+    'order': ('sendMessage', 'Выберите тип печати'),
+    'edit': ('sendMessage', 'Выберите тип печати'),
+    'color': ('sendMessage', 'количество страниц'),
+    'pages': ('sendMessage', ('формат бумаги', 'корректное число')),
+    'format': ('sendMessage', ('Выберите тип печати', 'прикрепите файл')),
+    'sides': ('sendMessage', 'прикрепите файл'),
+    'file': ('sendMessage', ('комментарий', 'Не удалось загрузить', 'Файл слишком большой')),
+    'comment': ('sendMessage', 'Ваш заказ'),
+    'confirm': ('sendInvoice', None),
+    'cancel': ('sendMessage', 'Добро пожаловать'),
+}
+
+# С этих шагов сессию можно начать с пустого состояния бота
+SESSION_STARTS = ('start', 'order', 'cancel', 'edit')
+
+
+# ===== РАЗБОР ЖУРНАЛОВ =====
+def text_step(text):
+    if text in BUTTONS:
+        return BUTTONS[text], text
+    if text.strip().isdigit():
+        return 'pages', text.strip()
+    return 'comment', text
+
+
+def action_step(action):
+    # Запись журнала -> (шаг, текст) или None, если это не действие клиента
+    if action.startswith('Успешная оплата заказа'):
+        return 'pay', None
+    for prefix, text in ACTIONS:
+        if not action.startswith(prefix):
+            continue
+        value = action[len(prefix):].strip()
+        if prefix == 'Загрузил файл:':
+            return 'file', value
+        if prefix == 'Добавил комментарий:':
+            return 'comment', value
+        if prefix == 'Выбрал тип печати:':
+            text = PRINT_TYPES.get(value.lower())
+            if text is None:
+                return None
+        return text_step(text if text is not None else value)
+    return None
+
+
+def update_step(update):
+    # Сырое обновление Telegram -> (шаг, текст)
+    message = update.get('message') or {}
+    if 'successful_payment' in message:
+        return 'pay', None
+    if 'document' in message:
+        return 'file', message['document'].get('file_name', 'file')
+    if 'text' in message:
+        return text_step(message['text'])
+    return None
+
+
+def parse_time(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.strptime(value, TIME_FORMAT).timestamp()
+
+
+def parse_line(line):
+    # Строка журнала -> ('event', время, chat_id, шаг, текст), ('session', сценарий) или None
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        if 'steps' in entry:
+            return 'session', entry
+        if 'update' in entry:
+            update = entry['update']
+            message = update.get('message') or {}
+            chat_id = (message.get('chat') or {}).get('id')
+            step = update_step(update)
+            if chat_id is None or step is None:
+                return None
+            return ('event', parse_time(entry['time']), chat_id) + step
+        if entry.get('action') and entry.get('chat_id') is not None:
+            step = action_step(entry['action'])
+            if step is None:
+                return None
+            return ('event', parse_time(entry['time']), entry['chat_id']) + step
+        return None
+    match = TEXT_LINE.match(line)
+    if match:
+        step = action_step(match['action'])
+        if step is None:
+            return None
+        return ('event', parse_time(match['time']), int(match['chat_id'])) + step
+    match = OLD_START_LINE.match(line)
+    if match:
+        return 'event', parse_time(match['time']), int(match['chat_id']), 'start', '/start'
+    return None
+
+
+def split_sessions(chat_id, events, session_gap):
+    # События одного чата по времени -> сессии. Новая сессия - с /start
+    # или после паузы дольше session_gap секунд
+    events = [event for event, following in zip(events, events[1:] + [None])
+              if not (following and NESTED.get(following[1]) == event[1] and following[0] - event[0] < 1)]
+    sessions = []
+    steps = None
+    started = last = None
+    for when, kind, text in events:
+        if steps is None or kind == 'start' or when - last > session_gap:
+            if steps:
+                sessions.append({'chat_id': chat_id, 'started': started, 'steps': steps})
+            steps = []
+            started = when
+        # В старом журнале подтверждение заказа не писалось - восстанавливаем его перед оплатой
+        if kind == 'pay' and (not steps or steps[-1][1] != 'confirm'):
+            steps.append([round(when - started, 3), 'confirm', '✅ Подтвердить заказ'])
+        steps.append([round(when - started, 3), kind, text])
+        last = when
+    if steps:
+        sessions.append({'chat_id': chat_id, 'started': started, 'steps': steps})
+    return sessions
+
+
+def load_sessions(paths, session_gap=30 * 60):
+    events = defaultdict(list)
+    sessions = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for line in f:
+                parsed = parse_line(line)
+                if parsed is None:
+                    continue
+                if parsed[0] == 'session':
+                    sessions.append(parsed[1])
+                else:
+                    _, when, chat_id, kind, text = parsed
+                    events[chat_id].append((when, kind, text))
+    for chat_id, chat_events in events.items():
+        chat_events.sort(key=lambda event: event[0])
+        sessions.extend(split_sessions(chat_id, chat_events, session_gap))
+    sessions.sort(key=lambda session: session['started'])
+    return sessions
+
+
+# ===== ВОСПРОИЗВЕДЕНИЕ =====
+class Replay:
+    def __init__(self, api, sessions, speed=1.0, copies=1, overlay=False, spread=0.0,
+                 step_timeout=10.0, file_size=64 * 1024, seed=None):
+        self.api = api
+        self.speed = speed
+        self.step_timeout = step_timeout
+        self.file_size = file_size
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self.plan = self._plan(sessions, copies, overlay, spread, random.Random(seed))
+
+    def _plan(self, sessions, copies, overlay, spread, rng):
+        # (через сколько секунд от начала прогона, новый chat_id, сценарий)
+        plan = []
+        playable = [session for session in sessions if session['steps'][0][1] in SESSION_STARTS]
+        self.skipped = (len(sessions) - len(playable)) * copies
+        if not playable:
+            return plan
+        first = playable[0]['started']
+        chat_id = FIRST_CHAT_ID
+        for copy in range(copies):
+            for session in playable:
+                if overlay:
+                    offset = rng.uniform(0, spread) if spread else 0.0
+                else:
+                    offset = self._scaled(session['started'] - first)
+                plan.append((offset, chat_id, session))
+                chat_id += 1
+        plan.sort(key=lambda item: item[0])
+        return plan
+
+    def _scaled(self, seconds):
+        return seconds / self.speed if self.speed else 0.0
+
+    def _wait(self, chat_id, name, started, expect):
+        method, text = expect
+        try:
+            params = self.api.wait_for(chat_id, method, text, timeout=self.step_timeout)
+        except TimeoutError:
+            with self._lock:
+                self.errors[name] += 1
+            return None
+        with self._lock:
+            self.latencies[name].append(time.monotonic() - started)
+        return params
+
+    def _update(self, chat_id, index, kind, text):
+        if kind == 'file':
+            return message_update(chat_id, document={
+                'file_id': f"replay{chat_id}_{index}",
+                'file_unique_id': f"replay{chat_id}_{index}",
+                'file_name': text or 'file',
+                'file_size': self.file_size,
+            })
+        return message_update(chat_id, text=text)
+
+    def session(self, chat_id, script, began):
+        invoice = None
+        try:
+            for index, (offset, kind, text) in enumerate(script['steps']):
+                # Пауза клиента, но не раньше ответа на предыдущий шаг
+                delay = began + self._scaled(offset) - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                if kind == 'pay':
+                    if invoice is None:
+                        with self._lock:
+                            self.errors['pay_without_invoice'] += 1
+                        return False
+                    for name, update, expect in payment_steps(chat_id, invoice):
+                        started = time.monotonic()
+                        self.api.push_update(update)
+                        if self._wait(chat_id, name, started, expect) is None:
+                            return False
+                    continue
+                started = time.monotonic()
+                self.api.push_update(self._update(chat_id, index, kind, text))
+                params = self._wait(chat_id, kind, started, EXPECT[kind])
+                if params is None:
+                    return False
+                if kind == 'confirm':
+                    invoice = params
+            with self._lock:
+                self.completed += 1
+            return True
+        finally:
+            self.api.forget(chat_id)
+
+    def run(self):
+        began = time.monotonic()
+        threads = []
+        for offset, chat_id, script in self.plan:
+            delay = began + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            thread = threading.Thread(target=self.session, args=(chat_id, script, time.monotonic()),
+                                      name=f"Replay-{chat_id}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        return time.monotonic() - began
+
+    def report(self, elapsed):
+        steps = sum(len(samples) for samples in self.latencies.values())
+        failed_steps = sum(self.errors.values())
+        return {
+            'sessions': len(self.plan),
+            'skipped_sessions': self.skipped,
+            'completed': self.completed,
+            'failed': len(self.plan) - self.completed,
+            'elapsed_s': round(elapsed, 3),
+            'steps_per_s': round(steps / elapsed, 2) if elapsed else None,
+            'step_error_rate': round(failed_steps / (steps + failed_steps), 4) if steps + failed_steps else 0,
+            'steps': {name: summarize(samples) for name, samples in self.latencies.items()},
+            'errors': dict(self.errors),
+            'api_calls': dict(self.api.calls),
+            'api_injected_errors': {str(code): count for code, count in self.api.injected.items()},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение сессий из bot.log через локальный Bot API")
+    parser.add_argument('logs', nargs='+', help="bot.log, JSON lines, журнал обновлений или сценарии")
+    parser.add_argument('--speed', type=float, default=1.0, help="во сколько раз ускорить паузы (inf - без пауз)")
+    parser.add_argument('--copies', type=int, default=1, help="сколько раз проиграть каждую сессию")
+    parser.add_argument('--overlay', action='store_true', help="наложить сессии: старт в пределах --spread")
+    parser.add_argument('--spread', type=float, default=0.0)
+    parser.add_argument('--session-gap', type=float, default=30 * 60,
+                        help="пауза, после которой действия чата считаются новой сессией, с")
+    parser.add_argument('--scripts', default=None, help="сохранить разобранные сценарии (JSON lines) и выйти")
+    parser.add_argument('--baseline', default=None, help="отчёт, с которым сравнить перцентили")
+    parser.add_argument('--save-baseline', default=None, help="сохранить отчёт как базовый")
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=5.0)
+    add_bot_arguments(parser)
+    parser.set_defaults(step_timeout=10.0)
+    args = parser.parse_args(argv)
+    absolute_paths(args, 'json_path', 'baseline', 'save_baseline')
+
+    sessions = load_sessions(args.logs, args.session_gap)
+    if args.scripts:
+        with open(args.scripts, 'w', encoding='utf-8') as f:
+            for session in sessions:
+                f.write(json.dumps(session, ensure_ascii=False) + "\n")
+        print(f"Сценариев: {len(sessions)}, шагов: {sum(len(s['steps']) for s in sessions)}")
+        return {'sessions': len(sessions)}
+
+    api, newmain = start_bot(args)
+    replay = Replay(api, sessions, speed=args.speed, copies=args.copies, overlay=args.overlay,
+                    spread=args.spread, step_timeout=args.step_timeout, file_size=args.file_size, seed=args.seed)
+    elapsed = replay.run()
+    report = replay.report(elapsed)
+    report['mode'] = {'speed': args.speed, 'copies': args.copies, 'overlay': args.overlay, 'spread': args.spread}
+    report['executor'] = newmain.executor.stats()
+    report['outbound'] = newmain.outbound.stats()
+    report['workdir'] = args.workdir
+    newmain.bot.stop_polling()
+
+    print(f"Сессий: {report['sessions']} (пропущено без начала: {report['skipped_sessions']}), "
+          f"время: {report['elapsed_s']} с")
+    print(f"Прошли до конца: {report['completed']}, оборвались: {report['failed']}")
+    print(f"Доля шагов без ответа: {report['step_error_rate']:.2%}, {report['steps_per_s']} шагов/с")
+    print()
+    print_steps(report['steps'], report['errors'])
+    print_counters(report)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            rows = compare(report['steps'], json.load(f).get('steps', {}), args.tolerance, args.min_delta_ms)
+        print_comparison(rows)
+        report['regressions'] = [{'step': name, 'metric': metric, 'baseline': old, 'current': new}
+                                 for name, metric, old, new, regressed in rows if regressed]
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+    if args.json_path:
+        save_report(report, args.json_path)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main().get('regressions') else 0)
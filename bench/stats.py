@@ -0,0 +1,52 @@
+import math
+import statistics
+
+
+def percentile(ordered, q):
+    # ordered - отсортированный список, q от 0 до 100
+    if not ordered:
+        return None
+    k = (len(ordered) - 1) * q / 100
+    lo = math.floor(k)
+    hi = math.ceil(k)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def summarize(samples, scale=1000):
+    # Сводка по замерам в секундах; по умолчанию результат в миллисекундах
+    ordered = sorted(samples)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean': round(statistics.fmean(ordered) * scale, 3),
+        'stdev': round(statistics.pstdev(ordered) * scale, 3),
+        'min': round(ordered[0] * scale, 3),
+        'p50': round(percentile(ordered, 50) * scale, 3),
+        'p90': round(percentile(ordered, 90) * scale, 3),
+        'p99': round(percentile(ordered, 99) * scale, 3),
+        'max': round(ordered[-1] * scale, 3),
+    }
+
+
+def compare(current, baseline, tolerance=0.2, min_delta=5.0, metrics=('p50', 'p90', 'p99')):
+    # current, baseline - {имя: сводка summarize()}. Строки (имя, метрика, было, стало,
+    # регрессия ли). Регрессия - рост больше чем на tolerance и хотя бы на min_delta
+    # (в единицах сводки), иначе шум на быстрых замерах
+    rows = []
+    for name, summary in current.items():
+        base = baseline.get(name)
+        if not base or not base.get('count') or not summary.get('count'):
+            continue
+        for metric in metrics:
+            old, new = base[metric], summary[metric]
+            regressed = new > old * (1 + tolerance) and new - old >= min_delta
+            rows.append((name, metric, old, new, regressed))
+    return rows
+
+
+def print_comparison(rows, unit='мс', width=14):
+    print(f"\n{'замер':<{width}}{'метрика':>8}{'было, ' + unit:>14}{'стало, ' + unit:>14}{'изм.':>9}")
+    for name, metric, old, new, regressed in rows:
+        change = f"{(new - old) / old:+.0%}" if old else '-'
+        print(f"{name:<{width}}{metric:>8}{old:>14}{new:>14}{change:>9}" + ("  РЕГРЕССИЯ" if regressed else ""))
@@ -0,0 +1,175 @@
+"""Разбор обновлений: types.Update.de_json против ленивых обновлений lazy_types.py.
+
+Пачка из --batch обновлений (как ответ getUpdates) разбирается и проходит через
+process_new_updates отдельного бота telebot с теми же фильтрами, что в newmain.py:
+команды, content_types, middleware, pre-checkout. Обработчики читают поля, которые
+читает newmain.py: text, chat.id, from_user.id/username, document, successful_payment.
+
+В отчёте на одно обновление: время разбора, время разбора с обработкой,
+и память по tracemalloc - сколько занимает разобранная пачка и пик при разборе.
+
+    python -m bench.updates --save-baseline bench-updates.json
+    python -m bench.updates --baseline bench-updates.json
+
+С --baseline медианы времени сравниваются с сохранённым отчётом; при росте
+больше --tolerance код выхода 1.
+"""
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+
+from bench.load import absolute_paths, save_report
+from bench.micro import measure, update_payloads
+from bench.stats import compare, print_comparison, summarize
+
+
+def bench_bot():
+    # Бот без сети: только разбор обновлений и подбор обработчиков
+    import telebot
+    from telebot import apihelper
+    apihelper.ENABLE_MIDDLEWARE = True
+    bot = telebot.TeleBot('123456:bench', threaded=False)
+    seen = []
+
+    @bot.middleware_handler(update_types=['message'])
+    def mark_received(bot_instance, message):
+        message.received_at = 0
+
+    def read(message):
+        seen.append((message.chat.id, message.from_user.id, message.from_user.username, message.text))
+
+    @bot.message_handler(commands=['start'])
+    def start(message):
+        read(message)
+
+    @bot.message_handler(func=lambda message: message.text == '🖨 Начать заказ')
+    def start_order(message):
+        read(message)
+
+    @bot.message_handler(content_types=['document'])
+    def process_file(message):
+        read(message)
+        seen.append((message.document.file_id, message.document.file_name, message.document.file_size))
+
+    @bot.message_handler(content_types=['successful_payment'])
+    def successful_payment(message):
+        read(message)
+        payment = message.successful_payment
+        seen.append((payment.invoice_payload, payment.total_amount, payment.telegram_payment_charge_id))
+
+    @bot.pre_checkout_query_handler(func=lambda query: True)
+    def pre_checkout(query):
+        seen.append((query.id, query.from_user.id, query.invoice_payload, query.total_amount))
+
+    return bot, seen
+
+
+def batches(payloads, size):
+    # Пачка из size копий каждого вида обновления с разными update_id.
+    # Копии словарей - как после json.loads ответа getUpdates
+    return {name: [json.loads(json.dumps(dict(payload, update_id=i))) for i in range(size)]
+            for name, payload in payloads.items()}
+
+
+def memory(decode, batch):
+    # (байт на обновление, пока пачка жива; пик байт на обновление при разборе)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        decoded = decode(batch)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del decoded
+    return round((current - before) / len(batch)), round((peak - before) / len(batch))
+
+
+def run(batch_size=100, repeat=7, min_time=0.2):
+    from telebot import types
+    from lazy_types import LazyUpdate
+    bot, seen = bench_bot()
+    decoders = {'de_json': types.Update.de_json, 'lazy': LazyUpdate.de_json}
+    cases = {}
+    for name, batch in batches(update_payloads(), batch_size).items():
+        for kind, de_json in decoders.items():
+            def decode(batch, de_json=de_json):
+                return [de_json(raw) for raw in batch]
+
+            def process(batch, decode=decode):
+                bot.process_new_updates(decode(batch))
+                seen.clear()
+
+            for stage, func in (('decode', decode), ('process', process)):
+                case = f"{kind}:{name}:{stage}"
+                samples, number = measure(lambda func=func: func(batch), batch_size, repeat, min_time)
+                summary = summarize(samples, scale=1e9)
+                summary['number'] = number * batch_size
+                if stage == 'decode':
+                    summary['retained_bytes'], summary['peak_bytes'] = memory(decode, batch)
+                cases[case] = summary
+                print(f"{case:<42}{summary['p50']:>12}{summary['stdev']:>10}"
+                      f"{summary.get('retained_bytes', ''):>12}{summary.get('peak_bytes', ''):>12}", flush=True)
+    return cases
+
+
+def speedups(cases):
+    # Во сколько раз ленивый разбор быстрее и сколько памяти занимает от обычного
+    result = {}
+    for case, summary in cases.items():
+        kind, name, stage = case.split(':')
+        lazy = cases.get(f"lazy:{name}:{stage}")
+        if kind != 'de_json' or not lazy or not lazy['p50']:
+            continue
+        result[f"{name}:{stage}"] = row = {'cpu_x': round(summary['p50'] / lazy['p50'], 2)}
+        if summary.get('retained_bytes'):
+            row['retained_share'] = round(lazy['retained_bytes'] / summary['retained_bytes'], 2)
+            row['peak_share'] = round(lazy['peak_bytes'] / summary['peak_bytes'], 2)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разбор обновлений: de_json против ленивых обновлений")
+    parser.add_argument('--batch', type=int, default=100, help="обновлений в пачке (getUpdates отдаёт до 100)")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2, help="минимальная длительность повтора, с")
+    parser.add_argument('--json', dest='json_path', default=None, help="сохранить отчёт в JSON")
+    parser.add_argument('--baseline', default=None, help="отчёт, с которым сравнить медианы")
+    parser.add_argument('--save-baseline', default=None, help="сохранить отчёт как базовый")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    parser.add_argument('--min-delta-ns', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    absolute_paths(args, 'json_path', 'baseline', 'save_baseline')
+
+    print(f"{'замер (на обновление)':<42}{'p50, нс':>12}{'разброс':>10}{'память, Б':>12}{'пик, Б':>12}")
+    cases = run(args.batch, args.repeat, args.min_time)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'ns/update',
+        'batch': args.batch,
+        'cases': cases,
+        'lazy_vs_de_json': speedups(cases),
+    }
+    print(f"\n{'обновление':<32}{'быстрее, раз':>14}{'память':>10}{'пик':>10}")
+    for name, row in report['lazy_vs_de_json'].items():
+        print(f"{name:<32}{row['cpu_x']:>14}{row.get('retained_share', ''):>10}{row.get('peak_share', ''):>10}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            rows = compare(report['cases'], json.load(f).get('cases', {}), args.tolerance, args.min_delta_ns,
+                           metrics=('p50',))
+        print_comparison(rows, unit='нс', width=42)
+        report['regressions'] = [{'case': name, 'metric': metric, 'baseline': old, 'current': new}
+                                 for name, metric, old, new, regressed in rows if regressed]
+    if args.save_baseline:
+        save_report(report, args.save_baseline)
+    if args.json_path:
+        save_report(report, args.json_path)
+    return report
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main().get('regressions') else 0)
@@ -0,0 +1,173 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+
+# ===== ЛОГИРОВАНИЕ =====
+# Обработчики только кладут запись в очередь, в файл пишет отдельный поток.
+# Записи пишутся пачками в формате JSON lines, файл ротируется по размеру и по времени.
+
+_FIELDS = ('user_id', 'chat_id', 'username', 'action', 'order_id', 'latency_ms')
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in _FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Если в очереди уже max_size записей, запись отбрасывается, а не тормозит
+    # обработчик; счётчик dropped - метрика bot_log_dropped. Очередь -
+    # queue.SimpleQueue: в ней нет блокировки и Condition, как в queue.Queue,
+    # поэтому предел проверяется по qsize() и может быть превышен на пару записей.
+    #
+    # На пути обработчика - только создание записи и put: запись не копируется
+    # (на корневом логгере этот обработчик один, запись больше никому не нужна),
+    # трассировка исключения и JSON собираются в потоке записи.
+    def __init__(self, log_queue, max_size=10000):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record):
+        # Очередь потокобезопасна сама, блокировка обработчика не нужна
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def prepare(self, record):
+        # Аргументы подставляются сразу: к записи в файл они могут измениться
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            # += из нескольких потоков теряет прибавления; блокировка - только на пути отбрасывания
+            with self.lock:
+                self.dropped += 1
+            return
+        self.queue.put(record)
+
+
+class BatchingFileHandler(logging.handlers.RotatingFileHandler):
+    # Сбрасывает файл на диск раз в batch_size записей (и по таймеру из BatchingQueueListener).
+    # Новый файл начинается при превышении max_bytes или через rotate_interval секунд.
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5,
+                 rotate_interval=24 * 60 * 60, batch_size=100):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rotate_interval = rotate_interval
+        self.batch_size = batch_size
+        self._pending = 0
+        self._opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes and self.stream.tell() >= self.maxBytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def doRollover(self):
+        self.flush()
+        super().doRollover()
+        self._opened_at = time.time()
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            self.stream.write(self.format(record) + self.terminator)
+            self._pending += 1
+            if self._pending >= self.batch_size:
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self._pending = 0
+        super().flush()
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    # Когда очередь пустеет на flush_interval секунд, недописанная пачка сбрасывается на диск
+    def __init__(self, log_queue, *handlers, flush_interval=1.0):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block=block, timeout=self.flush_interval)
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+                if not block:
+                    raise
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        super().stop()
+        for handler in self.handlers:
+            handler.flush()
+
+
+def setup_logging(filename='bot.log', level=logging.INFO, queue_size=10000, max_bytes=10 * 1024 * 1024,
+                  backup_count=5, rotate_interval=24 * 60 * 60, batch_size=100, flush_interval=1.0):
+    file_handler = BatchingFileHandler(
+        filename,
+        max_bytes=max_bytes,
+        backup_count=backup_count,
+        rotate_interval=rotate_interval,
+        batch_size=batch_size
+    )
+    file_handler.setFormatter(JsonLinesFormatter())
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DroppingQueueHandler(log_queue, max_size=queue_size))
+    listener = BatchingQueueListener(log_queue, file_handler, flush_interval=flush_interval)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def dropped_records():
+    # Сколько записей отброшено из-за переполненной очереди с запуска
+    return sum(handler.dropped for handler in logging.getLogger().handlers
+               if isinstance(handler, DroppingQueueHandler))
+
+
+def user_fields(message, **fields):
+    # Поля пользователя для extra=..., задержка - от получения обновления ботом
+    user = message.from_user
+    fields.update(user_id=user.id, chat_id=message.chat.id, username=user.username)
+    received_at = getattr(message, 'received_at', None)
+    if received_at is not None:
+        fields['latency_ms'] = round((time.monotonic() - received_at) * 1000, 1)
+    return fields
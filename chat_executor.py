@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Классы задач: платёжные обновления обслуживаются раньше остальных
+PAYMENT = 'payment'
+CHAT = 'chat'
+
+
+def task_key(args):
+    # Ключ очереди - чат, к которому относится обновление. Для сообщений это чат,
+    # для callback-запросов - чат исходного сообщения, для pre-checkout - пользователь
+    # (в личке chat_id совпадает с user_id). Список обновлений для update_listener
+    # ни к какому чату не относится.
+    if not args:
+        return None
+    obj = args[0]
+    chat = getattr(obj, 'chat', None) or getattr(getattr(obj, 'message', None), 'chat', None)
+    if chat is not None:
+        return chat.id
+    user = getattr(obj, 'from_user', None)
+    return user.id if user is not None else None
+
+
+def task_class(args):
+    # pre_checkout_query (на ответ Telegram даёт 10 секунд) и successful_payment
+    # идут по платёжной полосе, всё остальное - по обычной
+    obj = args[0] if args else None
+    if hasattr(obj, 'invoice_payload') and hasattr(obj, 'total_amount'):
+        return PAYMENT
+    if getattr(obj, 'content_type', None) == 'successful_payment':
+        return PAYMENT
+    return CHAT
+
+
+class _LaneStats:
+    def __init__(self, budget):
+        self.budget = budget
+        self.tasks = 0
+        self.misses = 0
+        self.max_wait = 0.0
+        self.max_latency = 0.0
+
+    def record(self, wait, latency):
+        self.tasks += 1
+        self.max_wait = max(self.max_wait, wait)
+        self.max_latency = max(self.max_latency, latency)
+        if self.budget and latency > self.budget:
+            self.misses += 1
+            return True
+        return False
+
+
+# ===== ИСПОЛНИТЕЛЬ ОБРАБОТЧИКОВ ПО ЧАТАМ =====
+class ChatExecutor:
+    # Замена telebot.util.ThreadPool. У каждого чата своя очередь задач: задачи
+    # одного чата выполняются строго по порядку и никогда параллельно, разные
+    # чаты обрабатываются параллельно. Чаты с задачами ждут свободного потока
+    # по кругу, поэтому один активный клиент не занимает все потоки.
+    # Потоков не меньше min_workers; если все заняты, добавляются новые до
+    # max_workers, лишние завершаются после idle_timeout секунд простоя.
+    #
+    # Платёжные обновления идут отдельной полосой: свободный поток всегда берёт
+    # сначала их, а reserved_workers потоков обслуживают только эту полосу,
+    # поэтому ответ на pre-checkout не ждёт, пока освободятся занятые скачиванием
+    # потоки. У каждой полосы свой бюджет задержки (от постановки в очередь до
+    # конца обработки, в секундах); превышения считаются в stats().
+    # Порядок внутри чата соблюдается в каждой полосе отдельно: pre-checkout и
+    # оплата одного пользователя идут друг за другом, но не ждут его обычных
+    # задач и могут выполняться одновременно с ними. Платёжные обработчики
+    # работают только со счетами и журналом оплат, черновик и шаг разговора не трогают.
+    def __init__(self, bot=None, min_workers=2, max_workers=16, idle_timeout=30,
+                 reserved_workers=1, payment_budget=5, chat_budget=None):
+        self.bot = None
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.idle_timeout = idle_timeout
+        self.reserved_workers = reserved_workers
+
+        # Интерфейс ThreadPool, на него опирается bot.polling()
+        self.exception_event = threading.Event()
+        self.exception_info = None
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # Резервные потоки ждут отдельно, чтобы обычная задача не разбудила их вместо общего потока
+        self._payment_cond = threading.Condition(self._lock)
+        # (класс, ключ) -> deque задач; ключ есть, пока у чата есть задачи или одна выполняется
+        self._lanes = {}
+        # Полосы, которые ждут свободного потока, по классам
+        self._ready = {PAYMENT: deque(), CHAT: deque()}
+        self._stats = {PAYMENT: _LaneStats(payment_budget), CHAT: _LaneStats(chat_budget)}
+        self._workers = set()
+        self._reserved = set()
+        self._idle = 0
+        self._running = 0
+        self._queued = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._failed = 0
+        self._closed = False
+        self._count = 0
+        if bot is not None:
+            self.attach(bot)
+
+    def attach(self, bot):
+        # Бот создаётся с threaded=False, чтобы не запускать собственный ThreadPool
+        self.bot = bot
+        bot.threaded = True
+        bot.worker_pool = self
+        with self._cond:
+            while len(self._workers) < self.min_workers:
+                self._spawn()
+            while len(self._reserved) < self.reserved_workers:
+                self._spawn(reserved=True)
+        return bot
+
+    def put(self, func, *args, **kwargs):
+        cls = task_class(args)
+        key = task_key(args)
+        if key is None:
+            key = object()  # без чата - отдельная очередь, порядок не важен
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Исполнитель остановлен")
+            lane = self._lanes.get((cls, key))
+            if lane is None:
+                lane = self._lanes[(cls, key)] = deque()
+                self._ready[cls].append(key)
+                self._wake(cls)
+            lane.append((func, args, kwargs, time.monotonic()))
+            self._queued += 1
+            self._peak_queued = max(self._peak_queued, self._queued)
+
+    def _waiting(self):
+        return len(self._ready[PAYMENT]) + len(self._ready[CHAT])
+
+    def _wake(self, cls):
+        # Вызывается под self._cond, когда очередь готовых полос выросла
+        if cls == PAYMENT:
+            self._payment_cond.notify()
+        # После close() новых потоков нет: close() ждёт только тех, что уже есть,
+        # и они дорабатывают очередь
+        if not self._closed and self._waiting() > self._idle and len(self._workers) < self.max_workers:
+            self._spawn()
+        else:
+            self._cond.notify()
+
+    def _spawn(self, reserved=False):
+        self._count += 1
+        name = f"PaymentWorker{self._count}" if reserved else f"ChatWorker{self._count}"
+        worker = threading.Thread(target=self._work, args=(reserved,), name=name, daemon=True)
+        (self._reserved if reserved else self._workers).add(worker)
+        worker.start()
+
+    def _next(self, reserved):
+        # Под self._cond: полоса, которую возьмёт поток, или None
+        if self._ready[PAYMENT]:
+            return PAYMENT
+        if not reserved and self._ready[CHAT]:
+            return CHAT
+        return None
+
+    def _work(self, reserved):
+        me = threading.current_thread()
+        pool = self._reserved if reserved else self._workers
+        while True:
+            with self._cond:
+                cls = self._next(reserved)
+                while cls is None and not self._closed:
+                    if reserved:
+                        notified = self._payment_cond.wait()
+                    else:
+                        self._idle += 1
+                        notified = self._cond.wait(self.idle_timeout)
+                        self._idle -= 1
+                    cls = self._next(reserved)
+                    if not notified and cls is None and len(pool) > self.min_workers:
+                        pool.discard(me)
+                        return
+                if cls is None:
+                    pool.discard(me)
+                    return
+                key = self._ready[cls].popleft()
+                func, args, kwargs, queued_at = self._lanes[(cls, key)].popleft()
+                self._queued -= 1
+                self._running += 1
+
+            started = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                self._on_exception(e)
+            finally:
+                finished = time.monotonic()
+                with self._cond:
+                    self._running -= 1
+                    self._completed += 1
+                    missed = self._stats[cls].record(started - queued_at, finished - queued_at)
+                    if self._lanes[(cls, key)]:
+                        # Следующая задача чата встаёт в конец очереди - за другими чатами
+                        self._ready[cls].append(key)
+                        self._wake(cls)
+                    else:
+                        del self._lanes[(cls, key)]
+                if missed:
+                    logger.warning(
+                        f"Полоса {cls}: обработка заняла {finished - queued_at:.2f} с "
+                        f"(бюджет {self._stats[cls].budget} с)"
+                    )
+
+    def _on_exception(self, e):
+        with self._cond:
+            self._failed += 1
+        handled = self.bot is not None and self.bot.exception_handler is not None \
+            and self.bot.exception_handler.handle(e)
+        if not handled:
+            logger.error(f"Ошибка в обработчике: {str(e)}", exc_info=True)
+            self.exception_info = e
+            self.exception_event.set()
+
+    def raise_exceptions(self):
+        if self.exception_event.is_set():
+            raise self.exception_info
+
+    def clear_exceptions(self):
+        self.exception_event.clear()
+
+    def stats(self):
+        with self._cond:
+            depths = [len(lane) for lane in self._lanes.values()]
+            return {
+                'workers': len(self._workers),
+                'reserved_workers': len(self._reserved),
+                'idle': self._idle,
+                'running': self._running,
+                'queued': self._queued,
+                'peak_queued': self._peak_queued,
+                'lanes': len(self._lanes),
+                'lanes_waiting': self._waiting(),
+                'max_lane_depth': max(depths, default=0),
+                'completed': self._completed,
+                'failed': self._failed,
+                'classes': {
+                    cls: {
+                        'waiting': len(self._ready[cls]),
+                        'tasks': stats.tasks,
+                        'budget': stats.budget,
+                        'deadline_misses': stats.misses,
+                        'max_wait_ms': round(stats.max_wait * 1000, 1),
+                        'max_latency_ms': round(stats.max_latency * 1000, 1),
+                    }
+                    for cls, stats in self._stats.items()
+                },
+            }
+
+    def close(self, timeout=None):
+        # Уже поставленные задачи дорабатываются, новые не принимаются
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            self._payment_cond.notify_all()
+            workers = list(self._workers | self._reserved)
+        for worker in workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout)
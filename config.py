@@ -1,3 +1,95 @@
 # config.py
 PAYMENT_TOKEN = "Платежный токен"  
-ADMIN_ID = 'твой id ' # Ваш ID в Telegram для уведомлений
\ No newline at end of file
+ADMIN_ID = 'твой id ' # Ваш ID в Telegram для уведомлений
+ERROR_REPORT_ID = 931928744  # Кому отправлять ошибки оплаты
+
+# Уведомления администратору собираются в сводки: первое событие открывает окно,
+# через столько секунд уходит одно сообщение со всеми событиями окна
+ADMIN_DIGEST_WINDOWS = {'payment': 60, 'error': 300}
+# Накопленные, но ещё не отправленные события сводок: переживают перезапуск бота
+ADMIN_DIGEST_JOURNAL = 'admin_digest.jsonl'
+
+# Хранилище заказов: 'sqlite' - черновики, шаг разговора и счета переживают
+# перезапуск бота; 'memory' - теряются при перезапуске
+ORDER_STORE = 'sqlite'
+ORDER_DB_PATH = 'orders.db'
+ORDER_TTL = 24 * 60 * 60  # Брошенные черновики удаляются через сутки (в секундах)
+INVOICE_TTL = 24 * 60 * 60  # Неоплаченный счёт действует сутки (в секундах)
+
+# Приём файлов
+INTAKE_DIR = 'uploads'
+INTAKE_WORKERS = 4  # Потоков для скачивания файлов
+INTAKE_MAX_PENDING = 16  # Сколько загрузок может ждать одновременно
+MAX_FILE_SIZE = 20 * 1024 * 1024  # Максимальный размер файла (в байтах)
+UPLOAD_CACHE_DIR = 'upload_cache'
+UPLOAD_CACHE_SIZE = 512 * 1024 * 1024  # Предельный размер кеша файлов (в байтах)
+
+# Скидки за объём: (от скольких страниц, скидка в процентах), например [(100, 5), (500, 10)]
+VOLUME_DISCOUNTS = []
+
+# Вебхук: при WEBHOOK_MODE = True бот принимает обновления по HTTP вместо long polling.
+# Пустой WEBHOOK_URL - вебхук в Telegram не регистрируется (для локальной проверки)
+WEBHOOK_MODE = False
+WEBHOOK_URL = ''  # Внешний адрес, например 'https://example.com'
+WEBHOOK_LISTEN = '127.0.0.1'
+WEBHOOK_PORT = 8443
+WEBHOOK_SECRET = None
+WEBHOOK_QUEUE_SIZE = 1000
+
+# Ленивый разбор обновлений (lazy_types.py): поля сообщения разбираются при первом обращении
+LAZY_UPDATES = False
+
+# Логи: JSON lines, запись в фоне пачками, ротация по размеру и времени
+LOG_FILE = 'bot.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_ROTATE_INTERVAL = 24 * 60 * 60  # в секундах
+LOG_QUEUE_SIZE = 10000
+
+# Потоки обработчиков: сообщения одного чата обрабатываются по порядку, разные чаты - параллельно
+WORKERS_MIN = 2
+WORKERS_MAX = 16
+WORKER_IDLE_TIMEOUT = 30  # в секундах
+WORKERS_RESERVED = 1  # потоки только для pre_checkout_query и successful_payment
+PAYMENT_LANE_BUDGET = 5  # в секундах; Telegram ждёт ответа на pre-checkout 10 секунд
+CHAT_LANE_BUDGET = 30  # в секундах
+
+# Журнал платежей: только дописывается, сегменты по PAYMENT_LEDGER_SEGMENT_SIZE байт
+PAYMENT_LEDGER_DIR = 'payments'
+PAYMENT_LEDGER_SEGMENT_SIZE = 4 * 1024 * 1024
+
+# Исходящие сообщения: лимиты Telegram (сообщений в секунду)
+OUTBOUND_GLOBAL_RATE = 30
+OUTBOUND_CHAT_RATE = 1
+OUTBOUND_CHAT_BURST = 3  # столько сообщений подряд в один чат уходят без ожидания
+OUTBOUND_WORKERS = 4  # потоков для запросов к API
+
+# Журнал исходящих (outbox.py): сообщения сначала пишутся на диск и досылаются
+# после сбоев сети и перезапуска бота
+OUTBOX_DIR = 'outbox'
+OUTBOX_SEGMENT_SIZE = 1024 * 1024
+OUTBOX_SYNC_INTERVAL = 0.05  # fsync журнала раз в столько секунд
+OUTBOX_RETRY_MAX_DELAY = 300  # предел паузы между повторами (в секундах)
+OUTBOX_MAX_AGE = 24 * 60 * 60  # сообщение старше этого не отправляется (в секундах)
+
+# HTTP к Bot API (transport.py): общие keep-alive соединения, отдельные пулы для
+# getUpdates, вызовов API и файлов. False - сессии requests из telebot
+HTTP_POOLED_TRANSPORT = True
+HTTP_POOL_TIMEOUT = 30  # сколько поток ждёт свободное соединение (в секундах)
+HTTP_PREWARM = 2  # сколько соединений API открыть при запуске, до первых обновлений (0 - не открывать)
+
+# Повторы вызовов Bot API (resilience.py): пауза растёт вдвое от API_RETRY_BASE_DELAY
+# со случайным разбросом, не больше API_RETRY_MAX_DELAY секунд
+API_RETRY_ATTEMPTS = 3  # попыток на вызов, включая первую
+API_RETRY_BASE_DELAY = 0.2  # в секундах
+API_RETRY_MAX_DELAY = 2.0  # в секундах; 429 с большим retry_after не ждём в потоке
+API_RETRY_BUDGET_RATIO = 0.2  # повторов на одну первую попытку
+API_RETRY_MAX_WAITING = 4  # сколько потоков одновременно могут ждать повтора
+# Предохранитель метода: размыкается после API_BREAKER_FAILURES сбоев подряд
+API_BREAKER_FAILURES = 5
+API_BREAKER_RESET = 10  # через сколько секунд пробный вызов (в секундах)
+API_BREAKER_MAX_RESET = 60  # предел при повторных неудачах пробы (в секундах)
+
+# Метрики в формате Prometheus: http://METRICS_LISTEN:METRICS_PORT/metrics, None - не запускать
+METRICS_LISTEN = '127.0.0.1'
+METRICS_PORT = 9108
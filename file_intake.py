@@ -0,0 +1,173 @@
+import asyncio
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot import apihelper
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class IntakeBusy(Exception):
+    pass
+
+
+# ===== ПРИЁМ ФАЙЛОВ =====
+class FileIntake:
+    # Файлы скачиваются потоком, кусками, в отдельном ограниченном пуле:
+    # обработчики сообщений не ждут сеть и не держат документ целиком в памяти.
+    # transport (transport.PooledTransport) - качать через его пул файлов,
+    # без него - через сессию requests из apihelper.
+    def __init__(self, token, directory='uploads', max_workers=4, max_pending=16,
+                 max_size=20 * 1024 * 1024, chunk_size=64 * 1024, transport=None):
+        self.token = token
+        self.transport = transport
+        self.directory = directory
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='FileIntake')
+        os.makedirs(directory, exist_ok=True)
+
+    def submit(self, file_id, file_size=None, file_name=None, on_chunk=None):
+        # on_chunk получает каждый скачанный кусок, например для подсчёта страниц на лету
+        # Размер из сообщения проверяем сразу, чтобы не ставить заведомо большой файл в очередь
+        if file_size and file_size > self.max_size:
+            raise FileTooLarge(f"Размер файла {file_size} байт больше допустимых {self.max_size}")
+        if not self._slots.acquire(blocking=False):
+            raise IntakeBusy("Слишком много загрузок одновременно")
+        try:
+            future = self._pool.submit(self._download, file_id, file_name, on_chunk)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def _download(self, file_id, file_name, on_chunk):
+        file_info = apihelper.get_file(self.token, file_id)
+        if file_info.get('file_size') and file_info['file_size'] > self.max_size:
+            raise FileTooLarge(f"Размер файла {file_info['file_size']} байт больше допустимых {self.max_size}")
+
+        if apihelper.FILE_URL is None:
+            url = "https://api.telegram.org/file/bot{0}/{1}".format(self.token, file_info['file_path'])
+        else:
+            url = apihelper.FILE_URL.format(self.token, file_info['file_path'])
+
+        suffix = os.path.splitext(file_name or file_info['file_path'])[1]
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        timeout = (apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if self.transport is not None:
+                    response = self.transport.stream(url, timeout=timeout, proxies=apihelper.proxy)
+                else:
+                    response = apihelper._get_req_session().get(
+                        url, stream=True, proxies=apihelper.proxy, timeout=timeout)
+                with response:
+                    if response.status_code != 200:
+                        raise apihelper.ApiHTTPException('Download file', response)
+                    received = 0
+                    for chunk in response.iter_content(self.chunk_size):
+                        received += len(chunk)
+                        if received > self.max_size:
+                            raise FileTooLarge(f"Файл больше допустимых {self.max_size} байт")
+                        f.write(chunk)
+                        if on_chunk is not None:
+                            on_chunk(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class AsyncFileIntake:
+    # То же для asyncio-версии: файл читается из ответа aiohttp кусками,
+    # запись на диск и разбор кусков выполняются в пуле потоков.
+    def __init__(self, token, directory='uploads', max_pending=16,
+                 max_size=20 * 1024 * 1024, chunk_size=64 * 1024):
+        self.token = token
+        self.directory = directory
+        self.max_pending = max_pending
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self._active = 0
+        os.makedirs(directory, exist_ok=True)
+
+    async def download(self, file_id, file_size=None, file_name=None, on_chunk=None):
+        if file_size and file_size > self.max_size:
+            raise FileTooLarge(f"Размер файла {file_size} байт больше допустимых {self.max_size}")
+        if self._active >= self.max_pending:
+            raise IntakeBusy("Слишком много загрузок одновременно")
+        self._active += 1
+        try:
+            return await self._download(file_id, file_name, on_chunk)
+        finally:
+            self._active -= 1
+
+    async def _download(self, file_id, file_name, on_chunk):
+        from telebot import asyncio_helper
+
+        file_info = await asyncio_helper.get_file(self.token, file_id)
+        if file_info.get('file_size') and file_info['file_size'] > self.max_size:
+            raise FileTooLarge(f"Размер файла {file_info['file_size']} байт больше допустимых {self.max_size}")
+
+        if asyncio_helper.FILE_URL is None:
+            url = "https://api.telegram.org/file/bot{0}/{1}".format(self.token, file_info['file_path'])
+        else:
+            url = asyncio_helper.FILE_URL.format(self.token, file_info['file_path'])
+
+        def write(f, chunk):
+            f.write(chunk)
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+        suffix = os.path.splitext(file_name or file_info['file_path'])[1]
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.directory)
+        session = await asyncio_helper.session_manager.get_session()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async with session.get(url, proxy=asyncio_helper.proxy) as response:
+                    if response.status != 200:
+                        raise asyncio_helper.ApiHTTPException('Download file', response)
+                    received = 0
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        received += len(chunk)
+                        if received > self.max_size:
+                            raise FileTooLarge(f"Файл больше допустимых {self.max_size} байт")
+                        await asyncio.to_thread(write, f, chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+
+# ===== ФАЙЛЫ ЗАКАЗОВ НА ДИСКЕ =====
+def remove_file(path):
+    # Файл заказа больше не нужен: черновик отменён, удалён по ORDER_TTL, счёт
+    # оплачен или истёк. Файла может уже не быть - это не ошибка
+    if not path:
+        return False
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def sweep_orphans(directory, keep):
+    # При запуске: удаляет из каталога приёма файлы, которых нет ни в одном
+    # черновике и счёте (keep - их пути), например после падения бота.
+    # Возвращает число удалённых файлов
+    keep = {os.path.abspath(path) for path in keep}
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and os.path.abspath(entry.path) not in keep:
+            removed += remove_file(entry.path)
+    return removed
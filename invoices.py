@@ -0,0 +1,249 @@
+import asyncio
+import json
+import secrets
+import sqlite3
+import threading
+import time
+
+from pricing import DEFAULT_SIDE
+
+# Поля черновика, которые попадают в счёт. Остальное (шаг разговора, путь к файлу
+# на диске) к оплате отношения не имеет.
+SNAPSHOT_FIELDS = ('type', 'page_count', 'format', 'side', 'comment')
+
+
+class InvoiceRejected(Exception):
+    # Текст исключения уходит пользователю как error_message в answer_pre_checkout_query
+    pass
+
+
+def new_order_id():
+    return secrets.token_hex(6)
+
+
+def make_snapshot(order_id, chat_id, user_id, order, amount, currency='RUB', ttl=None):
+    # Снимок хранится в прежнем виде (подписи строками): его читают уведомления об оплате
+    fields = order.to_dict()
+    snapshot = {field: fields.get(field) for field in SNAPSHOT_FIELDS}
+    # У заказа в одну страницу стороны не спрашиваются: в счёте - та, по которой посчитана цена
+    snapshot['side'] = snapshot['side'] or DEFAULT_SIDE.label
+    snapshot['file_name'] = order.file.file_name if order.file else None
+    return {
+        'order_id': order_id,
+        'payload': f"order_{order_id}",
+        'chat_id': chat_id,
+        'user_id': user_id,
+        'amount': amount,
+        'currency': currency,
+        'created': time.time(),
+        'expires': time.time() + ttl if ttl else None,
+        'order': snapshot,
+        # Файл заказа на диске остаётся до оплаты или истечения счёта
+        'file_path': order.file.path if order.file else None,
+    }
+
+
+# ===== ВЫСТАВЛЕННЫЕ СЧЕТА =====
+class InvoiceIndex:
+    # Снимки заказов на момент подтверждения, по invoice_payload. Черновик после
+    # выставления счёта удаляется, поэтому пользователь может начать новый заказ,
+    # пока старый счёт ещё не оплачен. Pre-checkout проверяется одним поиском по ключу.
+    # on_expire(snapshot) вызывается для каждого счёта, удалённого по ttl.
+    def __init__(self, ttl=None, on_expire=None):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def issue(self, chat_id, user_id, order, amount, currency='RUB'):
+        snapshot = make_snapshot(new_order_id(), chat_id, user_id, order, amount, currency, self.ttl)
+        self._put(snapshot)
+        return snapshot
+
+    def verify(self, payload, user_id, amount, currency):
+        # Возвращает снимок или бросает InvoiceRejected
+        snapshot = self.get(payload)
+        if snapshot is None:
+            raise InvoiceRejected("Заказ не найден или устарел")
+        if snapshot['user_id'] != user_id:
+            raise InvoiceRejected("Счёт выставлен другому пользователю")
+        if snapshot['amount'] != amount or snapshot['currency'] != currency:
+            raise InvoiceRejected("Сумма счёта не совпадает с заказом")
+        return snapshot
+
+    def _put(self, snapshot):
+        raise NotImplementedError
+
+    def get(self, payload):
+        raise NotImplementedError
+
+    def delete(self, payload):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        raise NotImplementedError
+
+    def file_paths(self):
+        # Пути файлов всех открытых счетов на диске
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    # Фоновая очистка неоплаченных просроченных счетов
+    def start_sweeper(self, interval=60):
+        if self._sweeper is not None:
+            return self._sweeper
+
+        def sweep():
+            while not self._stop.wait(interval):
+                self.purge_expired()
+
+        self._sweeper = threading.Thread(target=sweep, name='InvoiceIndexSweeper', daemon=True)
+        self._sweeper.start()
+        return self._sweeper
+
+    def close(self):
+        self._stop.set()
+
+    @staticmethod
+    def _expired(snapshot, now=None):
+        return snapshot['expires'] is not None and (now or time.time()) > snapshot['expires']
+
+    def _discard(self, snapshots):
+        if self.on_expire is not None:
+            for snapshot in snapshots:
+                self.on_expire(snapshot)
+
+
+class MemoryInvoiceIndex(InvoiceIndex):
+    def __init__(self, ttl=None, on_expire=None):
+        super().__init__(ttl, on_expire)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _put(self, snapshot):
+        with self._lock:
+            self._data[snapshot['payload']] = snapshot
+
+    def get(self, payload):
+        with self._lock:
+            snapshot = self._data.get(payload)
+            if snapshot is None:
+                return None
+            if not self._expired(snapshot):
+                return dict(snapshot)
+            del self._data[payload]
+        self._discard((snapshot,))
+        return None
+
+    def delete(self, payload):
+        with self._lock:
+            return self._data.pop(payload, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            stale = [payload for payload, snapshot in self._data.items() if self._expired(snapshot, now)]
+            removed = [self._data.pop(payload) for payload in stale]
+        self._discard(removed)
+        return len(removed)
+
+    def file_paths(self):
+        with self._lock:
+            return {snapshot['file_path'] for snapshot in self._data.values() if snapshot.get('file_path')}
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteInvoiceIndex(InvoiceIndex):
+    # Счета в той же базе, что и заказы: неоплаченный счёт переживает перезапуск
+    def __init__(self, path='orders.db', ttl=None, on_expire=None):
+        super().__init__(ttl, on_expire)
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            "payload TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _put(self, snapshot):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO invoices (payload, data, expires) VALUES (?, ?, ?)",
+            (snapshot['payload'], json.dumps(snapshot, ensure_ascii=False), snapshot['expires'])
+        )
+
+    def get(self, payload):
+        row = self._conn().execute("SELECT data FROM invoices WHERE payload = ?", (payload,)).fetchone()
+        if row is None:
+            return None
+        snapshot = json.loads(row[0])
+        if self._expired(snapshot):
+            # Файл убирает тот, кто удалил счёт: оплата, очистка или этот вызов
+            if self.delete(payload) is not None:
+                self._discard((snapshot,))
+            return None
+        return snapshot
+
+    def delete(self, payload):
+        # Одним запросом: из одновременных удалений (оплата и очистка по ttl)
+        # снимок получает только одно. fetchall дочитывает запрос до конца,
+        # иначе он держал бы блокировку записи
+        rows = self._conn().execute("DELETE FROM invoices WHERE payload = ? RETURNING data", (payload,)).fetchall()
+        return json.loads(rows[0][0]) if rows else None
+
+    def purge_expired(self):
+        rows = self._conn().execute("DELETE FROM invoices WHERE expires IS NOT NULL AND expires < ? RETURNING data",
+                                    (time.time(),)).fetchall()
+        removed = [json.loads(row[0]) for row in rows]
+        self._discard(removed)
+        return len(removed)
+
+    def file_paths(self):
+        rows = self._conn().execute("SELECT data FROM invoices").fetchall()
+        return {path for path in (json.loads(row[0]).get('file_path') for row in rows) if path}
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+
+class AsyncInvoiceIndex:
+    # Как AsyncOrderStore: SQLite уходит в пул потоков, память читается напрямую
+    def __init__(self, index):
+        self.index = index
+        self._direct = isinstance(index, MemoryInvoiceIndex)
+
+    async def _call(self, method, *args):
+        if self._direct:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+
+    async def issue(self, chat_id, user_id, order, amount, currency='RUB'):
+        return await self._call(self.index.issue, chat_id, user_id, order, amount, currency)
+
+    async def verify(self, payload, user_id, amount, currency):
+        return await self._call(self.index.verify, payload, user_id, amount, currency)
+
+    async def get(self, payload):
+        return await self._call(self.index.get, payload)
+
+    async def delete(self, payload):
+        return await self._call(self.index.delete, payload)
+
+
+def create_invoice_index(backend='memory', **kwargs):
+    if backend == 'memory':
+        return MemoryInvoiceIndex(**kwargs)
+    if backend == 'sqlite':
+        return SQLiteInvoiceIndex(**kwargs)
+    raise ValueError(f"Неизвестное хранилище счетов: {backend}")
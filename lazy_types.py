@@ -0,0 +1,213 @@
+from telebot import apihelper, types
+
+
+# ===== ЛЕНИВЫЕ ОБНОВЛЕНИЯ =====
+# types.Update.de_json сразу строит всё дерево объектов: Message, User, Chat,
+# entities, клавиатуры, копируя словари на каждом уровне, а Message.__init__
+# заводит около девяноста атрибутов, почти все None. Обработчикам нужны
+# несколько полей: text, chat.id, from_user.id/username, document,
+# successful_payment.
+#
+# Здесь объект хранит исходный словарь и только те простые поля, что реально
+# пришли в JSON (одним dict.update); отсутствующие поля - None на уровне класса, поэтому чтение
+# любого поля идёт без вызова Python-кода. Вложенные объекты (chat, from_user,
+# document, ...) разбираются при первом обращении и запоминаются.
+#
+# Для telebot и обработчиков объект выглядит как исходный тип:
+# isinstance(message, types.Message) верно (через __class__). Если в JSON есть
+# поле, которое здесь не разбирается, объект сразу дополняется полями из
+# обычного de_json; вычисляемые поля и свойства telebot (html_text и т.п.)
+# тоже берутся из полного объекта, он строится один раз.
+
+
+def _attributes(cls, sample):
+    # Атрибуты, которые telebot заводит объекту: (читаются прямо из JSON, вычисляются).
+    # Берутся из объекта, разобранного из минимального JSON, а не из сигнатуры
+    # __init__: большую часть полей Message задаёт через options
+    instance = cls.de_json(sample)
+    plain = frozenset(name for name, value in vars(instance).items() if value is None or name in sample)
+    return plain, frozenset(vars(instance)) - plain
+
+
+_USER = {'id': 1, 'is_bot': False, 'first_name': 'x'}
+_CHAT = {'id': 1, 'type': 'private'}
+
+
+class _Decoded:
+    # Вложенный объект: разбирается при первом обращении и кладётся в __dict__
+    # объекта, дальше читается оттуда без вызова дескриптора
+    __slots__ = ('name', 'decode')
+
+    def __init__(self, name, decode):
+        self.name = name
+        self.decode = decode
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.name] = self.decode(obj._raw)
+        return value
+
+
+class _LazyObject:
+    __slots__ = ('_raw', '_full', '__dict__')
+    _type = None
+    _decoders = {}  # имя атрибута -> функция(raw)
+    _decoded_keys = frozenset()  # ключи JSON, которые читают функции из _decoders
+    _scalar_keys = frozenset()  # ключи JSON с простыми значениями, имя поля совпадает с ключом
+    _known_keys = frozenset()
+    _plain = frozenset()  # поля telebot; у класса они None, пришедшие в JSON - в __dict__ объекта
+    _derived = frozenset()  # поля, которые telebot вычисляет сам
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._known_keys = cls._scalar_keys | cls._decoded_keys
+        for name in cls._plain - cls._decoders.keys():
+            setattr(cls, name, None)
+        for name, decode in cls._decoders.items():
+            setattr(cls, name, _Decoded(name, decode))
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._full = None
+        if raw.keys() <= self._known_keys:
+            fields = self.__dict__
+            fields.update(raw)
+            # Сырые словари вложенных объектов не должны заслонять дескрипторы
+            for key in self._decoded_keys:
+                fields.pop(key, None)
+        else:
+            self._materialize()
+
+    @classmethod
+    def wrap(cls, raw):
+        return None if raw is None else cls(raw)
+
+    @property
+    def __class__(self):
+        return self._type
+
+    def _materialize(self):
+        # Дополняет объект полями из обычного de_json; уже выставленные поля не трогает
+        full = self._full
+        if full is None:
+            full = self._full = self._type.de_json(self._raw)
+            fields = self.__dict__
+            for name, value in vars(full).items():
+                fields.setdefault(name, value)
+        return full
+
+    def __getattr__(self, name):
+        # Сюда попадают только вычисляемые поля и свойства telebot вроде html_text
+        if name in self._derived or not name.startswith('__') and hasattr(self._type, name):
+            return getattr(self._materialize(), name)
+        raise AttributeError(f"'{self._type.__name__}' object has no attribute '{name}'")
+
+    def __repr__(self):
+        return f"{self._type.__name__}({self._raw})"
+
+
+class LazyUser(_LazyObject):
+    __slots__ = ()
+    _type = types.User
+    _plain, _derived = _attributes(types.User, _USER)
+    _scalar_keys = frozenset({'id', 'is_bot', 'first_name', 'last_name', 'username', 'language_code',
+                              'is_premium', 'added_to_attachment_menu'})
+
+
+class LazyChat(_LazyObject):
+    __slots__ = ()
+    _type = types.Chat
+    _plain, _derived = _attributes(types.Chat, _CHAT)
+    _scalar_keys = frozenset({'id', 'type', 'title', 'username', 'first_name', 'last_name', 'is_forum'})
+
+
+def _sub(key, cls):
+    def decode(raw):
+        value = raw.get(key)
+        return None if value is None else cls.de_json(value)
+    return decode
+
+
+def _parsed(key, parse):
+    # Списки объектов разбираются так же, как в Message.de_json (parse_entities, parse_photo)
+    def decode(raw):
+        value = raw.get(key)
+        return None if value is None else parse(value)
+    return decode
+
+
+class LazyMessage(_LazyObject):
+    __slots__ = ()
+    _type = types.Message
+    _plain, _derived = _attributes(types.Message, {'message_id': 1, 'date': 0, 'chat': _CHAT})
+    _decoders = {
+        'id': lambda raw: raw['message_id'],
+        'json': lambda raw: raw,
+        'chat': lambda raw: LazyChat.wrap(raw.get('chat')),
+        'from_user': lambda raw: LazyUser.wrap(raw.get('from')),
+        'entities': _parsed('entities', types.Message.parse_entities),
+        'document': _sub('document', types.Document),
+        'photo': _parsed('photo', types.Message.parse_photo),
+        'successful_payment': _sub('successful_payment', types.SuccessfulPayment),
+    }
+    _decoded_keys = frozenset({'chat', 'from', 'entities', 'document', 'photo', 'successful_payment'})
+    _scalar_keys = frozenset({'message_id', 'date', 'text', 'message_thread_id', 'is_topic_message', 'edit_date',
+                              'has_protected_content', 'media_group_id', 'author_signature', 'caption'})
+    # Как в Message.de_json: побеждает последний найденный ключ
+    _content_types = ('text', 'document', 'photo', 'successful_payment')
+
+    def __init__(self, raw):
+        super().__init__(raw)
+        if self._full is None:
+            content_type = None
+            for key in self._content_types:
+                if key in raw:
+                    content_type = key
+            self.content_type = content_type
+
+
+class LazyPreCheckoutQuery(_LazyObject):
+    __slots__ = ()
+    _type = types.PreCheckoutQuery
+    _plain, _derived = _attributes(types.PreCheckoutQuery, {
+        'id': '1', 'from': _USER, 'currency': 'RUB', 'total_amount': 1, 'invoice_payload': 'x'})
+    _decoders = {
+        'from_user': lambda raw: LazyUser.wrap(raw.get('from')),
+        'order_info': _sub('order_info', types.OrderInfo),
+    }
+    _decoded_keys = frozenset({'from', 'order_info'})
+    _scalar_keys = frozenset({'id', 'currency', 'total_amount', 'invoice_payload', 'shipping_option_id'})
+
+
+class LazyUpdate(_LazyObject):
+    __slots__ = ()
+    _type = types.Update
+    _plain, _derived = _attributes(types.Update, {'update_id': 1})
+    _decoders = {
+        'message': lambda raw: LazyMessage.wrap(raw.get('message')),
+        'pre_checkout_query': lambda raw: LazyPreCheckoutQuery.wrap(raw.get('pre_checkout_query')),
+    }
+    _decoded_keys = frozenset({'message', 'pre_checkout_query'})
+    _scalar_keys = frozenset({'update_id'})
+
+    @classmethod
+    def de_json(cls, json_string):
+        # Как types.Update.de_json: строка JSON или уже разобранный словарь
+        if json_string is None:
+            return None
+        raw = types.JsonDeserializable.check_json(json_string, dict_copy=False)
+        if 'update_id' not in raw:
+            raise KeyError('update_id')
+        return cls(raw)
+
+
+def use_lazy_updates(bot):
+    # getUpdates бота отдаёт ленивые обновления вместо types.Update
+    def get_updates(offset=None, limit=None, timeout=20, allowed_updates=None, long_polling_timeout=20):
+        json_updates = apihelper.get_updates(
+            bot.token, offset=offset, limit=limit, timeout=timeout, allowed_updates=allowed_updates,
+            long_polling_timeout=long_polling_timeout)
+        return [LazyUpdate(ju) for ju in json_updates]
+    bot.get_updates = get_updates
+    return bot
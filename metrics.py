@@ -0,0 +1,334 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки, в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Shards:
+    # Значения по потокам: каждый поток пишет только в свою ячейку, поэтому
+    # запись идёт без блокировок и ничего не теряется. Блокировка берётся один
+    # раз при первой записи потока и при чтении; ячейки завершившихся потоков
+    # при чтении сливаются в общую сумму.
+    def __init__(self, size):
+        self.size = size
+        self._local = threading.local()
+        self._cells = []  # (поток, ячейка)
+        self._base = [0] * size
+        self._lock = threading.Lock()
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0] * self.size
+            with self._lock:
+                self._cells.append((threading.current_thread(), cell))
+            return cell
+
+    def collect(self):
+        with self._lock:
+            alive = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    alive.append((thread, cell))
+                else:
+                    for i, value in enumerate(cell):
+                        self._base[i] += value
+            self._cells = alive
+            total = list(self._base)
+            for _, cell in alive:
+                for i, value in enumerate(cell):
+                    total[i] += value
+        return total
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидались метки {self.labelnames}, получено {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def samples(self):
+        # (суффикс имени, метки, значение)
+        raise NotImplementedError
+
+
+class _CounterChild:
+    __slots__ = ('_shards',)
+
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount=1):
+        self._shards.cell()[0] += amount
+
+    def value(self):
+        return self._shards.collect()[0]
+
+
+class Counter(_Metric):
+    # Имя задаётся без _total, суффикс добавляется при выводе
+    kind = 'counter'
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            yield '_total', dict(zip(self.labelnames, values)), child.value()
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', '_shards')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Ячейка: счётчики корзин, корзина +Inf, сумма
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value):
+        cell = self._shards.cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ('child', 'started')
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self):
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            cell = child._shards.collect()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), cell):
+                cumulative += count
+                yield '_bucket', dict(labels, le=_format_value(bound)), cumulative
+            yield '_sum', labels, cell[-1]
+            yield '_count', labels, cumulative
+
+
+class Gauge(_Metric):
+    # Значение считается при чтении: callback() возвращает число
+    # или словарь {кортеж значений меток: число}
+    kind = 'gauge'
+
+    def __init__(self, name, help, callback, labels=()):
+        super().__init__(name, help, labels)
+        self.callback = callback
+
+    def samples(self):
+        value = self.callback()
+        if isinstance(value, dict):
+            for values, number in value.items():
+                yield '', dict(zip(self.labelnames, values)), number
+        else:
+            yield '', {}, value
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# ===== РЕЕСТР МЕТРИК =====
+class Registry:
+    # Метрики процесса в текстовом формате Prometheus (version 0.0.4)
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, callback, labels=()):
+        return self.register(Gauge(name, help, callback, labels))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                logger.error(f"Метрика {metric.name} не прочитана: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                name = metric.name + suffix
+                if labels:
+                    name += '{' + ','.join(f'{key}="{_escape(label)}"' for key, label in labels.items()) + '}'
+                lines.append(f"{name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# ===== ЗАМЕРЫ ОБРАБОТЧИКОВ И API =====
+HANDLER_LISTS = ('message_handlers', 'pre_checkout_query_handlers', 'callback_query_handlers',
+                 'shipping_query_handlers', 'edited_message_handlers')
+
+
+def timed(function, histogram):
+    # Обёртка с замером времени; метка - имя функции
+    child = histogram.labels(function.__name__)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            child.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_handlers(bot, histogram, routers=()):
+    # Оборачивает все зарегистрированные обработчики бота и кнопок TextRouter.
+    # Вызывать после регистрации обработчиков. Сам TextRouter.dispatch не
+    # оборачивается - время попадает в обработчик конкретной кнопки.
+    dispatchers = [router.dispatch for router in routers]
+    for router in routers:
+        wrapped = {}
+        for text, function in router.routes.items():
+            if function not in wrapped:
+                wrapped[function] = timed(function, histogram)
+            router.routes[text] = wrapped[function]
+    for name in HANDLER_LISTS:
+        for handler in getattr(bot, name, ()):
+            if handler['function'] not in dispatchers:
+                handler['function'] = timed(handler['function'], histogram)
+
+
+def instrument_api(histogram, errors):
+    # Время каждого запроса к Bot API по методу и ошибки по коду ответа.
+    # Все функции apihelper вызывают _make_request через глобальное имя модуля,
+    # поэтому достаточно подменить его один раз
+    from telebot import apihelper
+    make_request = apihelper._make_request
+    if getattr(make_request, '__wrapped__', None) is not None:
+        return
+
+    @functools.wraps(make_request)
+    def wrapper(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return make_request(token, method_name, *args, **kwargs)
+        except apihelper.ApiTelegramException as e:
+            errors.labels(method_name, str(e.error_code)).inc()
+            raise
+        except Exception as e:
+            errors.labels(method_name, type(e).__name__).inc()
+            raise
+        finally:
+            histogram.labels(method_name).observe(time.perf_counter() - started)
+    apihelper._make_request = wrapper
+
+
+# ===== HTTP-ЭНДПОИНТ =====
+class MetricsServer:
+    # GET /metrics - метрики реестра; слушает отдельный порт в фоновом потоке
+    def __init__(self, registry, listen='127.0.0.1', port=9108):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._server = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, name='MetricsServer', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
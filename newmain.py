@@ -2,35 +2,227 @@ import telebot
 from telebot import types
 import os
 import logging
-from config import PAYMENT_TOKEN, ADMIN_ID
+import time
+from telebot import apihelper
+from config import (PAYMENT_TOKEN, ADMIN_ID, ERROR_REPORT_ID, ADMIN_DIGEST_WINDOWS, ADMIN_DIGEST_JOURNAL,
+                    ORDER_STORE, ORDER_DB_PATH, ORDER_TTL, INVOICE_TTL,
+                    INTAKE_DIR, INTAKE_WORKERS, INTAKE_MAX_PENDING, MAX_FILE_SIZE,
+                    UPLOAD_CACHE_DIR, UPLOAD_CACHE_SIZE, VOLUME_DISCOUNTS,
+                    PAYMENT_LEDGER_DIR, PAYMENT_LEDGER_SEGMENT_SIZE,
+                    LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_ROTATE_INTERVAL, LOG_QUEUE_SIZE,
+                    WORKERS_MIN, WORKERS_MAX, WORKER_IDLE_TIMEOUT,
+                    WORKERS_RESERVED, PAYMENT_LANE_BUDGET, CHAT_LANE_BUDGET,
+                    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_WORKERS,
+                    OUTBOX_DIR, OUTBOX_SEGMENT_SIZE, OUTBOX_SYNC_INTERVAL, OUTBOX_RETRY_MAX_DELAY, OUTBOX_MAX_AGE,
+                    HTTP_POOLED_TRANSPORT, HTTP_POOL_TIMEOUT, HTTP_PREWARM,
+                    API_RETRY_ATTEMPTS, API_RETRY_BASE_DELAY, API_RETRY_MAX_DELAY, API_RETRY_BUDGET_RATIO,
+                    API_RETRY_MAX_WAITING, API_BREAKER_FAILURES, API_BREAKER_RESET, API_BREAKER_MAX_RESET,
+                    WEBHOOK_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_QUEUE_SIZE, LAZY_UPDATES,
+                    METRICS_LISTEN, METRICS_PORT)
+from order_store import create_order_store
+from order_model import OrderFile, PaperFormat, PrintType, Side
+from payment_ledger import PaymentLedger, payment_entry
+from invoices import create_invoice_index, InvoiceRejected
+from file_intake import FileIntake, FileTooLarge, IntakeBusy, remove_file, sweep_orphans
+from page_counter import PageCounter
+from upload_cache import UploadCache
+from pricing import prices, PriceTable, format_rub
+from text_router import TextRouter
+from bot_logging import setup_logging, user_fields, dropped_records
+from order_states import OrderStates, OrderStateStorage, check_transition, check_step
+from order_flow import (MAX_PAGE_COUNT, parse_page_count, needs_sides, file_pages, sides_after_file,
+                        page_count_notice, confirmable, order_total, summary_text, invoice_description,
+                        invoice_error_report, payment_texts)
+from telebot.custom_filters import StateFilter
+from webhook import WebhookReceiver
+from outbound import OutboundScheduler, PAYMENT, ORDER, ADMIN
+from outbox import Outbox
+from admin_notify import AdminNotifier, error_fingerprint
+from chat_executor import ChatExecutor
+from metrics import Registry, MetricsServer, instrument_handlers, instrument_api
+from lazy_types import LazyUpdate, use_lazy_updates
+from transport import PooledTransport
+from resilience import ResilientApi, RetryBudget, STATE_CODES
 
 # Настройки логирования
-logging.basicConfig(
-    level=logging.INFO,
-    filename='bot.log',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+setup_logging(
+    LOG_FILE,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    rotate_interval=LOG_ROTATE_INTERVAL,
+    queue_size=LOG_QUEUE_SIZE
 )
 logger = logging.getLogger(__name__)
 
-# Инициализация бота
-bot = telebot.TeleBot(os.getenv('TELEGRAM_TOKEN'))
+# Файл заказа лежит в INTAKE_DIR, пока жив черновик, а после подтверждения -
+# пока не оплачен или не истёк счёт
+def discard_order_file(order):
+    if order is not None and order.file:
+        remove_file(order.file.path)
+
+def discard_invoice_file(invoice):
+    if invoice is not None:
+        remove_file(invoice.get('file_path'))
+
+# База данных заказов, в ней же хранится текущий шаг разговора
+if ORDER_STORE == 'sqlite':
+    orders = create_order_store('sqlite', path=ORDER_DB_PATH, ttl=ORDER_TTL, on_expire=discard_order_file)
+else:
+    orders = create_order_store('memory', ttl=ORDER_TTL, on_expire=discard_order_file)
+
+# Выставленные счета: снимок заказа по invoice_payload
+if ORDER_STORE == 'sqlite':
+    invoices = create_invoice_index('sqlite', path=ORDER_DB_PATH, ttl=INVOICE_TTL, on_expire=discard_invoice_file)
+else:
+    invoices = create_invoice_index('memory', ttl=INVOICE_TTL, on_expire=discard_invoice_file)
+
+# Журнал оплаченных заказов
+ledger = PaymentLedger(PAYMENT_LEDGER_DIR, segment_size=PAYMENT_LEDGER_SEGMENT_SIZE)
+
+# Общие соединения с Bot API: пул вызовов API на все потоки, которые ходят в API
+# (отправка, обработчики, скачивание файлов спрашивает getFile), свой пул для
+# long polling и для файлов
+transport = None
+if HTTP_POOLED_TRANSPORT:
+    transport = PooledTransport(
+        api_pool_size=OUTBOUND_WORKERS + WORKERS_MAX + INTAKE_WORKERS,
+        updates_pool_size=1,
+        files_pool_size=INTAKE_WORKERS,
+        pool_timeout=HTTP_POOL_TIMEOUT
+    ).install()
+
+# Инициализация бота. Middleware нужен, чтобы отметить время получения сообщения
+apihelper.ENABLE_MIDDLEWARE = True
+# Вместо встроенного пула из двух потоков - исполнитель с очередью на каждый чат
+bot = telebot.TeleBot(os.getenv('TELEGRAM_TOKEN'), threaded=False, state_storage=OrderStateStorage(orders))
+executor = ChatExecutor(
+    bot,
+    min_workers=WORKERS_MIN,
+    max_workers=WORKERS_MAX,
+    idle_timeout=WORKER_IDLE_TIMEOUT,
+    reserved_workers=WORKERS_RESERVED,
+    payment_budget=PAYMENT_LANE_BUDGET,
+    chat_budget=CHAT_LANE_BUDGET
+)
+bot.add_custom_filter(StateFilter(bot))
+if LAZY_UPDATES:
+    use_lazy_updates(bot)
+
+# Исходящие сообщения идут через очередь с учётом лимитов Telegram,
+# обработчик получает Future и сразу освобождает поток
+outbound = OutboundScheduler(
+    global_rate=OUTBOUND_GLOBAL_RATE,
+    chat_rate=OUTBOUND_CHAT_RATE,
+    chat_burst=OUTBOUND_CHAT_BURST,
+    workers=OUTBOUND_WORKERS
+)
+
+# Перед очередью - журнал на диске: сообщение не теряется при сбое сети или
+# перезапуске бота, после перезапуска недоставленные уходят снова
+outbox = Outbox(
+    bot,
+    outbound,
+    directory=OUTBOX_DIR,
+    segment_size=OUTBOX_SEGMENT_SIZE,
+    sync_interval=OUTBOX_SYNC_INTERVAL,
+    max_delay=OUTBOX_RETRY_MAX_DELAY,
+    max_age=OUTBOX_MAX_AGE
+)
+
+def send(chat_id, text, priority=ORDER, **kwargs):
+    return outbox.submit('send_message', chat_id, text, priority=priority, **kwargs)
+
+# Уведомления администратору копятся и уходят сводками. Накопленное лежит в
+# журнале на диске, а отданная сводка - уже в журнале исходящих
+admin = AdminNotifier(
+    lambda chat_id, text: send(chat_id, text, priority=ADMIN),
+    windows=ADMIN_DIGEST_WINDOWS,
+    path=ADMIN_DIGEST_JOURNAL
+)
+
+# Метрики: запись в счётчики и гистограммы идёт без блокировок, чтение - по HTTP
+registry = Registry()
+handler_latency = registry.histogram('bot_handler_seconds', "Время работы обработчика", labels=('handler',))
+api_latency = registry.histogram('bot_api_request_seconds', "Время запроса к Bot API", labels=('method',))
+api_errors = registry.counter('bot_api_errors', "Ошибки запросов к Bot API", labels=('method', 'code'))
+# date в сообщении - целые секунды, точнее секунды задержку не увидеть
+update_lag = registry.histogram('bot_update_lag_seconds', "От отправки сообщения клиентом до получения ботом",
+                                buckets=(0.5, 1, 2, 5, 10, 30, 60, 300))
+invoice_count = registry.counter('bot_invoices', "Выставленные счета", labels=('result',))
+pre_checkout_count = registry.counter('bot_pre_checkouts', "Ответы на pre-checkout", labels=('result',))
+payment_count = registry.counter('bot_payments', "Полученные платежи", labels=('result',))
+registry.gauge('bot_draft_orders', "Черновики заказов", lambda: len(orders))
+registry.gauge('bot_abandoned_orders', "Черновики, удалённые по ORDER_TTL с запуска", lambda: orders.purged)
+registry.gauge('bot_open_invoices', "Выставленные и ещё не оплаченные счета", lambda: len(invoices))
+registry.gauge('bot_worker_queue_depth', "Задачи в очереди исполнителя", lambda: executor.stats()['queued'])
+registry.gauge('bot_workers', "Потоки исполнителя", lambda: {
+    (state,): value for state, value in executor.stats().items() if state in ('running', 'idle')
+}, labels=('state',))
+registry.gauge('bot_log_dropped', "Записи лога, отброшенные из-за переполненной очереди", dropped_records)
+registry.gauge('bot_outbound_pending', "Исходящие сообщения в очереди", lambda: outbound.stats()['pending'])
+registry.gauge('bot_outbox_pending', "Недоставленные сообщения в журнале исходящих", lambda: outbox.stats()['pending'])
+registry.gauge('bot_outbox_dropped', "Сообщения, которые Telegram не принял (4xx или старше OUTBOX_MAX_AGE)",
+               lambda: outbox.stats()['dropped'])
+if transport is not None:
+    registry.gauge('bot_http_connections', "Соединения с Bot API: открыто с запуска и свободно сейчас", lambda: {
+        (pool, state): row[state] for pool, row in transport.stats().items() for state in ('opened', 'idle')
+    }, labels=('pool', 'state'))
+instrument_api(api_latency, api_errors)
+# Повторы и предохранители - поверх замера, чтобы время писалось по каждой попытке
+api_retries = registry.counter('bot_api_retries', "Повторы запросов к Bot API", labels=('method', 'reason'))
+api_rejected = registry.counter('bot_api_breaker_rejected', "Вызовы, отклонённые предохранителем", labels=('method',))
+resilience = ResilientApi(
+    attempts=API_RETRY_ATTEMPTS,
+    base_delay=API_RETRY_BASE_DELAY,
+    max_delay=API_RETRY_MAX_DELAY,
+    budget=RetryBudget(ratio=API_RETRY_BUDGET_RATIO, max_waiting=API_RETRY_MAX_WAITING),
+    failure_threshold=API_BREAKER_FAILURES,
+    reset_timeout=API_BREAKER_RESET,
+    max_reset_timeout=API_BREAKER_MAX_RESET,
+    retries=api_retries,
+    rejected=api_rejected
+).install()
+registry.gauge('bot_api_breaker_state', "Предохранитель метода: 0 - замкнут, 1 - проба, 2 - разомкнут", lambda: {
+    (method,): STATE_CODES[row['state']] for method, row in resilience.stats()['methods'].items()
+}, labels=('method',))
+registry.gauge('bot_api_retry_waiting', "Потоки, ждущие повтора запроса", lambda: resilience.stats()['budget']['waiting'])
+
+@bot.middleware_handler(update_types=['message'])
+def mark_received(bot_instance, message):
+    # От этой отметки считается latency_ms в логах
+    message.received_at = time.monotonic()
+    update_lag.observe(max(0, time.time() - message.date))
+intake = FileIntake(
+    bot.token,
+    directory=INTAKE_DIR,
+    max_workers=INTAKE_WORKERS,
+    max_pending=INTAKE_MAX_PENDING,
+    max_size=MAX_FILE_SIZE,
+    transport=transport
+)
+uploads = UploadCache(UPLOAD_CACHE_DIR, max_bytes=UPLOAD_CACHE_SIZE)
+# Кнопки клавиатуры: поиск обработчика по точному тексту. Подключаются к боту
+# в конце файла, после обработчиков шагов: пока бот ждёт число, файл или
+# комментарий, текст кнопки тоже идёт в шаг
+buttons = TextRouter()
 
 # Вспомогательные функции для логирования
-def log_user_action(message, action):
-    user = message.from_user
-    logger.info(f"UserID:{user.id} ChatID:{message.chat.id} Username:@{user.username} - {action}")
-
-def log_user_error(message, error):
-    user = message.from_user
-    logger.error(f"UserID:{user.id} ChatID:{message.chat.id} Username:@{user.username} - ERROR: {error}")
-
-# База данных и цены
-orders = {}
-prices = {
-    'чб': {'односторонняя': 10, 'двухсторонняя': 15},
-    'цветная': {'односторонняя': 20, 'двухсторонняя': 30},
-    'формат': {'A5': 1, 'A4': 1.5, 'A3': 2, 'A2': 3}
-}
+def log_user_action(message, action, order_id=None):
+    logger.info(action, extra=user_fields(message, action=action, order_id=order_id))
+
+def log_user_error(message, error, order_id=None):
+    logger.error(error, extra=user_fields(message, order_id=order_id))
+
+# Шаги заказа
+def set_step(message, state):
+    current = bot.get_state(message.from_user.id, message.chat.id)
+    bot.set_state(message.from_user.id, check_transition(current, state), message.chat.id)
+
+def expect_step(message, state):
+    check_step(bot.get_state(message.from_user.id, message.chat.id), state)
+
+# Цены
+price_table = PriceTable(prices, VOLUME_DISCOUNTS)
 
 # ===== ОСНОВНЫЕ КОМАНДЫ =====
 @bot.message_handler(commands=['start'])
@@ -38,7 +230,7 @@ def start(message):
     try:
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add('🖨 Начать заказ')
-        bot.send_message(
+        send(
             message.chat.id,
             "Добро пожаловать в сервис печати от Володи!",
             reply_markup=markup
@@ -48,11 +240,13 @@ def start(message):
         log_user_error(message, f"Ошибка в команде /start: {str(e)}")
 
 # ===== СИСТЕМА ЗАКАЗА =====
-@bot.message_handler(func=lambda m: m.text == '🖨 Начать заказ')
+@buttons.handler('🖨 Начать заказ')
 def start_order(message):
     try:
         chat_id = message.chat.id
-        orders[chat_id] = {}
+        # Новый заказ заменяет недооформленный, его файл больше не нужен
+        discard_order_file(orders.delete(chat_id))
+        orders.create(chat_id)
         ask_color_type(message)
         log_user_action(message, "Начал оформление заказа")
     except Exception as e:
@@ -61,14 +255,16 @@ def start_order(message):
 def ask_color_type(message):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add('Черно-белая', 'Цветная')
-    bot.send_message(message.chat.id, "Выберите тип печати:", reply_markup=markup)
+    send(message.chat.id, "Выберите тип печати:", reply_markup=markup)
+    set_step(message, OrderStates.color)
 
-@bot.message_handler(func=lambda m: m.text in ['Черно-белая', 'Цветная'])
+@buttons.handler('Черно-белая', 'Цветная')
 def select_color_type(message):
     try:
         chat_id = message.chat.id
-        color_type = 'чб' if message.text == 'Черно-белая' else 'цветная'
-        orders[chat_id]['type'] = color_type
+        expect_step(message, OrderStates.color)
+        color_type = PrintType.BW if message.text == 'Черно-белая' else PrintType.COLOR
+        orders.update(chat_id, type=color_type)
         log_user_action(message, f"Выбрал тип печати: {color_type}")
         ask_page_count(message)
     except Exception as e:
@@ -77,51 +273,52 @@ def select_color_type(message):
 def ask_page_count(message):
     try:
         markup = types.ReplyKeyboardRemove()
-        msg = bot.send_message(
+        send(
             message.chat.id,
             "Введите количество страниц (число):",
             reply_markup=markup
         )
-        bot.register_next_step_handler(msg, process_page_count)
+        set_step(message, OrderStates.pages)
     except Exception as e:
         log_user_error(message, f"Ошибка запроса количества страниц: {str(e)}")
 
+@bot.message_handler(state=OrderStates.pages, content_types=['text', 'document', 'photo'])
 def process_page_count(message):
     try:
         chat_id = message.chat.id
-        page_count = int(message.text)
-        if page_count <= 0:
-            raise ValueError("Некорректное количество страниц")
+        page_count = parse_page_count(message.text)
         
-        orders[chat_id]['page_count'] = page_count
+        orders.update(chat_id, page_count=page_count)
         log_user_action(message, f"Указал количество страниц: {page_count}")
         ask_format(message)
     except Exception as e:
         log_user_error(message, f"Ошибка обработки количества страниц: {str(e)}")
-        bot.send_message(chat_id, "Пожалуйста, введите корректное число!")
+        send(chat_id, f"Пожалуйста, введите число от 1 до {MAX_PAGE_COUNT}!")
         ask_page_count(message)
 
 def ask_format(message):
     try:
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add('A5', 'A4', 'A3', 'A2')
-        bot.send_message(
+        send(
             message.chat.id,
             "Выберите формат бумаги:",
             reply_markup=markup
         )
+        set_step(message, OrderStates.format)
     except Exception as e:
         log_user_error(message, f"Ошибка запроса формата бумаги: {str(e)}")
 
-@bot.message_handler(func=lambda m: m.text in ['A5', 'A4', 'A3', 'A2'])
+@buttons.handler('A5', 'A4', 'A3', 'A2')
 def select_format(message):
     try:
         chat_id = message.chat.id
-        paper_format = message.text
-        orders[chat_id]['format'] = paper_format
+        expect_step(message, OrderStates.format)
+        paper_format = PaperFormat.parse(message.text)
+        order = orders.update(chat_id, format=paper_format)
         log_user_action(message, f"Выбрал формат бумаги: {paper_format}")
         
-        if orders[chat_id]['page_count'] > 1:
+        if needs_sides(order):
             ask_side_type(message)
         else:
             ask_file(message)
@@ -132,73 +329,154 @@ def ask_side_type(message):
     try:
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add('Односторонняя', 'Двухсторонняя')
-        bot.send_message(
+        send(
             message.chat.id,
             "Выберите тип печати:",
             reply_markup=markup
         )
+        set_step(message, OrderStates.sides)
     except Exception as e:
         log_user_error(message, f"Ошибка запроса типа печати: {str(e)}")
 
-@bot.message_handler(func=lambda m: m.text in ['Односторонняя', 'Двухсторонняя'])
+@buttons.handler('Односторонняя', 'Двухсторонняя')
 def select_side_type(message):
     try:
         chat_id = message.chat.id
-        side_type = message.text.lower()
-        orders[chat_id]['side'] = side_type
+        expect_step(message, OrderStates.sides)
+        side_type = Side.parse(message.text)
+        order = orders.update(chat_id, side=side_type)
         log_user_action(message, f"Выбрал тип печати: {side_type}")
-        ask_file(message)
+        # Стороны спрошены после файла (страниц в нём оказалось больше)
+        if order.file:
+            ask_comment(message)
+        else:
+            ask_file(message)
     except Exception as e:
         log_user_error(message, f"Ошибка выбора типа печати: {str(e)}")
 
 def ask_file(message):
     try:
-        markup = types.ReplyKeyboardRemove()
-        msg = bot.send_message(
+        send(
             message.chat.id,
             "Пожалуйста, прикрепите файл для печати (PDF, DOCX, JPG):"
         )
-        bot.register_next_step_handler(msg, process_file)
+        set_step(message, OrderStates.file)
     except Exception as e:
         log_user_error(message, f"Ошибка запроса файла: {str(e)}")
 
+@bot.message_handler(state=OrderStates.file, content_types=['text', 'document', 'photo'])
 def process_file(message):
     try:
         chat_id = message.chat.id
         if message.document:
-            file_info = bot.get_file(message.document.file_id)
-            downloaded_file = bot.download_file(file_info.file_path)
-            
-            orders[chat_id]['file'] = {
-                'file_name': message.document.file_name,
-                'file_id': message.document.file_id
-            }
-            log_user_action(message, f"Загрузил файл: {message.document.file_name}")
-            ask_comment(message)
+            # Этот файл уже присылали - берём его и анализ из кеша без обращения к Telegram
+            path, cached = uploads.checkout(message.document.file_unique_id, INTAKE_DIR)
+            if cached:
+                attach_file(message, path, cached['analysis'])
+                return
+
+            # Скачивание идёт в пуле приёма файлов, продолжаем заказ по его окончании.
+            # Страницы считаются прямо по ходу скачивания.
+            counter = PageCounter(message.document.file_name)
+            future = intake.submit(
+                message.document.file_id,
+                file_size=message.document.file_size,
+                file_name=message.document.file_name,
+                on_chunk=counter.feed
+            )
+            # Продолжение заказа встаёт в очередь того же чата, а не выполняется в потоке загрузки
+            future.add_done_callback(lambda f: executor.put(process_downloaded_file, message, f, counter))
         else:
-            bot.send_message(chat_id, "Пожалуйста, прикрепите файл!")
+            send(chat_id, "Пожалуйста, прикрепите файл!")
             ask_file(message)
+    except FileTooLarge as e:
+        log_user_error(message, f"Слишком большой файл: {str(e)}")
+        send(chat_id, f"Файл слишком большой. Максимум {MAX_FILE_SIZE // (1024 * 1024)} МБ.")
+        ask_file(message)
+    except IntakeBusy as e:
+        log_user_error(message, f"Очередь загрузок переполнена: {str(e)}")
+        send(chat_id, "Сейчас загружается много файлов. Отправьте файл ещё раз через минуту.")
+        ask_file(message)
     except Exception as e:
         log_user_error(message, f"Ошибка обработки файла: {str(e)}")
 
+def process_downloaded_file(message, future, counter):
+    try:
+        chat_id = message.chat.id
+        path = future.result()
+        try:
+            analysis = counter.finish(path)
+            uploads.put(message.document.file_unique_id, path, analysis)
+        except Exception:
+            # Файл не разобрался и в заказ не попадёт
+            remove_file(path)
+            raise
+        attach_file(message, path, analysis)
+    except FileTooLarge as e:
+        log_user_error(message, f"Слишком большой файл: {str(e)}")
+        send(chat_id, f"Файл слишком большой. Максимум {MAX_FILE_SIZE // (1024 * 1024)} МБ.")
+        ask_file(message)
+    except Exception as e:
+        log_user_error(message, f"Ошибка загрузки файла: {str(e)}")
+        send(chat_id, "Не удалось загрузить файл, попробуйте ещё раз.")
+        ask_file(message)
+
+def attach_file(message, path, analysis):
+    previous = orders.get(message.chat.id)
+    try:
+        orders.update(message.chat.id, file=OrderFile(
+            message.document.file_name,
+            message.document.file_id,
+            path,
+            analysis['kind'],
+            file_pages(analysis)
+        ))
+    except Exception:
+        # Черновик отменён или удалён по ORDER_TTL, пока файл качался
+        remove_file(path)
+        raise
+    # Клиент прислал файл ещё раз, пока качался первый: остаётся последний
+    if previous is not None and previous.file and previous.file.path != path:
+        remove_file(previous.file.path)
+    log_user_action(message, f"Загрузил файл: {message.document.file_name}")
+    if verify_page_count(message, analysis):
+        ask_side_type(message)
+    else:
+        ask_comment(message)
+
+def verify_page_count(message, analysis):
+    # Сверяем указанное клиентом количество страниц с документом, картинки не трогаем.
+    # True - нужно спросить стороны печати
+    pages = file_pages(analysis)
+    if pages is None:
+        return False
+    chat_id = message.chat.id
+    order = orders[chat_id]
+    if order.page_count != pages:
+        orders.update(chat_id, page_count=pages)
+        log_user_action(message, f"Количество страниц исправлено по файлу: {order.page_count} -> {pages}")
+        send(chat_id, page_count_notice(pages))
+    return sides_after_file(order, pages)
+
 def ask_comment(message):
     try:
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add('Пропустить')
-        msg = bot.send_message(
+        send(
             message.chat.id,
             "Хотите добавить комментарий к заказу?",
             reply_markup=markup
         )
-        bot.register_next_step_handler(msg, process_comment)
+        set_step(message, OrderStates.comment)
     except Exception as e:
         log_user_error(message, f"Ошибка запроса комментария: {str(e)}")
 
+@bot.message_handler(state=OrderStates.comment, content_types=['text', 'document', 'photo'])
 def process_comment(message):
     try:
         chat_id = message.chat.id
         if message.text != 'Пропустить':
-            orders[chat_id]['comment'] = message.text
+            orders.update(chat_id, comment=message.text)
             log_user_action(message, f"Добавил комментарий: {message.text}")
         else:
             log_user_action(message, "Пропустил добавление комментария")
@@ -212,88 +490,100 @@ def show_order_summary(message):
         chat_id = message.chat.id
         order = orders[chat_id]
         
-        # Расчет стоимости
-        base_price = prices[order['type']].get(order.get('side', 'односторонняя'), 10)
-        format_multiplier = prices['формат'][order['format']]
-        total = base_price * order['page_count'] * format_multiplier
-        
-        text = (f"📝 Ваш заказ:\n"
-               f"Тип: {order['type']}\n"
-               f"Страниц: {order['page_count']}\n"
-               f"Формат: {order['format']}\n")
-        
-        if order.get('side'):
-            text += f"Тип печати: {order['side']}\n"
-        
-        text += f"Файл: {order['file']['file_name']}\n"
-        
-        if order.get('comment'):
-            text += f"Комментарий: {order['comment']}\n"
-        
-        text += f"\nИтого: {total} руб."
+        # Расчет стоимости (в копейках), сохраняется в заказе для оплаты
+        total = price_table.quote(order)
+        orders.update(chat_id, total=total)
         
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
         markup.add('✅ Подтвердить заказ', '❌ Отменить')
-        bot.send_message(chat_id, text, reply_markup=markup)
+        send(chat_id, summary_text(order, total), reply_markup=markup)
+        set_step(message, OrderStates.summary)
         
-        log_user_action(message, f"Показал итог заказа. Сумма: {total} руб.")
+        log_user_action(message, f"Показал итог заказа. Сумма: {format_rub(total)}")
     except Exception as e:
         log_user_error(message, f"Ошибка показа итогов заказа: {str(e)}")
 
 # ===== ОПЛАТА И КОРЗИНА =====
-@bot.message_handler(func=lambda m: m.text == '✅ Подтвердить заказ')
+@buttons.handler('✅ Подтвердить заказ')
 def confirm_order(message):
     try:
         chat_id = message.chat.id
         order = orders.get(chat_id)
         
-        if not order:
-            bot.send_message(chat_id, "Ошибка: заказ не найден")
+        if not confirmable(order):
+            send(chat_id, "Ошибка: заказ не найден")
             return
         
-        # Расчет стоимости
-        base_price = prices[order['type']].get(order.get('side', 'односторонняя'), 10)
-        format_multiplier = prices['формат'][order['format']]
-        total = int(base_price * order['page_count'] * format_multiplier * 100)  # Важно: целое число в копейках
+        total = order_total(order, price_table)  # Важно: целое число в копейках
+        
+        # Счёт получает свой номер и снимок заказа; черновик освобождается,
+        # и можно оформлять следующий заказ, не оплатив этот
+        invoice = invoices.issue(chat_id, message.from_user.id, order, total, currency="RUB")
         
         # Получаем токен из конфига
         provider_token =PAYMENT_TOKEN  
         
-        bot.send_invoice(
+        future = outbox.submit(
+            'send_invoice',
             chat_id,
             title="Оплата печати",
-            description=f"{order['type']} печать, {order['format']}",
-            invoice_payload=f"order_{chat_id}",
+            description=invoice_description(order),
+            invoice_payload=invoice['payload'],
             provider_token=provider_token,
             start_parameter="print_order",
             currency="RUB",
             prices=[types.LabeledPrice("Печать", total)],
             need_email=True,
-            need_phone_number=True
+            need_phone_number=True,
+            priority=PAYMENT
         )
+        future.add_done_callback(lambda f: invoice_sent(message, invoice, f))
+        orders.delete(chat_id)
+        log_user_action(message, f"Выставлен счёт на {format_rub(total)}", order_id=invoice['order_id'])
         
     except Exception as e:
-        logger.error(f"Ошибка создания инвойса: {str(e)}", exc_info=True)
-        bot.send_message(chat_id, "Извините, произошла ошибка. Мы уже работаем над её устранением.")
-        
-        # Отправляем уведомление себе
-        bot.send_message(
-            931928744,  # Ваш ID
-            f"⚠️ Ошибка оплаты у @{message.from_user.username}:\n{str(e)}"
-        )
+        invoice_failed(message, e)
+
+def invoice_sent(message, invoice, future):
+    # Счёт уходит в фоне; если Telegram его не принял, оплатить его нельзя
+    error = future.exception()
+    if error is not None:
+        discard_invoice_file(invoices.delete(invoice['payload']))
+        invoice_failed(message, error)
+    else:
+        invoice_count.labels('sent').inc()
+
+def invoice_failed(message, e):
+    invoice_count.labels('failed').inc()
+    logger.error(f"Ошибка создания инвойса: {str(e)}", exc_info=e)
+    send(message.chat.id, "Извините, произошла ошибка. Мы уже работаем над её устранением.")
+    
+    # Отправляем уведомление себе; одинаковые ошибки попадут в сводку одной строкой
+    text, summary = invoice_error_report(message.from_user.username, e)
+    admin.post(ERROR_REPORT_ID, 'error', text, fingerprint=error_fingerprint(e), summary=summary)
 
 @bot.pre_checkout_query_handler(func=lambda query: True)
 def process_pre_checkout(pre_checkout_query):
     try:
         user_id = pre_checkout_query.from_user.id
-        if user_id in orders:
-            bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
-            logger.info(f"UserID:{user_id} - Подтвержден pre-checkout запрос")
+        try:
+            invoice = invoices.verify(
+                pre_checkout_query.invoice_payload,
+                user_id,
+                pre_checkout_query.total_amount,
+                pre_checkout_query.currency
+            )
+        except InvoiceRejected as e:
+            bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False, error_message=str(e))
+            pre_checkout_count.labels('rejected').inc()
+            logger.error(f"Недействительный pre-checkout запрос: {str(e)}", extra={'user_id': user_id})
         else:
-            bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False,
-                                      error_message="Заказ не найден или устарел")
-            logger.error(f"UserID:{user_id} - Недействительный pre-checkout запрос")
+            bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True)
+            pre_checkout_count.labels('ok').inc()
+            logger.info("Подтвержден pre-checkout запрос",
+                        extra={'user_id': user_id, 'order_id': invoice['order_id']})
     except Exception as e:
+        pre_checkout_count.labels('error').inc()
         logger.error(f"Ошибка обработки pre-checkout: {str(e)}")
         bot.answer_pre_checkout_query(pre_checkout_query.id, ok=False,
                                   error_message="Произошла ошибка")
@@ -302,80 +592,92 @@ def process_pre_checkout(pre_checkout_query):
 def process_successful_payment(message):
     try:
         chat_id = message.chat.id
-        order = orders.get(chat_id)
+        payment = message.successful_payment
+        invoice = invoices.get(payment.invoice_payload)
         
-        if not order:
-            bot.send_message(chat_id, "Ошибка: данные заказа не найдены")
-            log_user_error(message, "Оплата без сохраненного заказа")
+        # Сначала платёж попадает в журнал, уведомления - после него. Если Telegram
+        # доставит то же обновление повторно, запись уже есть: уведомления
+        # отправляются, только если в прошлый раз до них не дошло
+        entry, created = ledger.record(payment_entry(message, invoice))
+        if not created and ledger.notified(entry['charge_id']):
+            payment_count.labels('duplicate').inc()
+            log_user_action(message, f"Повторная доставка платежа {payment.telegram_payment_charge_id}",
+                            order_id=entry['order_id'])
             return
         
-        # Расчет стоимости
-        base_price = prices[order['type']].get(order.get('side', 'односторонняя'), 10)
-        format_multiplier = prices['формат'][order['format']]
-        total = base_price * order['page_count'] * format_multiplier
+        if not entry['order']:
+            payment_count.labels('unknown_invoice').inc()
+            send(chat_id, "Ошибка: данные заказа не найдены")
+            log_user_error(message, f"Оплата без сохраненного счёта: {payment.invoice_payload}")
+            ledger.mark_notified(entry['charge_id'])
+            return
         
-        email = message.successful_payment.order_info.email or "не указан"
-        phone = getattr(message.successful_payment.order_info, 'phone_number', "не указан")
+        payment_count.labels('recorded' if created else 'resumed').inc()
+        # Текст уведомлений - из записи журнала: при повторной доставке счёта уже может не быть
+        customer_text, owner_text, summary = payment_texts(entry)
         
         # Уведомление пользователю
-        bot.send_message(
-            chat_id,
-            f"✅ Оплата прошла успешно!\n\n"
-            f"Детали заказа:\n"
-            f"Тип: {order['type']}\n"
-            f"Стороны: {order['side']}\n"
-            f"Сумма: {total} руб.\n"
-            f"Email: {email}\n"
-            f"Телефон: {phone}\n\n"
-            f"Ваш заказ передан в работу!",
-            reply_markup=types.ReplyKeyboardRemove()
-        )
+        send(chat_id, customer_text, reply_markup=types.ReplyKeyboardRemove(), priority=PAYMENT)
         
         # Уведомление владельцу 
-        owner_id = ADMIN_ID
-        bot.send_message(
-            owner_id,
-            f"💰 Новый оплаченный заказ!\n"
-            f"От: @{message.from_user.username}\n"
-            f"Тип: {order['type']}\n"
-            f"Стороны: {order['side']}\n"
-            f"Сумма: {total} руб.\n"
-            f"Email: {email}\n"
-            f"Телефон: {phone}\n"
-            f"ID платежа: {message.successful_payment.telegram_payment_charge_id}"
-        )
+        admin.post(ADMIN_ID, 'payment', owner_text, summary=summary)
+        ledger.mark_notified(entry['charge_id'])
         
-        log_user_action(message, f"Успешная оплата заказа. Сумма: {total} руб.")
+        log_user_action(message, f"Успешная оплата заказа. Сумма: {format_rub(entry['amount'])}",
+                        order_id=entry['order_id'])
         
-        # Очистка заказа
-        if chat_id in orders:
-            del orders[chat_id]
+        # Счёт оплачен, повторно оплатить его нельзя
+        discard_invoice_file(invoices.delete(payment.invoice_payload))
     except Exception as e:
         log_user_error(message, f"Ошибка обработки оплаты: {str(e)}")
 
-@bot.message_handler(func=lambda m: m.text == '❌ Отменить')
+@buttons.handler('❌ Отменить')
 def cancel_order(message):
     try:
         chat_id = message.chat.id
-        if chat_id in orders:
-            del orders[chat_id]
-        bot.send_message(chat_id, "Заказ отменен", reply_markup=types.ReplyKeyboardRemove())
+        discard_order_file(orders.delete(chat_id))
+        send(chat_id, "Заказ отменен", reply_markup=types.ReplyKeyboardRemove())
         start(message)
         log_user_action(message, "Отменил заказ")
     except Exception as e:
         log_user_error(message, f"Ошибка отмены заказа: {str(e)}")
 
-@bot.message_handler(func=lambda m: m.text == '✏️ Изменить')
+@buttons.handler('✏️ Изменить')
 def edit_order(message):
     try:
         chat_id = message.chat.id
-        if chat_id in orders:
-            del orders[chat_id]
+        discard_order_file(orders.delete(chat_id))
         start_order(message)
         log_user_action(message, "Редактирование заказа")
     except Exception as e:
         log_user_error(message, f"Ошибка редактирования заказа: {str(e)}")
 
+buttons.attach(bot)
+# Замер времени каждого обработчика - после того, как все они зарегистрированы
+instrument_handlers(bot, handler_latency, routers=(buttons,))
+
 if __name__ == '__main__':
     logger.info("===== БОТ ЗАПУЩЕН =====")
-    bot.polling(none_stop=True)
\ No newline at end of file
+    # Файлы, оставшиеся от заказов до перезапуска или падения
+    removed = sweep_orphans(INTAKE_DIR, orders.file_paths() | invoices.file_paths())
+    if removed:
+        logger.info(f"Удалено файлов без заказа: {removed}")
+    orders.start_sweeper()
+    invoices.start_sweeper()
+    if METRICS_PORT is not None:
+        MetricsServer(registry, listen=METRICS_LISTEN, port=METRICS_PORT).start()
+    if transport is not None and HTTP_PREWARM:
+        # В режиме вебхука getUpdates не вызывается, его соединение не нужно
+        opened = transport.prewarm(bot.token, api=HTTP_PREWARM, updates=0 if WEBHOOK_MODE else 1)
+        logger.info(f"Открыто соединений с Bot API: {opened}")
+    if WEBHOOK_MODE:
+        WebhookReceiver(
+            bot,
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            secret_token=WEBHOOK_SECRET,
+            queue_size=WEBHOOK_QUEUE_SIZE,
+            update_class=LazyUpdate if LAZY_UPDATES else types.Update
+        ).run(WEBHOOK_URL)
+    else:
+        bot.polling(none_stop=True)
\ No newline at end of file
@@ -0,0 +1,107 @@
+from order_states import OrderStates
+from pricing import format_rub
+
+
+# ===== СЦЕНАРИЙ ЗАКАЗА =====
+# Решения и тексты сценария, общие для newmain.py и asyncmain.py. Версии бота
+# отличаются только тем, как ходят в Telegram и в хранилища; что спросить
+# дальше и что написать клиенту, решается здесь.
+
+# Больше страниц в одном заказе не принимается. Заодно число помещается в
+# двоичный заказ (order_model: страниц заказа - 4 байта без знака, файла - со знаком)
+MAX_PAGE_COUNT = 10000
+
+
+def parse_page_count(text):
+    # Количество страниц из ответа клиента; ValueError - спросить ещё раз
+    page_count = int(text)
+    if not 0 < page_count <= MAX_PAGE_COUNT:
+        raise ValueError(f"Количество страниц должно быть от 1 до {MAX_PAGE_COUNT}")
+    return page_count
+
+
+def needs_sides(order):
+    # Стороны спрашиваются только у заказов больше чем в одну страницу
+    return order.page_count > 1
+
+
+def file_pages(analysis):
+    # Страницы документа для сверки с заказом; у картинок и файлов, которые
+    # не удалось разобрать, - None, их не сверяем. Больше MAX_PAGE_COUNT
+    # страниц - испорченный или подделанный /Count, такое число тоже не берём
+    if analysis['kind'] not in ('pdf', 'docx') or not analysis['pages']:
+        return None
+    if analysis['pages'] > MAX_PAGE_COUNT:
+        return None
+    return analysis['pages']
+
+
+def sides_after_file(order, pages):
+    # Клиент указал одну страницу, а в файле больше: стороны спрашиваются сейчас
+    return pages > 1 and order.side is None
+
+
+def page_count_notice(pages):
+    return f"В файле {pages} стр. — стоимость будет рассчитана по файлу."
+
+
+def confirmable(order):
+    # Подтвердить можно только заказ, дошедший до итога
+    return order is not None and order.state == OrderStates.summary.name
+
+
+def order_total(order, price_table):
+    # Сумма считается один раз при показе итога, дальше берётся из заказа
+    total = order.total
+    return total if total is not None else price_table.quote(order)
+
+
+def summary_text(order, total):
+    text = (f"📝 Ваш заказ:\n"
+            f"Тип: {order.type.label}\n"
+            f"Страниц: {order.page_count}\n"
+            f"Формат: {order.format.label}\n")
+    if order.side:
+        text += f"Тип печати: {order.side.label}\n"
+    text += f"Файл: {order.file.file_name}\n"
+    if order.comment:
+        text += f"Комментарий: {order.comment}\n"
+    text += f"\nИтого: {format_rub(total)}"
+    return text
+
+
+def invoice_description(order):
+    return f"{order.type.label} печать, {order.format.label}"
+
+
+def invoice_error_report(username, error):
+    # (текст, строка сводки) уведомления администратору об ошибке счёта
+    return (f"⚠️ Ошибка оплаты у @{username}:\n{str(error)}",
+            f"Ошибка оплаты: {str(error)}")
+
+
+def payment_texts(entry):
+    # (клиенту, администратору, строка сводки) по записи журнала платежей:
+    # при повторной доставке платежа счёта уже может не быть
+    order = entry['order']
+    total = format_rub(entry['amount'])
+    email = entry['email'] or "не указан"
+    phone = entry['phone'] or "не указан"
+    customer = (f"✅ Оплата прошла успешно!\n\n"
+                f"Детали заказа №{entry['order_id']}:\n"
+                f"Тип: {order['type']}\n"
+                f"Стороны: {order['side']}\n"
+                f"Сумма: {total}\n"
+                f"Email: {email}\n"
+                f"Телефон: {phone}\n\n"
+                f"Ваш заказ передан в работу!")
+    owner = (f"💰 Новый оплаченный заказ №{entry['order_id']}!\n"
+             f"От: @{entry['username']}\n"
+             f"Тип: {order['type']}\n"
+             f"Стороны: {order['side']}\n"
+             f"Сумма: {total}\n"
+             f"Email: {email}\n"
+             f"Телефон: {phone}\n"
+             f"ID платежа: {entry['charge_id']}")
+    summary = f"№{entry['order_id']} от @{entry['username']} на {total}"
+    return customer, owner, summary
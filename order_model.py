@@ -0,0 +1,223 @@
+import json
+import struct
+import sys
+from enum import IntEnum
+
+
+# ===== ПАРАМЕТРЫ ЗАКАЗА =====
+# Небольшие целые вместо строк: в заказе лежит ссылка на общий объект перечисления,
+# а не своя копия 'односторонняя' из message.text.lower(). Подпись для пользователя -
+# в label, она же в str() и в снимке заказа для счёта.
+class _Choice(IntEnum):
+    def __new__(cls, value, label):
+        member = int.__new__(cls, value)
+        member._value_ = value
+        member.label = label
+        return member
+
+    def __str__(self):
+        return self.label
+
+    @classmethod
+    def parse(cls, value):
+        # Член перечисления, его число или подпись; None остаётся None
+        if value is None or isinstance(value, cls):
+            return value
+        if isinstance(value, str):
+            for member in cls:
+                if member.label == value or member.label.lower() == value.lower():
+                    return member
+            raise ValueError(f"{cls.__name__}: неизвестное значение {value!r}")
+        return cls(value)
+
+
+class PrintType(_Choice):
+    BW = 1, 'чб'
+    COLOR = 2, 'цветная'
+
+
+class Side(_Choice):
+    SINGLE = 1, 'односторонняя'
+    DOUBLE = 2, 'двухсторонняя'
+
+
+class PaperFormat(_Choice):
+    A5 = 1, 'A5'
+    A4 = 2, 'A4'
+    A3 = 3, 'A3'
+    A2 = 4, 'A2'
+
+
+# ===== ЧЕРНОВИК ЗАКАЗА =====
+class OrderFile:
+    # Файл заказа. После создания не меняется, поэтому копии заказа делят один объект
+    __slots__ = ('file_name', 'file_id', 'path', 'kind', 'pages')
+
+    def __init__(self, file_name, file_id, path=None, kind=None, pages=None):
+        self.file_name = file_name
+        self.file_id = file_id
+        self.path = path
+        self.kind = sys.intern(kind) if kind else kind
+        self.pages = pages
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['file_name'], data['file_id'], data.get('path'), data.get('kind'), data.get('pages'))
+
+    def __eq__(self, other):
+        return isinstance(other, OrderFile) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"OrderFile({self.file_name!r}, pages={self.pages})"
+
+
+class Order:
+    # Черновик заказа: поля фиксированы, опечатка в имени поля падает сразу
+    # при записи (update), а не при показе итога. Сумма - целое число копеек.
+    __slots__ = ('type', 'page_count', 'format', 'side', 'file', 'comment', 'total', 'state', 'state_data')
+
+    # Приведение значений при записи: строки из старых заказов и JSON - в перечисления
+    _convert = {
+        'type': PrintType.parse,
+        'format': PaperFormat.parse,
+        'side': Side.parse,
+        'page_count': lambda value: None if value is None else int(value),
+        'total': lambda value: None if value is None else int(value),
+        'file': lambda value: OrderFile.from_dict(value) if isinstance(value, dict) else value,
+        'state': lambda value: None if value is None else sys.intern(value),
+    }
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.update(**fields)
+
+    def update(self, **fields):
+        for field, value in fields.items():
+            if field not in self.__slots__:
+                raise AttributeError(f"У заказа нет поля {field!r}")
+            convert = self._convert.get(field)
+            setattr(self, field, convert(value) if convert else value)
+        return self
+
+    def copy(self):
+        # Копия для обработчика: файл общий (он не меняется), state_data - своя
+        # (поля перечислены явно: это в разы быстрее цикла по __slots__)
+        order = Order.__new__(Order)
+        order.type, order.page_count, order.format, order.side, order.file = \
+            self.type, self.page_count, self.format, self.side, self.file
+        order.comment, order.total, order.state = self.comment, self.total, self.state
+        order.state_data = None if self.state_data is None else dict(self.state_data)
+        return order
+
+    def to_dict(self):
+        # Прежний вид заказа: подписи строками, файл словарём, без пустых полей
+        data = {}
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is None:
+                continue
+            if isinstance(value, _Choice):
+                value = value.label
+            elif isinstance(value, OrderFile):
+                value = value.to_dict()
+            data[field] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __eq__(self, other):
+        return isinstance(other, Order) and all(
+            getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        return f"Order({self.to_dict()})"
+
+    # ===== ДВОИЧНЫЙ ФОРМАТ =====
+    # Заголовок: версия, флаги, тип, формат, стороны (0 - не выбрано), страницы, сумма.
+    # Дальше строки с длиной (2 байта): комментарий, шаг, поля файла; страниц в файле
+    # (4 байта) и state_data в JSON (длина 4 байта) - только если заданы.
+    def to_bytes(self):
+        flags = 0
+        for bit, value in enumerate((self.page_count, self.total, self.file, self.comment,
+                                     self.state, self.state_data)):
+            if value is not None:
+                flags |= 1 << bit
+        parts = [_HEADER.pack(_VERSION, flags, self.type or 0, self.format or 0, self.side or 0,
+                              self.page_count or 0, self.total or 0)]
+        if self.comment is not None:
+            parts.append(_pack_str(self.comment))
+        if self.state is not None:
+            parts.append(_pack_str(self.state))
+        file = self.file
+        if file is not None:
+            parts.append(_pack_str(file.file_name) + _pack_str(file.file_id)
+                         + _pack_str(file.path) + _pack_str(file.kind)
+                         + _INT.pack(-1 if file.pages is None else file.pages))
+        if self.state_data is not None:
+            blob = json.dumps(self.state_data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            parts.append(_LENGTH.pack(len(blob)) + blob)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, flags, print_type, paper_format, side, page_count, total = _HEADER.unpack_from(data)
+        if version != _VERSION:
+            raise ValueError(f"Неизвестная версия заказа: {version}")
+        order = cls.__new__(cls)
+        order.type = PrintType(print_type) if print_type else None
+        order.format = PaperFormat(paper_format) if paper_format else None
+        order.side = Side(side) if side else None
+        order.page_count = page_count if flags & _HAS_PAGE_COUNT else None
+        order.total = total if flags & _HAS_TOTAL else None
+        offset = _HEADER.size
+        order.comment = order.state = order.file = order.state_data = None
+        if flags & _HAS_COMMENT:
+            order.comment, offset = _unpack_str(data, offset)
+        if flags & _HAS_STATE:
+            state, offset = _unpack_str(data, offset)
+            order.state = sys.intern(state)
+        if flags & _HAS_FILE:
+            file_name, offset = _unpack_str(data, offset)
+            file_id, offset = _unpack_str(data, offset)
+            path, offset = _unpack_str(data, offset)
+            kind, offset = _unpack_str(data, offset)
+            pages = _INT.unpack_from(data, offset)[0]
+            offset += _INT.size
+            order.file = OrderFile(file_name, file_id, path, kind, None if pages < 0 else pages)
+        if flags & _HAS_STATE_DATA:
+            length = _LENGTH.unpack_from(data, offset)[0]
+            offset += _LENGTH.size
+            order.state_data = json.loads(bytes(data[offset:offset + length]))
+        return order
+
+
+_VERSION = 1
+_HEADER = struct.Struct('<BBBBBIq')
+_LENGTH = struct.Struct('<I')
+_INT = struct.Struct('<i')
+_STR = struct.Struct('<H')
+_NONE = 0xFFFF
+_HAS_PAGE_COUNT, _HAS_TOTAL, _HAS_FILE, _HAS_COMMENT, _HAS_STATE, _HAS_STATE_DATA = (1 << bit for bit in range(6))
+
+
+def _pack_str(value):
+    if value is None:
+        return _STR.pack(_NONE)
+    encoded = value.encode('utf-8')
+    if len(encoded) >= _NONE:
+        raise ValueError("Строка в заказе длиннее 64 КБ")
+    return _STR.pack(len(encoded)) + encoded
+
+
+def _unpack_str(data, offset):
+    length = _STR.unpack_from(data, offset)[0]
+    offset += _STR.size
+    if length == _NONE:
+        return None, offset
+    return bytes(data[offset:offset + length]).decode('utf-8'), offset + length
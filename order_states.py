@@ -0,0 +1,182 @@
+from telebot.states import State, StatesGroup
+from telebot.storage.base_storage import StateStorageBase, StateDataContext
+from telebot.asyncio_storage import base_storage as asyncio_storage
+
+
+# ===== ШАГИ ОФОРМЛЕНИЯ ЗАКАЗА =====
+class OrderStates(StatesGroup):
+    color = State()
+    pages = State()
+    format = State()
+    sides = State()
+    file = State()
+    comment = State()
+    summary = State()
+
+
+# Допустимые переходы: из шага -> в какие шаги. Повтор того же шага - это
+# повторный вопрос после неверного ответа. file -> sides -> comment: клиент
+# указал одну страницу, а в файле их больше - стороны спрашиваются после файла.
+# Итог - последний шаг: после подтверждения черновик удаляется вместе с шагом,
+# оплата идёт уже по счёту (invoices.py).
+TRANSITIONS = {
+    None: frozenset({OrderStates.color.name}),
+    OrderStates.color.name: frozenset({OrderStates.pages.name}),
+    OrderStates.pages.name: frozenset({OrderStates.pages.name, OrderStates.format.name}),
+    OrderStates.format.name: frozenset({OrderStates.sides.name, OrderStates.file.name}),
+    OrderStates.sides.name: frozenset({OrderStates.file.name, OrderStates.comment.name}),
+    OrderStates.file.name: frozenset({OrderStates.file.name, OrderStates.sides.name, OrderStates.comment.name}),
+    OrderStates.comment.name: frozenset({OrderStates.summary.name}),
+    OrderStates.summary.name: frozenset({OrderStates.summary.name}),
+}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def check_transition(current, new):
+    new = getattr(new, 'name', new)
+    if new not in TRANSITIONS.get(current, ()):
+        raise InvalidTransition(f"Недопустимый переход {current} -> {new}")
+    return new
+
+
+def check_step(current, expected):
+    # Кнопка должна относиться к текущему шагу, а не к старой клавиатуре
+    if current != expected.name:
+        raise InvalidTransition(f"Ожидался шаг {expected.name}, текущий {current}")
+
+
+class OrderStateStorage(StateStorageBase):
+    # Хранилище состояний telebot поверх хранилища заказов: шаг разговора
+    # лежит в самом заказе (поля 'state' и 'state_data'). Поэтому он переживает
+    # перезапуск вместе с заказом (при ORDER_STORE = 'sqlite') и удаляется
+    # вместе с брошенным черновиком по ORDER_TTL. Состояние без заказа не хранится.
+    def __init__(self, orders):
+        super().__init__()
+        self.orders = orders
+
+    def set_state(self, chat_id, user_id, state, business_connection_id=None,
+                  message_thread_id=None, bot_id=None):
+        try:
+            self.orders.update(chat_id, state=getattr(state, 'name', state))
+        except KeyError:
+            return False
+        return True
+
+    def get_state(self, chat_id, user_id, business_connection_id=None,
+                  message_thread_id=None, bot_id=None):
+        order = self.orders.get(chat_id)
+        return order.state if order else None
+
+    def delete_state(self, chat_id, user_id, business_connection_id=None,
+                     message_thread_id=None, bot_id=None):
+        try:
+            self.orders.update(chat_id, state=None, state_data={})
+        except KeyError:
+            return False
+        return True
+
+    def set_data(self, chat_id, user_id, key, value, business_connection_id=None,
+                 message_thread_id=None, bot_id=None):
+        order = self.orders[chat_id]
+        data = order.state_data or {}
+        data[key] = value
+        self.orders.update(chat_id, state_data=data)
+        return True
+
+    def get_data(self, chat_id, user_id, business_connection_id=None,
+                 message_thread_id=None, bot_id=None):
+        order = self.orders.get(chat_id)
+        return (order.state_data if order else None) or {}
+
+    def reset_data(self, chat_id, user_id, business_connection_id=None,
+                   message_thread_id=None, bot_id=None):
+        return self.save(chat_id, user_id, {})
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None,
+                             message_thread_id=None, bot_id=None):
+        return StateDataContext(
+            self,
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+
+    def save(self, chat_id, user_id, data, business_connection_id=None,
+             message_thread_id=None, bot_id=None):
+        try:
+            self.orders.update(chat_id, state_data=data)
+        except KeyError:
+            return False
+        return True
+
+
+class AsyncOrderStateStorage(asyncio_storage.StateStorageBase):
+    # То же для asyncio-версии бота, поверх order_store.AsyncOrderStore:
+    # шаг разговора лежит в заказе и переживает перезапуск так же, как в newmain.py
+    def __init__(self, orders):
+        super().__init__()
+        self.orders = orders
+
+    async def set_state(self, chat_id, user_id, state, business_connection_id=None,
+                        message_thread_id=None, bot_id=None):
+        try:
+            await self.orders.update(chat_id, state=getattr(state, 'name', state))
+        except KeyError:
+            return False
+        return True
+
+    async def get_state(self, chat_id, user_id, business_connection_id=None,
+                        message_thread_id=None, bot_id=None):
+        order = await self.orders.get(chat_id)
+        return order.state if order else None
+
+    async def delete_state(self, chat_id, user_id, business_connection_id=None,
+                           message_thread_id=None, bot_id=None):
+        try:
+            await self.orders.update(chat_id, state=None, state_data={})
+        except KeyError:
+            return False
+        return True
+
+    async def set_data(self, chat_id, user_id, key, value, business_connection_id=None,
+                       message_thread_id=None, bot_id=None):
+        order = await self.orders.get(chat_id)
+        if order is None:
+            raise KeyError(chat_id)
+        data = order.state_data or {}
+        data[key] = value
+        await self.orders.update(chat_id, state_data=data)
+        return True
+
+    async def get_data(self, chat_id, user_id, business_connection_id=None,
+                       message_thread_id=None, bot_id=None):
+        order = await self.orders.get(chat_id)
+        return (order.state_data if order else None) or {}
+
+    async def reset_data(self, chat_id, user_id, business_connection_id=None,
+                         message_thread_id=None, bot_id=None):
+        return await self.save(chat_id, user_id, {})
+
+    def get_interactive_data(self, chat_id, user_id, business_connection_id=None,
+                             message_thread_id=None, bot_id=None):
+        return asyncio_storage.StateDataContext(
+            self,
+            chat_id=chat_id,
+            user_id=user_id,
+            business_connection_id=business_connection_id,
+            message_thread_id=message_thread_id,
+            bot_id=bot_id,
+        )
+
+    async def save(self, chat_id, user_id, data, business_connection_id=None,
+                   message_thread_id=None, bot_id=None):
+        try:
+            await self.orders.update(chat_id, state_data=data)
+        except KeyError:
+            return False
+        return True
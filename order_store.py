@@ -0,0 +1,318 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from order_model import Order
+
+
+# ===== ХРАНИЛИЩЕ ЧЕРНОВИКОВ ЗАКАЗОВ =====
+class OrderStore:
+    # Общий интерфейс: заказы (order_model.Order) хранятся по chat_id, наружу
+    # отдаются копии, поэтому обработчики не могут изменить общее состояние
+    # в обход блокировок. create принимает и словарь в прежнем виде.
+    # on_expire(order) вызывается для каждого черновика, удалённого по ttl:
+    # например, чтобы удалить с диска его файл.
+    def __init__(self, ttl=None, on_expire=None):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.purged = 0  # черновиков удалено фоновой очисткой
+        self._sweeper = None
+        self._stop = threading.Event()
+
+    def create(self, chat_id, order=None):
+        raise NotImplementedError
+
+    def get(self, chat_id):
+        raise NotImplementedError
+
+    def update(self, chat_id, **fields):
+        raise NotImplementedError
+
+    def delete(self, chat_id):
+        raise NotImplementedError
+
+    def purge_expired(self):
+        raise NotImplementedError
+
+    def file_paths(self):
+        # Пути файлов всех черновиков на диске
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __getitem__(self, chat_id):
+        order = self.get(chat_id)
+        if order is None:
+            raise KeyError(chat_id)
+        return order
+
+    def __contains__(self, chat_id):
+        return self.get(chat_id) is not None
+
+    def _expired(self, touched, now=None):
+        return bool(self.ttl) and (now or time.time()) - touched > self.ttl
+
+    def _discard(self, orders):
+        # Вне блокировок: on_expire может ходить на диск
+        if self.on_expire is not None:
+            for order in orders:
+                self.on_expire(order)
+
+    # Фоновая очистка брошенных черновиков
+    def start_sweeper(self, interval=60):
+        if self._sweeper is not None:
+            return self._sweeper
+
+        def sweep():
+            while not self._stop.wait(interval):
+                self.purged += self.purge_expired()
+
+        self._sweeper = threading.Thread(target=sweep, name='OrderStoreSweeper', daemon=True)
+        self._sweeper.start()
+        return self._sweeper
+
+    def close(self):
+        self._stop.set()
+
+
+class MemoryOrderStore(OrderStore):
+    # Заказы разложены по шардам, у каждого шарда своя блокировка:
+    # разные чаты почти никогда не ждут друг друга.
+    def __init__(self, shards=16, ttl=None, on_expire=None):
+        super().__init__(ttl, on_expire)
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, chat_id):
+        return self._shards[hash(chat_id) % len(self._shards)]
+
+    def create(self, chat_id, order=None):
+        data, lock = self._shard(chat_id)
+        order = _new_order(order)
+        with lock:
+            data[chat_id] = (time.time(), order)
+        return order.copy()
+
+    def get(self, chat_id):
+        data, lock = self._shard(chat_id)
+        with lock:
+            entry = data.get(chat_id)
+            if entry is None:
+                return None
+            if not self._expired(entry[0]):
+                return entry[1].copy()
+            del data[chat_id]
+        self._discard((entry[1],))
+        return None
+
+    def update(self, chat_id, **fields):
+        data, lock = self._shard(chat_id)
+        with lock:
+            entry = data.get(chat_id)
+            if entry is not None and not self._expired(entry[0]):
+                order = entry[1]
+                order.update(**fields)
+                data[chat_id] = (time.time(), order)
+                return order.copy()
+            data.pop(chat_id, None)
+        if entry is not None:
+            self._discard((entry[1],))
+        raise KeyError(chat_id)
+
+    def delete(self, chat_id):
+        data, lock = self._shard(chat_id)
+        with lock:
+            entry = data.pop(chat_id, None)
+        return entry[1] if entry else None
+
+    def purge_expired(self):
+        if not self.ttl:
+            return 0
+        now = time.time()
+        removed = []
+        for data, lock in self._shards:
+            with lock:
+                stale = [chat_id for chat_id, (touched, _) in data.items() if self._expired(touched, now)]
+                for chat_id in stale:
+                    removed.append(data.pop(chat_id)[1])
+        self._discard(removed)
+        return len(removed)
+
+    def file_paths(self):
+        paths = set()
+        for data, lock in self._shards:
+            with lock:
+                paths.update(order.file.path for _, order in data.values() if order.file and order.file.path)
+        return paths
+
+    def __len__(self):
+        return sum(len(data) for data, _ in self._shards)
+
+
+class SQLiteOrderStore(OrderStore):
+    # Долговременное хранилище: заказы переживают перезапуск бота.
+    # WAL позволяет читать параллельно с записью, соединение у каждого потока своё.
+    # Заказ хранится в двоичном виде (Order.to_bytes); строки с JSON от прежних
+    # версий читаются как раньше и при следующей записи переписываются двоично.
+    def __init__(self, path='orders.db', ttl=None, on_expire=None):
+        super().__init__(ttl, on_expire)
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "chat_id INTEGER PRIMARY KEY, data BLOB NOT NULL, touched REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS orders_touched ON orders (touched)")
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def create(self, chat_id, order=None):
+        order = _new_order(order)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO orders (chat_id, data, touched) VALUES (?, ?, ?)",
+                (chat_id, order.to_bytes(), time.time())
+            )
+        return order
+
+    def get(self, chat_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, touched FROM orders WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            if not self._expired(row[1]):
+                return _load_order(row[0])
+            conn.execute("DELETE FROM orders WHERE chat_id = ?", (chat_id,))
+        self._discard((_load_order(row[0]),))
+        return None
+
+    def update(self, chat_id, **fields):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, touched FROM orders WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is not None and not self._expired(row[1]):
+                order = _load_order(row[0])
+                order.update(**fields)
+                conn.execute(
+                    "UPDATE orders SET data = ?, touched = ? WHERE chat_id = ?",
+                    (order.to_bytes(), time.time(), chat_id)
+                )
+                return order
+            conn.execute("DELETE FROM orders WHERE chat_id = ?", (chat_id,))
+        if row is not None:
+            self._discard((_load_order(row[0]),))
+        raise KeyError(chat_id)
+
+    def delete(self, chat_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM orders WHERE chat_id = ?", (chat_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM orders WHERE chat_id = ?", (chat_id,))
+            return _load_order(row[0])
+
+    def purge_expired(self):
+        if not self.ttl:
+            return 0
+        cutoff = time.time() - self.ttl
+        rows = ()
+        with self._connect() as conn:
+            if self.on_expire is not None:
+                rows = conn.execute("SELECT data FROM orders WHERE touched < ?", (cutoff,)).fetchall()
+            removed = conn.execute("DELETE FROM orders WHERE touched < ?", (cutoff,)).rowcount
+        self._discard(_load_order(row[0]) for row in rows)
+        return removed
+
+    def file_paths(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT data FROM orders").fetchall()
+        orders = (_load_order(row[0]) for row in rows)
+        return {order.file.path for order in orders if order.file and order.file.path}
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def close(self):
+        super().close()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _new_order(order):
+    if order is None:
+        return Order()
+    if isinstance(order, Order):
+        return order.copy()
+    return Order.from_dict(order)
+
+
+def _load_order(data):
+    if isinstance(data, str):
+        return Order.from_dict(json.loads(data))
+    return Order.from_bytes(data)
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому
+    # чтение-изменение-запись в update не теряет параллельные правки.
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None or exc_type is KeyError:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+class AsyncOrderStore:
+    # Обёртка для asyncio-версии бота: заказы в памяти читаются напрямую,
+    # запросы к SQLite уходят в пул потоков и не останавливают цикл событий.
+    def __init__(self, store):
+        self.store = store
+        self._direct = isinstance(store, MemoryOrderStore)
+
+    async def _call(self, method, *args, **kwargs):
+        if self._direct:
+            return method(*args, **kwargs)
+        return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def create(self, chat_id, order=None):
+        return await self._call(self.store.create, chat_id, order)
+
+    async def get(self, chat_id):
+        return await self._call(self.store.get, chat_id)
+
+    async def update(self, chat_id, **fields):
+        return await self._call(self.store.update, chat_id, **fields)
+
+    async def delete(self, chat_id):
+        return await self._call(self.store.delete, chat_id)
+
+    async def contains(self, chat_id):
+        return await self._call(self.store.__contains__, chat_id)
+
+
+def create_order_store(backend='memory', **kwargs):
+    if backend == 'memory':
+        return MemoryOrderStore(**kwargs)
+    if backend == 'sqlite':
+        return SQLiteOrderStore(**kwargs)
+    raise ValueError(f"Неизвестное хранилище заказов: {backend}")
@@ -0,0 +1,286 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from resilience import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета исходящих сообщений: меньше - раньше
+PAYMENT = 0
+ORDER = 1
+ADMIN = 2
+BROADCAST = 3
+
+
+class TokenBucket:
+    # rate токенов в секунду, не больше burst в запасе
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, now, tokens=1):
+        # Через сколько секунд наберётся tokens токенов
+        self._refill(now)
+        return 0 if self.tokens >= tokens else (tokens - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'kwargs', 'priority', 'seq', 'future', 'attempts', 'max_retries')
+
+    def __init__(self, method, args, kwargs, priority, seq, max_retries):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = seq
+        self.future = Future()
+        self.attempts = 0
+        self.max_retries = max_retries
+
+
+class _Chat:
+    # entry - текущая запись чата в куче готовых или в куче таймеров диспетчера;
+    # записи, на которые chat.entry уже не указывает, устарели и пропускаются
+    __slots__ = ('jobs', 'classes', 'bucket', 'blocked_until', 'inflight', 'entry', 'ready')
+
+    def __init__(self, bucket):
+        self.jobs = deque()
+        self.classes = {}  # класс приоритета -> сколько таких сообщений в очереди
+        self.bucket = bucket
+        self.blocked_until = 0
+        self.inflight = False
+        self.entry = None
+        self.ready = False
+
+    def push(self, job, left=False):
+        (self.jobs.appendleft if left else self.jobs.append)(job)
+        self.classes[job.priority] = self.classes.get(job.priority, 0) + 1
+
+    def pop(self):
+        job = self.jobs.popleft()
+        self.classes[job.priority] -= 1
+        if not self.classes[job.priority]:
+            del self.classes[job.priority]
+        return job
+
+    def key(self):
+        # Порядок среди готовых чатов: лучший класс в очереди, затем возраст первого сообщения
+        return min(self.classes), self.jobs[0].seq
+
+
+# ===== ОТПРАВКА СООБЩЕНИЙ С УЧЁТОМ ЛИМИТОВ TELEGRAM =====
+class OutboundScheduler:
+    # Обработчик ставит вызов API в очередь и сразу получает Future, поток
+    # обработчика не ждёт ни сети, ни лимитов. Отдельный поток-диспетчер выбирает,
+    # что отправить следующим:
+    #   - не чаще global_rate сообщений в секунду на всего бота и chat_rate в чат
+    #     (с запасом chat_burst, чтобы пара сообщений подряд ушла сразу);
+    #   - в одном чате сообщения уходят строго по порядку, по одному за раз;
+    #   - из чатов, которым уже можно отправлять, первым идёт тот, где ждёт
+    #     сообщение самого высокого класса (PAYMENT > ORDER > ADMIN > BROADCAST).
+    # На ответ 429 чат замолкает на retry_after секунд, и сообщение уходит снова;
+    # так же при разомкнутом предохранителе метода (resilience.CircuitOpen).
+    # С max_retries=0 в submit() сообщение не повторяется, Future сразу получает
+    # ошибку (повторяет вызывающий), но чат после 429 всё равно молчит.
+    #
+    # Диспетчер не перебирает все чаты: чат, которому можно отправлять, лежит
+    # в куче готовых, чат, который ждёт токена или конца паузы 429, - в куче
+    # таймеров до этого момента. Туда же попадает чат без очереди: когда запас
+    # токенов восстановится, а пауза кончится, он больше не нужен и удаляется.
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, workers=4, max_retries=5):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._ready = []   # (класс, номер первого сообщения, chat_id)
+        self._timers = []  # (когда, номер, chat_id)
+        self._seq = itertools.count()
+        self._pending = 0
+        self._inflight = 0
+        self._sent = 0
+        self._failed = 0
+        self._throttled = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='Outbound')
+        self._dispatcher = threading.Thread(target=self._dispatch, name='OutboundDispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, method, chat_id, *args, priority=ORDER, max_retries=None, **kwargs):
+        # method - метод бота (bot.send_message, bot.send_invoice, ...), chat_id - его первый аргумент
+        if max_retries is None:
+            max_retries = self.max_retries
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Отправка сообщений остановлена")
+            job = _Job(method, (chat_id,) + args, kwargs, priority, next(self._seq), max_retries)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+            chat.push(job)
+            self._pending += 1
+            # Чат уже ждёт в куче: переставить, только если пришло сообщение классом выше
+            if not chat.inflight and (len(chat.jobs) == 1 or (chat.ready and priority < chat.entry[0])):
+                self._schedule(chat_id, chat, time.monotonic())
+                self._cond.notify()
+        return job.future
+
+    def _schedule(self, chat_id, chat, now):
+        # Под self._cond, для чата без отправки в полёте: в кучу готовых, в кучу
+        # таймеров или (чат без очереди, запас полон, паузы нет) удалить
+        if chat.jobs:
+            ready_in = max(chat.blocked_until - now, chat.bucket.delay(now))
+        else:
+            ready_in = max(chat.blocked_until - now, chat.bucket.delay(now, chat.bucket.burst))
+            if ready_in <= 0:
+                del self._chats[chat_id]
+                chat.entry = None
+                return
+        chat.ready = ready_in <= 0
+        if chat.ready:
+            chat.entry = chat.key() + (chat_id,)
+            heapq.heappush(self._ready, chat.entry)
+        else:
+            chat.entry = (now + ready_in, next(self._seq), chat_id)
+            heapq.heappush(self._timers, chat.entry)
+
+    def _valid(self, entry):
+        chat = self._chats.get(entry[2])
+        return chat if chat is not None and chat.entry is entry else None
+
+    def _pick(self, now):
+        # Под self._cond: чат для отправки или None. Сначала
+        # наступившие таймеры переводят чаты в готовые (или удаляют)
+        while self._timers and self._timers[0][0] <= now:
+            entry = heapq.heappop(self._timers)
+            chat = self._valid(entry)
+            if chat is not None:
+                self._schedule(entry[2], chat, now)
+        while self._ready:
+            chat = self._valid(self._ready[0])
+            if chat is not None:
+                return chat
+            heapq.heappop(self._ready)
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                # После close() ждём и те отправки, что ещё могут вернуться с 429
+                if self._closed and not self._pending and not self._inflight:
+                    return
+                now = time.monotonic()
+                chat = self._pick(now)
+                if chat is None:
+                    self._cond.wait(self._timers[0][0] - now if self._timers else None)
+                    continue
+                global_wait = self._global.delay(now)
+                if global_wait:
+                    self._cond.wait(global_wait)
+                    continue
+                heapq.heappop(self._ready)
+                self._global.take(now)
+                chat.bucket.take(now)
+                job = chat.pop()
+                chat.inflight = True
+                chat.entry = None
+                chat.ready = False
+                self._inflight += 1
+                self._pending -= 1
+            try:
+                self._senders.submit(self._send, chat, job)
+            except RuntimeError:
+                # Интерпретатор уже завершается (сводки администратору из atexit),
+                # пул новых задач не принимает - отправляем прямо из диспетчера
+                self._send(chat, job)
+
+    def _send(self, chat, job):
+        try:
+            result = job.method(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                if job.attempts < job.max_retries:
+                    self._retry(chat, job, retry_after)
+                    logger.warning(f"Лимит Telegram для чата {job.args[0]}, повтор через {retry_after} с")
+                    return
+                with self._cond:
+                    chat.blocked_until = time.monotonic() + retry_after
+            self._finish(chat, job, error=e)
+        except CircuitOpen as e:
+            if job.attempts < job.max_retries:
+                self._retry(chat, job, max(e.retry_after, 1))
+                logger.warning(f"Чат {job.args[0]}: {str(e)}")
+                return
+            self._finish(chat, job, error=e)
+        except Exception as e:
+            self._finish(chat, job, error=e)
+        else:
+            self._finish(chat, job, result=result)
+
+    def _retry(self, chat, job, retry_after):
+        # Сообщение возвращается в начало очереди чата, чат молчит retry_after секунд
+        with self._cond:
+            job.attempts += 1
+            self._throttled += 1
+            chat.blocked_until = time.monotonic() + retry_after
+            chat.push(job, left=True)
+            chat.inflight = False
+            self._inflight -= 1
+            self._pending += 1
+            self._schedule(job.args[0], chat, time.monotonic())
+            self._cond.notify()
+
+    def _finish(self, chat, job, result=None, error=None):
+        with self._cond:
+            chat.inflight = False
+            self._inflight -= 1
+            self._schedule(job.args[0], chat, time.monotonic())
+            if error is None:
+                self._sent += 1
+            else:
+                self._failed += 1
+            self._cond.notify()
+        if error is None:
+            job.future.set_result(result)
+        else:
+            logger.error(f"Не удалось отправить {getattr(job.method, '__name__', job.method)} "
+                         f"в чат {job.args[0]}: {str(error)}")
+            job.future.set_exception(error)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'pending': self._pending,
+                'chats': len(self._chats),
+                'inflight': self._inflight,
+                'sent': self._sent,
+                'failed': self._failed,
+                'throttled': self._throttled,
+            }
+
+    def close(self, timeout=None):
+        # Очередь досылается, новые сообщения не принимаются
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._dispatcher.join(timeout)
+        self._senders.shutdown(wait=True)
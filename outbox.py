@@ -0,0 +1,337 @@
+import atexit
+import functools
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+from telebot import types
+
+from outbound import ORDER
+from resilience import error_reason, retry_after, single_attempt
+
+logger = logging.getLogger(__name__)
+
+
+class _RawJson(types.JsonSerializable):
+    # Клавиатура или цена из журнала: telebot получает тот же JSON, что был при записи
+    __slots__ = ('json',)
+
+    def __init__(self, json_string):
+        self.json = json_string
+
+    def to_json(self):
+        return self.json
+
+
+def _encode(value):
+    if isinstance(value, types.JsonSerializable):
+        return {'__json__': value.to_json()}
+    raise TypeError(f"Нельзя сохранить в журнал исходящих: {type(value).__name__}")
+
+
+def _decode(value):
+    if len(value) == 1 and '__json__' in value:
+        return _RawJson(value['__json__'])
+    return value
+
+
+class _Entry:
+    __slots__ = ('id', 'method', 'args', 'kwargs', 'priority', 'time', 'segment', 'future', 'attempts')
+
+    def __init__(self, entry_id, method, args, kwargs, priority, created, segment, future=None):
+        self.id = entry_id
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.time = created
+        self.segment = segment
+        self.future = future
+        self.attempts = 0
+
+
+# ===== ЖУРНАЛ ИСХОДЯЩИХ СООБЩЕНИЙ =====
+class Outbox:
+    # Каждое исходящее сообщение сначала дописывается в журнал (строка JSON в
+    # сегменте outbox-000001.jsonl, ...), потом уходит в очередь outbound.py,
+    # которая держит лимиты Telegram. Когда Telegram принял сообщение, в журнал
+    # дописывается отметка о доставке. Сообщения без отметки после перезапуска
+    # отправляются снова - доставка "хотя бы один раз": если бот упал между
+    # ответом Telegram и отметкой, сообщение придёт дважды.
+    #
+    # Обработчик не ждёт диска: строка пишется в файл (переживает падение
+    # процесса), fsync делает фоновый поток раз в sync_interval секунд - общий
+    # для всех строк за это время. При отключении питания теряется не больше
+    # последних sync_interval секунд.
+    #
+    # Повторы журнальных сообщений делает только журнал: вызов идёт одной
+    # попыткой (resilience.single_attempt), очередь outbound.py его не повторяет
+    # (max_retries=0). Сбой сети, 5xx, 429 и разомкнутый предохранитель -
+    # сообщение остаётся в журнале и уходит снова через паузу, растущую вдвое
+    # до max_delay, но не меньше retry_after из ответа 429; Future
+    # вызывающего ждёт доставки. Ошибка в запросе (4xx: чат не найден, бот
+    # заблокирован) не исправится повтором: сообщение отмечается как
+    # недоставленное, Future получает исключение. Так же - через max_age секунд
+    # после записи.
+    #
+    # Когда сегмент вырос больше segment_size, начинается новый. Сегмент
+    # удаляется, когда доставлены все записанные в нём сообщения.
+    def __init__(self, bot, outbound, directory='outbox', segment_size=1024 * 1024, sync_interval=0.05,
+                 base_delay=1, max_delay=300, max_age=24 * 60 * 60):
+        self.bot = bot
+        self.outbound = outbound
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self._pending = {}  # id -> _Entry, ещё не доставлены
+        self._live = {}  # сегмент -> сколько в нём недоставленных сообщений
+        self._ids = itertools.count(1)
+        self._retries = []  # куча (когда, id) сообщений, ждущих повтора
+        self._delivered = 0
+        self._dropped = 0
+        self._retried = 0
+        self._written = 0
+        self._synced = 0
+        self._file = None
+        self._segment = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._closed = False
+        self._load()
+        self._open_segment(self._segment + 1)
+        self._release_segments()
+        self._syncer = threading.Thread(target=self._sync_loop, name='OutboxSync', daemon=True)
+        self._drainer = threading.Thread(target=self._drain, name='OutboxDrainer', daemon=True)
+        self._syncer.start()
+        self._drainer.start()
+        atexit.register(self.close)
+
+    # ===== ЖУРНАЛ НА ДИСКЕ =====
+    def _path(self, segment):
+        return os.path.join(self.directory, f"outbox-{segment:06d}.jsonl")
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith('outbox-') and name.endswith('.jsonl'):
+                segments.append(int(name[len('outbox-'):-len('.jsonl')]))
+        return sorted(segments)
+
+    def _load(self):
+        # Сообщения, записанные до перезапуска и не отмеченные доставленными
+        last_id = 0
+        for segment in self._segments():
+            self._segment = segment
+            self._live[segment] = 0
+            with open(self._path(segment), 'rb+') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        record = json.loads(line, object_hook=_decode)
+                    except ValueError:
+                        # Недописанная строка после сбоя: отрезаем её
+                        logger.error(f"Журнал исходящих: обрезан повреждённый хвост {self._path(segment)}")
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if 'done' in record:
+                        entry = self._pending.pop(record['done'], None)
+                        if entry is not None:
+                            self._live[entry.segment] -= 1
+                    else:
+                        self._pending[record['id']] = _Entry(
+                            record['id'], record['method'], record['args'], record['kwargs'],
+                            record['priority'], record['time'], segment)
+                        self._live[segment] += 1
+                    last_id = max(last_id, record.get('id') or record.get('done'))
+        self._ids = itertools.count(last_id + 1)
+        if self._pending:
+            logger.info(f"Журнал исходящих: {len(self._pending)} недоставленных сообщений после перезапуска")
+
+    def _open_segment(self, segment):
+        # Под self._lock (или до запуска потоков)
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._file = open(self._path(segment), 'ab')
+        self._segment = segment
+        self._live.setdefault(segment, 0)
+
+    def _release_segments(self):
+        # Под self._lock: удаляет старые сегменты, в которых всё доставлено. Только
+        # подряд с самого старого: в более новом сегменте могут лежать отметки о
+        # доставке сообщений из старого, без них сообщения ушли бы повторно
+        for segment in sorted(self._live):
+            if segment == self._segment or self._live[segment]:
+                break
+            del self._live[segment]
+            try:
+                os.remove(self._path(segment))
+            except FileNotFoundError:
+                pass
+
+    def _append(self, line):
+        # Под self._lock
+        self._file.write(line)
+        self._file.flush()
+        self._written += 1
+        if self._file.tell() >= self.segment_size:
+            self._open_segment(self._segment + 1)
+            self._synced = self._written
+            self._release_segments()
+
+    def _sync_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                target = self._written
+                fd = os.dup(self._file.fileno()) if target > self._synced else None
+            if fd is not None:
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                with self._lock:
+                    self._synced = max(self._synced, target)
+            time.sleep(self.sync_interval)
+
+    # ===== ОТПРАВКА =====
+    def submit(self, method, chat_id, *args, priority=ORDER, **kwargs):
+        # method - имя метода бота ('send_message', 'send_invoice'), chat_id - его
+        # первый аргумент. Возвращает Future, как OutboundScheduler.submit
+        future = Future()
+        created = time.time()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Журнал исходящих закрыт")
+            entry_id = next(self._ids)
+            record = {'id': entry_id, 'method': method, 'args': [chat_id, *args], 'kwargs': kwargs,
+                      'priority': priority, 'time': created}
+            line = (json.dumps(record, ensure_ascii=False, default=_encode) + '\n').encode('utf-8')
+            entry = _Entry(entry_id, method, record['args'], kwargs, priority, created, self._segment, future)
+            self._pending[entry_id] = entry
+            self._live[self._segment] += 1
+            self._append(line)
+        self._send(entry)
+        return future
+
+    def _send(self, entry):
+        method = getattr(self.bot, entry.method)
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            with single_attempt():
+                return method(*args, **kwargs)
+
+        try:
+            sent = self.outbound.submit(call, *entry.args, priority=entry.priority, max_retries=0, **entry.kwargs)
+        except Exception as e:
+            # Очередь не приняла сообщение (остановка) - оно остаётся в журнале
+            self._failed(entry, e, permanent=False)
+            return
+        sent.add_done_callback(lambda f: self._sent(entry, f))
+
+    def _sent(self, entry, sent):
+        error = sent.exception()
+        if error is not None:
+            self._failed(entry, error)
+            return
+        with self._lock:
+            self._done(entry)
+            self._delivered += 1
+        if entry.future is not None:
+            entry.future.set_result(sent.result())
+
+    def _failed(self, entry, error, permanent=None):
+        reason = error_reason(error)
+        if permanent is None:
+            permanent = reason == 'client'
+        expired = time.time() - entry.time >= self.max_age
+        with self._lock:
+            if not permanent and not expired and not self._closed:
+                # Повтор через паузу: 1, 2, 4, ... секунд со случайным разбросом
+                entry.attempts += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** (entry.attempts - 1))
+                delay = random.uniform(delay / 2, delay)
+                if reason == 'throttled':
+                    delay = max(delay, retry_after(error))
+                elif reason == 'breaker':
+                    delay = max(delay, error.retry_after)
+                heapq.heappush(self._retries, (time.monotonic() + delay, entry.id))
+                self._retried += 1
+                self._cond.notify()
+                logger.warning(f"Журнал исходящих: {entry.method} в чат {entry.args[0]} не отправлено "
+                               f"({reason}), повтор {entry.attempts} через {delay:.1f} с")
+                return
+            if self._closed and not permanent and not expired:
+                # При остановке сообщение остаётся в журнале до следующего запуска
+                return
+            self._done(entry)
+            self._dropped += 1
+        logger.error(f"Журнал исходящих: {entry.method} в чат {entry.args[0]} не доставлено: {str(error)}")
+        if entry.future is not None:
+            entry.future.set_exception(error)
+
+    def _done(self, entry):
+        # Под self._lock
+        # После close() отметка не пишется: сообщение уйдёт ещё раз после запуска
+        if self._file.closed or self._pending.pop(entry.id, None) is None:
+            return
+        self._append(f'{{"done":{entry.id}}}\n'.encode('utf-8'))
+        self._live[entry.segment] -= 1
+        if not self._live[entry.segment]:
+            self._release_segments()
+
+    def _drain(self):
+        # Фоновый поток: после запуска отправляет сообщения из журнала, дальше -
+        # повторы, у которых подошло время
+        with self._lock:
+            recovered = sorted(self._pending.values(), key=lambda entry: entry.id)
+        for entry in recovered:
+            self._send(entry)
+        while True:
+            with self._lock:
+                while not self._closed and (not self._retries or self._retries[0][0] > time.monotonic()):
+                    self._cond.wait(self._retries[0][0] - time.monotonic() if self._retries else None)
+                if self._closed:
+                    return
+                _, entry_id = heapq.heappop(self._retries)
+                entry = self._pending.get(entry_id)
+            if entry is not None:
+                self._send(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'retry_queue': len(self._retries),
+                'delivered': self._delivered,
+                'dropped': self._dropped,
+                'retried': self._retried,
+                'segment': self._segment,
+            }
+
+    def close(self):
+        # Недоставленные сообщения остаются в журнале и уйдут после запуска
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._drainer.join()
+        self._syncer.join()
@@ -0,0 +1,208 @@
+import re
+import zipfile
+import zlib
+
+
+# ===== ПОДСЧЁТ СТРАНИЦ =====
+_PAGES = re.compile(rb'/Type\s*/Pages\b')
+_PAGE = re.compile(rb'/Type\s*/Page\b')
+_COUNT = re.compile(rb'/Count\s+(\d+)')
+_OBJ = re.compile(rb'\d+\s+\d+\s+obj\b')
+_STREAM = re.compile(rb'(?<!end)stream\r?\n')
+_DOCX_PAGES = re.compile(rb'<Pages>(\d+)</Pages>')
+
+# Сколько байт держим от предыдущего куска, чтобы не разрезать ключевое слово
+_TAIL = 32
+# Предел для текста объекта без endobj, дальше начинаем его выбрасывать
+_MAX_PENDING = 1024 * 1024
+
+
+def detect_kind(head, file_name=None):
+    if head.startswith(b'%PDF'):
+        return 'pdf'
+    if head.startswith(b'PK\x03\x04'):
+        return 'docx' if (file_name or '').lower().endswith('.docx') or b'word/' in head else 'zip'
+    if head.startswith(b'\xff\xd8\xff') or head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image'
+    return None
+
+
+def _dict_around(data, pos):
+    # Границы словаря << ... >>, в котором находится позиция pos
+    depth = 0
+    start = pos
+    while start > 0:
+        start -= 1
+        if data.startswith(b'>>', start):
+            depth += 1
+        elif data.startswith(b'<<', start):
+            if depth == 0:
+                break
+            depth -= 1
+    depth = 0
+    end = pos
+    while end < len(data):
+        if data.startswith(b'<<', end):
+            depth += 1
+            end += 2
+        elif data.startswith(b'>>', end):
+            if depth == 0:
+                return data[start:end + 2]
+            depth -= 1
+            end += 2
+        else:
+            end += 1
+    return data[start:]
+
+
+class PdfPageCounter:
+    # Читает PDF по мере скачивания и ищет только узлы дерева страниц (/Type /Pages),
+    # корневой узел хранит общее число страниц в /Count. Потоки с картинками
+    # и шрифтами пропускаются, распаковываются только потоки объектов (/ObjStm).
+    # Буфер - bytearray: кусок дописывается в конец, разобранное начало удаляется
+    # на месте, а поиск продолжается с того места, где остановился в прошлый раз
+    # (с запасом _TAIL на стыке кусков). Поэтому длинный объект без endobj
+    # разбирается за линейное время, а не копируется и не просматривается на каждом куске.
+    def __init__(self):
+        self._buf = bytearray()
+        self._searched = 0
+        self._mode = None
+        self._inflate = None
+        self._objects = bytearray()
+        self.tree_count = 0
+        self.page_objects = 0
+
+    def feed(self, chunk):
+        buf = self._buf
+        buf += chunk
+        while True:
+            if self._mode is not None:
+                end = buf.find(b'endstream', self._searched)
+                if end < 0:
+                    keep = max(len(buf) - _TAIL, 0)
+                    self._consume_stream(keep)
+                    del buf[:keep]
+                    self._searched = 0
+                    return
+                self._consume_stream(end)
+                self._finish_stream()
+                del buf[:end + len(b'endstream')]
+                self._searched = 0
+                continue
+
+            match = _STREAM.search(buf, self._searched)
+            if match is None:
+                last = buf.rfind(b'endobj', self._searched)
+                if last >= 0:
+                    self._scan(buf[:last])
+                    del buf[:last]
+                elif len(buf) > _MAX_PENDING:
+                    del buf[:-_TAIL]
+                self._searched = max(len(buf) - _TAIL, 0)
+                return
+
+            header = buf[:match.start()]
+            self._scan(header)
+            objects = list(_OBJ.finditer(header))
+            header = header[objects[-1].end():] if objects else header
+            if b'/ObjStm' in header and b'/FlateDecode' in header:
+                self._mode = 'flate'
+                self._inflate = zlib.decompressobj()
+            elif b'/ObjStm' in header and b'/Filter' not in header:
+                self._mode = 'raw'
+            else:
+                self._mode = 'skip'
+            self._objects = bytearray()
+            del buf[:match.end()]
+            self._searched = 0
+
+    def _consume_stream(self, end):
+        # Первые end байт буфера - содержимое текущего потока
+        if self._mode == 'skip' or not end:
+            return
+        if self._mode == 'raw':
+            self._objects += self._buf[:end]
+            return
+        try:
+            self._objects += self._inflate.decompress(self._buf[:end])
+        except zlib.error:
+            self._mode = 'skip'
+
+    def _finish_stream(self):
+        if self._objects:
+            self._scan(self._objects)
+        self._mode = None
+        self._inflate = None
+        self._objects = bytearray()
+
+    def _scan(self, data):
+        for match in _PAGES.finditer(data):
+            node = _dict_around(data, match.start())
+            for count in _COUNT.finditer(node):
+                self.tree_count = max(self.tree_count, int(count.group(1)))
+        self.page_objects += len(_PAGE.findall(data))
+
+    def finish(self):
+        if self._buf:
+            self._scan(self._buf)
+            self._buf = bytearray()
+            self._searched = 0
+        return self.tree_count or self.page_objects or None
+
+
+class PageCounter:
+    # Анализ файла: тип по сигнатуре и количество страниц.
+    # PDF считается на лету из кусков скачивания, DOCX и картинки - по готовому файлу.
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+        self.kind = None
+        self._head = b''
+        self._detected = False
+        self._pdf = None
+
+    def feed(self, chunk):
+        if not self._detected:
+            # Сигнатуру ищем в первых байтах, до этого копим начало файла
+            self._head += chunk
+            if len(self._head) < 16:
+                return
+            self._detect()
+            chunk, self._head = self._head, b''
+        if self._pdf is not None:
+            self._pdf.feed(chunk)
+
+    def _detect(self):
+        self._detected = True
+        self.kind = detect_kind(self._head[:512], self.file_name)
+        if self.kind == 'pdf':
+            self._pdf = PdfPageCounter()
+
+    def finish(self, path=None):
+        pages = None
+        if not self._detected and path:
+            # Файл не проходил через feed (например, взят из кеша) - читаем его с диска
+            self._head = b''
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    self.feed(chunk)
+        if not self._detected and self._head:
+            self._detect()
+            self._pdf and self._pdf.feed(self._head)
+        if self.kind == 'pdf':
+            pages = self._pdf.finish()
+        elif self.kind == 'docx' and path:
+            pages = docx_page_count(path)
+        elif self.kind == 'image':
+            pages = 1
+        return {'kind': self.kind, 'pages': pages}
+
+
+def docx_page_count(path):
+    # Word сохраняет число страниц в docProps/app.xml, zipfile читает только его
+    try:
+        with zipfile.ZipFile(path) as archive:
+            match = _DOCX_PAGES.search(archive.read('docProps/app.xml'))
+    except (KeyError, zipfile.BadZipFile):
+        return None
+    return int(match.group(1)) if match else None
+
@@ -0,0 +1,215 @@
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def payment_entry(message, invoice=None):
+    # Запись журнала по сообщению successful_payment и снимку счёта (если он нашёлся)
+    payment = message.successful_payment
+    order_info = payment.order_info
+    return {
+        'charge_id': payment.telegram_payment_charge_id,
+        'provider_charge_id': payment.provider_payment_charge_id,
+        'payload': payment.invoice_payload,
+        'order_id': invoice['order_id'] if invoice else None,
+        'chat_id': message.chat.id,
+        'user_id': message.from_user.id,
+        'username': message.from_user.username,
+        'amount': payment.total_amount,
+        'currency': payment.currency,
+        'email': getattr(order_info, 'email', None),
+        'phone': getattr(order_info, 'phone_number', None),
+        'order': invoice['order'] if invoice else None,
+    }
+
+
+# ===== ЖУРНАЛ ПЛАТЕЖЕЙ =====
+class PaymentLedger:
+    # Журнал только дописывается: одна строка JSON на платёж, файлы-сегменты
+    # payments-000001.jsonl, payments-000002.jsonl, ... Новый сегмент начинается,
+    # когда текущий вырос больше segment_size.
+    #
+    # record() возвращает управление только после fsync, но fsync общий:
+    # пока один поток сбрасывает файл на диск, остальные дописывают свои строки,
+    # и следующий fsync покрывает их все сразу.
+    #
+    # В памяти держится индекс по telegram_payment_charge_id (повторная доставка
+    # того же платежа не создаёт вторую запись) и по времени (выборка за период
+    # читает только нужные строки).
+    #
+    # Когда уведомления о платеже поставлены в журнал исходящих, дописывается
+    # отметка {"notified": charge_id} (mark_notified). Если бот упал между
+    # записью платежа и уведомлениями, повторная доставка платежа видит запись
+    # без отметки и доделывает уведомления.
+    def __init__(self, directory='payments', segment_size=4 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._by_charge = {}  # charge_id -> (сегмент, смещение)
+        self._notified = set()  # charge_id с отправленными уведомлениями
+        self._times = []  # время записи, по возрастанию
+        self._positions = []  # (сегмент, смещение) в том же порядке
+        self._written = 0
+        self._synced = 0
+        self._file = None
+        self._segment = 0
+        self._load()
+        self._open_segment(max(self._segment, 1))
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"payments-{segment:06d}.jsonl")
+
+    def _segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith('payments-') and name.endswith('.jsonl'):
+                segments.append(int(name[len('payments-'):-len('.jsonl')]))
+        return sorted(segments)
+
+    def _load(self):
+        for segment in self._segments():
+            self._segment = segment
+            with open(self._path(segment), 'rb+') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после сбоя: отрезаем её
+                        logger.error(f"Журнал платежей: обрезан повреждённый хвост {self._path(segment)}")
+                        f.truncate(offset)
+                        break
+                    if 'notified' in entry:
+                        self._notified.add(entry['notified'])
+                    else:
+                        self._index(entry, segment, offset)
+                    offset += len(line)
+
+    def _index(self, entry, segment, offset):
+        position = (segment, offset)
+        self._by_charge[entry['charge_id']] = position
+        # Записи идут по времени; на случай перевода часов вставка сохраняет порядок
+        i = bisect.bisect_right(self._times, entry['time'])
+        self._times.insert(i, entry['time'])
+        self._positions.insert(i, position)
+
+    def _open_segment(self, segment):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._segment = segment
+        self._file = open(self._path(segment), 'ab')
+
+    def _read(self, position):
+        segment, offset = position
+        with open(self._path(segment), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline())
+
+    def get(self, charge_id):
+        with self._lock:
+            position = self._by_charge.get(charge_id)
+        return self._read(position) if position else None
+
+    def notified(self, charge_id):
+        return charge_id in self._notified
+
+    def __contains__(self, charge_id):
+        return charge_id in self._by_charge
+
+    def __len__(self):
+        return len(self._by_charge)
+
+    def record(self, entry):
+        # Возвращает (запись, True) для нового платежа и (сохранённая запись, False) для повтора
+        entry = dict(entry)
+        entry.setdefault('time', time.time())
+        charge_id = entry['charge_id']
+        line = (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8')
+        with self._lock:
+            existing = self._by_charge.get(charge_id)
+            if existing is None:
+                if self._file.tell() >= self.segment_size:
+                    self._open_segment(self._segment + 1)
+                offset = self._file.tell()
+                self._file.write(line)
+                self._file.flush()
+                self._index(entry, self._segment, offset)
+                self._written += 1
+                ticket = self._written
+        if existing is not None:
+            return self._read(existing), False
+        self._sync(ticket)
+        return entry, True
+
+    def mark_notified(self, charge_id):
+        # Отметка в журнале: уведомления о платеже поставлены в очередь
+        line = (json.dumps({'notified': charge_id, 'time': time.time()}) + '\n').encode('utf-8')
+        with self._lock:
+            if charge_id in self._notified:
+                return
+            self._file.write(line)
+            self._file.flush()
+            self._notified.add(charge_id)
+            self._written += 1
+            ticket = self._written
+        self._sync(ticket)
+
+    def _sync(self, ticket):
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return  # строку уже сбросил на диск чужой fsync
+            with self._lock:
+                target = self._written
+                # Копия дескриптора: смена сегмента может закрыть файл, пока идёт fsync
+                fd = os.dup(self._file.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self._synced = target
+
+    def scan(self, start=None, end=None):
+        # Записи с start <= time < end (unix-время), по возрастанию времени
+        with self._lock:
+            lo = 0 if start is None else bisect.bisect_left(self._times, start)
+            hi = len(self._times) if end is None else bisect.bisect_left(self._times, end)
+            positions = self._positions[lo:hi]
+        handles = {}
+        try:
+            for segment, offset in positions:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(self._path(segment), 'rb')
+                f.seek(offset)
+                yield json.loads(f.readline())
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def revenue(self, start=None, end=None):
+        # Выручка за период по дням: {'2024-05-01': {'payments': 3, 'amount': 405000}, ...}
+        days = {}
+        for entry in self.scan(start, end):
+            day = datetime.fromtimestamp(entry['time']).strftime('%Y-%m-%d')
+            totals = days.setdefault(day, {'payments': 0, 'amount': 0})
+            totals['payments'] += 1
+            totals['amount'] += entry['amount']
+        return days
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
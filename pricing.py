@@ -0,0 +1,62 @@
+from decimal import Decimal, ROUND_HALF_UP
+from types import MappingProxyType
+
+from order_model import PaperFormat, PrintType, Side
+
+
+# ===== РАСЧЁТ СТОИМОСТИ =====
+DEFAULT_SIDE = Side.SINGLE
+
+prices = {
+    'чб': {'односторонняя': 10, 'двухсторонняя': 15},
+    'цветная': {'односторонняя': 20, 'двухсторонняя': 30},
+    'формат': {'A5': 1, 'A4': 1.5, 'A3': 2, 'A2': 3}
+}
+
+
+class PriceTable:
+    # Словарь цен один раз разворачивается в таблицу цены страницы в копейках
+    # для каждой комбинации (тип, стороны, формат), дальше расчёт - целочисленный.
+    # Ключи таблицы - перечисления из order_model, подписи в prices переводятся в них.
+    # Скидки за объём: список (от скольких страниц, процент скидки).
+    def __init__(self, prices, volume_discounts=()):
+        formats = prices['формат']
+        table = {}
+        for color_type, sides in prices.items():
+            if color_type == 'формат':
+                continue
+            for side, base_price in sides.items():
+                for paper_format, multiplier in formats.items():
+                    kopecks = Decimal(str(base_price)) * Decimal(str(multiplier)) * 100
+                    key = (PrintType.parse(color_type), Side.parse(side), PaperFormat.parse(paper_format))
+                    table[key] = int(kopecks.to_integral_value(ROUND_HALF_UP))
+        self.table = MappingProxyType(table)
+        self.volume_discounts = tuple(sorted(volume_discounts, reverse=True))
+
+    def unit_price(self, color_type, side, paper_format):
+        return self.table[(PrintType.parse(color_type), Side.parse(side), PaperFormat.parse(paper_format))]
+
+    def discount(self, page_count):
+        for min_pages, percent in self.volume_discounts:
+            if page_count >= min_pages:
+                return percent
+        return 0
+
+    def quote(self, order):
+        page_count = order.page_count
+        total = self.table[(order.type, order.side or DEFAULT_SIDE, order.format)] * page_count
+        percent = self.discount(page_count)
+        if percent:
+            total -= total * percent // 100
+        return total
+
+    def quote_many(self, orders):
+        # Пакетный расчёт для отчётов и оптовых заказов
+        return [self.quote(order) for order in orders]
+
+
+def format_rub(kopecks):
+    rubles, rest = divmod(kopecks, 100)
+    if rest:
+        return f"{rubles}.{rest:02d} руб."
+    return f"{rubles} руб."
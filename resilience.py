@@ -0,0 +1,327 @@
+import contextlib
+import functools
+import logging
+import random
+import threading
+import time
+
+import requests
+import urllib3
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# Состояния предохранителя; числа - значение метрики bot_api_breaker_state
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Методы, которые можно повторить после любого сбоя: повтор ничего не
+# отправит пользователю дважды. sendMessage повторяется, только если запрос
+# точно не дошёл до сервера (request_sent): после таймаута чтения или 5xx
+# Telegram мог его уже выполнить
+IDEMPOTENT_METHODS = frozenset({'getMe', 'getFile', 'getChat', 'getChatMember', 'getWebhookInfo',
+                                'setWebhook', 'deleteWebhook', 'answerPreCheckoutQuery'})
+# getUpdates повторяет сам цикл опроса, а таймаут долгого опроса - не сбой
+PASSTHROUGH_METHODS = frozenset({'getUpdates'})
+# Ошибки urllib3, при которых запрос не отправлялся: соединение не открылось
+# или в пуле не нашлось свободного
+_NOT_SENT_ERRORS = (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError,
+                    urllib3.exceptions.EmptyPoolError)
+
+# Вызовы внутри single_attempt() - по одной попытке в потоке
+_local = threading.local()
+
+
+class CircuitOpen(Exception):
+    # Предохранитель метода разомкнут: запрос не отправлялся
+    def __init__(self, method_name, retry_after):
+        super().__init__(f"{method_name}: Bot API недоступен, повтор не раньше чем через {retry_after:.1f} с")
+        self.method_name = method_name
+        self.retry_after = retry_after
+
+
+def error_reason(error):
+    # Вид ошибки вызова Bot API: 'throttled' (429), 'server' (5xx), 'network'
+    # (сеть, таймауты), 'breaker' (предохранитель разомкнут) или 'client' -
+    # ошибка в самом запросе, повтор не поможет
+    if isinstance(error, CircuitOpen):
+        return 'breaker'
+    if isinstance(error, apihelper.ApiTelegramException):
+        if error.error_code == 429:
+            return 'throttled'
+        return 'server' if error.error_code >= 500 else 'client'
+    if isinstance(error, apihelper.ApiHTTPException):
+        return 'server' if error.result.status_code >= 500 else 'client'
+    if isinstance(error, requests.exceptions.RequestException):
+        return 'network'
+    return 'client'
+
+
+def request_sent(error):
+    # False - запрос точно не дошёл до сервера, повтор ничего не выполнит дважды.
+    # transport.py кладёт ошибку urllib3 в __cause__, requests - в args[0].reason
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    cause = error.__cause__
+    if cause is None and error.args:
+        cause = error.args[0]
+    if isinstance(cause, urllib3.exceptions.MaxRetryError):
+        cause = cause.reason
+    return not isinstance(cause, _NOT_SENT_ERRORS)
+
+
+@contextlib.contextmanager
+def single_attempt():
+    # Вызовы Bot API в этом блоке ResilientApi не повторяет: повторы делает
+    # вызывающий (журнал исходящих, outbox.py). Предохранитель работает как обычно
+    previous = getattr(_local, 'single', False)
+    _local.single = True
+    try:
+        yield
+    finally:
+        _local.single = previous
+
+
+def retry_after(error):
+    # Пауза из ответа 429 (parameters.retry_after), в секундах
+    return (error.result_json.get('parameters') or {}).get('retry_after', 1)
+
+
+# ===== ПРЕДОХРАНИТЕЛЬ =====
+class CircuitBreaker:
+    # После failure_threshold сбоев подряд (сеть, 5xx) метод размыкается: вызовы
+    # сразу получают CircuitOpen и не держат потоки на таймаутах. Через
+    # reset_timeout секунд проходит один пробный вызов: успех замыкает цепь,
+    # сбой размыкает снова на вдвое больший срок, но не больше max_reset_timeout.
+    # Ответы 4xx - не сбой: сервер работает, ошибка в запросе.
+    def __init__(self, name, failure_threshold=5, reset_timeout=10, max_reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0  # сколько раз размыкался
+        self.rejected = 0
+        self._timeout = reset_timeout
+        self._open_until = 0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Разрешение на вызов; при разомкнутой цепи - CircuitOpen
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._open_until:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probe:
+                self._probe = True
+                return
+            self.rejected += 1
+            retry_after = max(self._open_until - now, 0)
+        raise CircuitOpen(self.name, retry_after)
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe = False
+            if self.state != CLOSED:
+                self._timeout = self.reset_timeout
+                self._set_state(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._probe = False
+                self._timeout = min(self._timeout * 2, self.max_reset_timeout)
+                self._open()
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        # Вызов закончился без ответа о здоровье API (например, 429)
+        with self._lock:
+            self._probe = False
+
+    def _open(self):
+        self._open_until = time.monotonic() + self._timeout
+        self.opened += 1
+        self._set_state(OPEN)
+
+    def _set_state(self, state):
+        logger.warning(f"Предохранитель {self.name}: {self.state} -> {state}")
+        self.state = state
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+# ===== БЮДЖЕТ ПОВТОРОВ =====
+class RetryBudget:
+    # Повторы не больше ratio от числа первых попыток (плюс min_per_second в
+    # секунду, чтобы редкие вызовы тоже могли повториться) и не больше
+    # max_waiting потоков одновременно ждут перед повтором. Когда бюджет
+    # исчерпан, ошибка сразу уходит вызывающему: во время сбоя повторы не
+    # занимают все потоки обработчиков и отправки.
+    def __init__(self, ratio=0.2, min_per_second=1, max_tokens=10, max_waiting=4):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.max_waiting = max_waiting
+        self.tokens = max_tokens
+        self.waiting = 0
+        self.exhausted = 0
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        # Первая попытка вызова пополняет бюджет
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self):
+        # True - можно ждать и повторять; тогда после ожидания вызвать done()
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self._stamp) * self.min_per_second)
+            self._stamp = now
+            if self.tokens < 1 or self.waiting >= self.max_waiting:
+                self.exhausted += 1
+                return False
+            self.tokens -= 1
+            self.waiting += 1
+            return True
+
+    def done(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def stats(self):
+        with self._lock:
+            return {'tokens': round(self.tokens, 2), 'waiting': self.waiting, 'exhausted': self.exhausted}
+
+
+# ===== ВЫЗОВЫ BOT API С ПОВТОРАМИ =====
+class ResilientApi:
+    # Обёртка над apihelper._make_request: через неё проходят все вызовы бота.
+    # Вместо RETRY_ON_ERROR telebot (фиксированная пауза RETRY_TIMEOUT до
+    # MAX_RETRIES раз) - экспоненциальная пауза со случайным разбросом
+    # (full jitter), пауза 429 - ровно retry_after из ответа. IDEMPOTENT_METHODS
+    # повторяются после сбоев сети и 5xx, остальные методы - только если запрос
+    # не дошёл до сервера (request_sent) или Telegram ответил 429, не выполнив
+    # его. Если 429 просит ждать дольше max_delay, ошибка уходит сразу: очередь
+    # исходящих (outbound.py) отложит сообщение, не занимая поток. Внутри
+    # single_attempt() попытка одна.
+    #
+    # retries и rejected - счётчики метрик (метки method, reason и method), необязательны.
+    def __init__(self, attempts=3, base_delay=0.2, max_delay=2.0, budget=None,
+                 failure_threshold=5, reset_timeout=10, max_reset_timeout=60,
+                 retries=None, rejected=None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget or RetryBudget()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.retries = retries
+        self.rejected = rejected
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._make_request = None
+
+    def install(self):
+        # Ставится после metrics.instrument_api: тогда время и ошибки пишутся
+        # по каждой попытке, а не по вызову целиком
+        make_request = apihelper._make_request
+        if getattr(make_request, 'resilient', None) is not None:
+            return self
+        self._make_request = make_request
+
+        @functools.wraps(make_request)
+        def wrapper(token, method_name, method='get', params=None, files=None):
+            return self.call(token, method_name, method, params, files)
+        wrapper.resilient = self
+        apihelper._make_request = wrapper
+        return self
+
+    def uninstall(self):
+        if getattr(apihelper._make_request, 'resilient', None) is self:
+            apihelper._make_request = self._make_request
+
+    def breaker(self, method_name):
+        breaker = self._breakers.get(method_name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(method_name, CircuitBreaker(
+                    method_name, self.failure_threshold, self.reset_timeout, self.max_reset_timeout))
+        return breaker
+
+    def call(self, token, method_name, method='get', params=None, files=None):
+        if method_name in PASSTHROUGH_METHODS:
+            return self._make_request(token, method_name, method, params=params, files=files)
+        breaker = self.breaker(method_name)
+        self.budget.deposit()
+        attempts = 1 if getattr(_local, 'single', False) else self.attempts
+        attempt = 0
+        while True:
+            try:
+                breaker.acquire()
+            except CircuitOpen:
+                if self.rejected is not None:
+                    self.rejected.labels(method_name).inc()
+                raise
+            try:
+                result = self._make_request(token, method_name, method, params=params, files=files)
+            except Exception as e:
+                reason, delay = self._classify(method_name, e, attempt)
+                if reason in ('network', 'server'):
+                    breaker.failure()
+                elif reason == 'throttled':
+                    breaker.release()
+                else:
+                    breaker.success()
+                # Файлы уже прочитаны первой попыткой, повторить их нельзя;
+                # после размыкания предохранителя повтор тоже бесполезен
+                attempt += 1
+                if delay is None or files or attempt >= attempts or breaker.state == OPEN \
+                        or not self.budget.withdraw():
+                    raise
+                try:
+                    if self.retries is not None:
+                        self.retries.labels(method_name, reason).inc()
+                    logger.warning(f"{method_name}: {reason}, повтор {attempt} через {delay:.2f} с: {str(e)}")
+                    time.sleep(delay)
+                finally:
+                    self.budget.done()
+            else:
+                breaker.success()
+                return result
+
+    def _classify(self, method_name, error, attempt):
+        # (причина, пауза перед повтором или None - не повторять)
+        reason = error_reason(error)
+        if reason == 'throttled':
+            delay = retry_after(error)
+            return reason, delay if delay <= self.max_delay else None
+        if reason == 'client':
+            return reason, None
+        if method_name not in IDEMPOTENT_METHODS and (reason == 'server' or request_sent(error)):
+            return reason, None
+        return reason, random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self):
+        # {'methods': {метод: состояние предохранителя}, 'budget': бюджет повторов}
+        return {
+            'methods': {name: breaker.stats() for name, breaker in list(self._breakers.items())},
+            'budget': self.budget.stats(),
+        }
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from admin_notify import MAX_MESSAGE_LENGTH, TITLES, AdminNotifier, error_fingerprint
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_post_does_not_sync_on_caller_thread(tmp_path, monkeypatch):
+    path = str(tmp_path / 'digest.jsonl')
+    notifier = AdminNotifier(path=path, sync_interval=0.01)
+    fsync = os.fsync
+    synced_by = []
+
+    def recording_fsync(fd):
+        synced_by.append(threading.current_thread().name)
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', recording_fsync)
+    notifier.post(1, 'payment', "заказ №1")
+    assert synced_by == []
+    # Строка уже в файле: падение процесса её не теряет
+    with open(path, encoding='utf-8') as f:
+        assert "заказ №1" in f.read()
+    wait_for(lambda: synced_by)
+    assert synced_by == ['AdminNotifier']
+    notifier.close()
+
+
+class Recorder:
+    def __init__(self, fail=0):
+        self.sent = []
+        self.fail = fail
+
+    def __call__(self, chat_id, text):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionError("нет сети")
+        self.sent.append((chat_id, text))
+
+
+def test_events_are_coalesced_into_one_digest():
+    send = Recorder()
+    notifier = AdminNotifier(send, windows={'error': 3600}, default_window=3600)
+    for order_id in (101, 102, 103):
+        notifier.post(1, 'error', f"Заказ {order_id}: таймаут", fingerprint=error_fingerprint(TimeoutError(
+            f"Заказ {order_id}: таймаут")), summary="Таймаут при отправке")
+    notifier.post(1, 'error', "Файл не найден")
+    notifier.post(1, 'payment', "заказ №7 оплачен")
+    # Окно ещё открыто - ничего не уходит
+    assert notifier.flush() == 0 and send.sent == []
+    assert notifier.flush(force=True) == 2
+    texts = dict((text.split(':')[0], text) for _, text in send.sent)
+    assert texts[TITLES['error']] == f"{TITLES['error']}: 4\n\n• Таймаут при отправке (×3)\n\nФайл не найден"
+    # Одиночное событие уходит как есть, без заголовка
+    assert 'заказ №7 оплачен' in [text for _, text in send.sent]
+    notifier.close()
+
+
+def test_error_fingerprint_ignores_numbers():
+    assert error_fingerprint(ValueError("чат 123, заказ 45")) == error_fingerprint(ValueError("чат 9, заказ 1"))
+    assert error_fingerprint(ValueError("x")) != error_fingerprint(KeyError("x"))
+
+
+def test_long_digest_is_split_under_telegram_limit():
+    send = Recorder()
+    notifier = AdminNotifier(send, default_window=3600)
+    for i in range(10):
+        notifier.post(1, 'payment', f"заказ {i}\n" + "строка заказа\n" * 100)
+    notifier.flush(force=True)
+    assert len(send.sent) > 1
+    assert all(len(text) <= MAX_MESSAGE_LENGTH for _, text in send.sent)
+    assert sum(text.count("заказ ") for _, text in send.sent) == 10
+    notifier.close()
+
+
+def test_failed_digest_is_kept_for_next_window(tmp_path):
+    send = Recorder(fail=1)
+    notifier = AdminNotifier(send, default_window=3600, path=str(tmp_path / 'digest.jsonl'))
+    notifier.post(1, 'payment', "заказ №1")
+    notifier.flush(force=True)
+    assert send.sent == []
+    notifier.flush(force=True)
+    assert send.sent == [(1, "заказ №1")]
+    notifier.close()
+
+
+def test_unsent_events_survive_crash(tmp_path):
+    path = str(tmp_path / 'digest.jsonl')
+    crashed = AdminNotifier(default_window=0.3, path=path)
+    crashed.post(1, 'error', "Ошибка 1", fingerprint='E', summary="Ошибка")
+    crashed.post(1, 'error', "Ошибка 2", fingerprint='E', summary="Ошибка")
+    crashed.post(1, 'payment', "заказ №5")
+    # Процесс упал, не дописав строку: close() не вызывается
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"chat_id": 1, "kind": "pay')
+
+    send = Recorder()
+    restarted = AdminNotifier(send, default_window=0.3, path=path)
+    # Окно отсчитывается от времени событий, а не от перезапуска
+    wait_for(lambda: len(send.sent) == 2)
+    assert sorted(text for _, text in send.sent) == sorted([f"{TITLES['error']}: 2\n\n• Ошибка (×2)", "заказ №5"])
+    # Отправленное из журнала убрано
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == ''
+    restarted.close()
+    crashed._stop.set()
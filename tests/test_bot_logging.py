@@ -0,0 +1,88 @@
+import json
+import logging
+import queue
+import threading
+
+from bot_logging import (BatchingFileHandler, BatchingQueueListener, DroppingQueueHandler, JsonLinesFormatter,
+                         dropped_records)
+
+
+def make_logger(name, handler):
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def test_records_over_limit_are_dropped_and_counted():
+    log_queue = queue.SimpleQueue()
+    handler = DroppingQueueHandler(log_queue, max_size=3)
+    logger = make_logger('test.dropping', handler)
+    for i in range(5):
+        logger.info("запись %d", i)
+    assert log_queue.qsize() == 3 and handler.dropped == 2
+    assert [log_queue.get().getMessage() for _ in range(3)] == ["запись 0", "запись 1", "запись 2"]
+    # Очередь разгрузилась - записи снова принимаются
+    logger.info("ещё")
+    assert log_queue.qsize() == 1 and handler.dropped == 2
+
+
+def test_drops_from_many_threads_are_not_lost():
+    log_queue = queue.SimpleQueue()
+    handler = DroppingQueueHandler(log_queue, max_size=100)
+    logger = make_logger('test.dropping.threads', handler)
+
+    def spam():
+        for _ in range(2000):
+            logger.info("x")
+
+    threads = [threading.Thread(target=spam) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Предел по qsize() может быть превышен на пару записей, но каждая запись учтена
+    assert log_queue.qsize() + handler.dropped == 16000
+    assert log_queue.qsize() < 200
+
+
+def test_dropped_records_sums_root_handlers():
+    root = logging.getLogger()
+    handler = DroppingQueueHandler(queue.SimpleQueue(), max_size=0)
+    before = dropped_records()
+    root.addHandler(handler)
+    try:
+        logging.getLogger('test.root_drops').warning("не влезет")
+        assert dropped_records() == before + 1
+    finally:
+        root.removeHandler(handler)
+
+
+def test_message_arguments_are_captured_when_logged():
+    log_queue = queue.SimpleQueue()
+    logger = make_logger('test.dropping.args', DroppingQueueHandler(log_queue))
+    order = {'pages': 1}
+    logger.info("заказ %s", order)
+    order['pages'] = 2
+    assert log_queue.get().getMessage() == "заказ {'pages': 1}"
+
+
+def test_records_reach_file_as_json_lines(tmp_path):
+    path = tmp_path / 'bot.log'
+    file_handler = BatchingFileHandler(str(path), batch_size=10)
+    file_handler.setFormatter(JsonLinesFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = BatchingQueueListener(log_queue, file_handler, flush_interval=0.05)
+    listener.start()
+    logger = make_logger('test.dropping.file', DroppingQueueHandler(log_queue))
+    logger.info("Начал оформление заказа", extra={'user_id': 1, 'chat_id': 2, 'action': 'order'})
+    try:
+        raise ValueError("сбой")
+    except ValueError:
+        logger.exception("Ошибка")
+    listener.stop()
+    first, second = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert (first['message'], first['user_id'], first['chat_id'], first['action']) == \
+        ("Начал оформление заказа", 1, 2, 'order')
+    assert second['level'] == 'ERROR' and 'ValueError: сбой' in second['exc']
@@ -0,0 +1,176 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from chat_executor import ChatExecutor, task_key, task_class, PAYMENT, CHAT
+
+
+def message(chat_id, content_type='text'):
+    return SimpleNamespace(chat=SimpleNamespace(id=chat_id), content_type=content_type)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+def test_task_key_and_class():
+    query = SimpleNamespace(from_user=SimpleNamespace(id=7), invoice_payload='order_1', total_amount=100)
+    callback = SimpleNamespace(message=message(3))
+    assert task_key((message(5),)) == 5
+    assert task_key((callback,)) == 3
+    assert task_key((query,)) == 7
+    assert task_key(([message(1), message(2)],)) is None
+    assert task_class((query,)) == PAYMENT
+    assert task_class((message(5, 'successful_payment'),)) == PAYMENT
+    assert task_class((message(5),)) == CHAT
+
+
+def test_tasks_of_one_chat_run_in_order_and_never_in_parallel():
+    executor = ChatExecutor(min_workers=4, max_workers=8)
+    seen = {chat_id: [] for chat_id in range(5)}
+    active = {chat_id: 0 for chat_id in range(5)}
+    overlaps = []
+    lock = threading.Lock()
+
+    def handle(msg, number):
+        with lock:
+            active[msg.chat.id] += 1
+            if active[msg.chat.id] > 1:
+                overlaps.append(msg.chat.id)
+        time.sleep(random.random() / 1000)
+        with lock:
+            active[msg.chat.id] -= 1
+            seen[msg.chat.id].append(number)
+
+    for number in range(40):
+        for chat_id in seen:
+            executor.put(handle, message(chat_id), number)
+    executor.close(timeout=10)
+    assert not overlaps
+    assert all(numbers == list(range(40)) for numbers in seen.values())
+    assert executor.stats()['completed'] == 200
+
+
+def test_different_chats_run_in_parallel():
+    executor = ChatExecutor(min_workers=2, max_workers=2)
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+    for chat_id in (1, 2):
+        executor.put(lambda msg: results.append(barrier.wait()), message(chat_id))
+    executor.close(timeout=10)
+    assert sorted(results) == [0, 1]
+
+
+def test_busy_chat_does_not_starve_others():
+    executor = ChatExecutor(min_workers=1, max_workers=1, reserved_workers=0)
+    order = []
+    for number in range(3):
+        executor.put(lambda msg, n: order.append((msg.chat.id, n)), message(1), number)
+    executor.put(lambda msg: order.append((msg.chat.id, 0)), message(2))
+    executor.close(timeout=10)
+    # После каждой задачи чат встаёт в конец очереди, за другими чатами
+    assert order.index((2, 0)) < order.index((1, 2))
+
+
+def test_payment_lane_is_served_while_chat_workers_are_busy():
+    # Резервные потоки запускаются при подключении к боту
+    bot = SimpleNamespace(exception_handler=None)
+    executor = ChatExecutor(bot, min_workers=1, max_workers=1, reserved_workers=1)
+    assert bot.worker_pool is executor and executor.stats()['reserved_workers'] == 1
+    release = threading.Event()
+    paid = threading.Event()
+    executor.put(lambda msg: release.wait(5), message(1))
+    wait_for(lambda: executor.stats()['running'] == 1)
+    executor.put(lambda msg: paid.set(), message(2, 'successful_payment'))
+    assert paid.wait(5)
+    release.set()
+    executor.close(timeout=10)
+    stats = executor.stats()
+    assert stats['classes'][PAYMENT]['tasks'] == 1 and stats['classes'][CHAT]['tasks'] == 1
+
+
+def test_failed_task_is_reported_and_lane_continues():
+    executor = ChatExecutor(min_workers=1, max_workers=1)
+    done = []
+
+    def fail(msg):
+        raise ValueError("ошибка обработчика")
+
+    executor.put(fail, message(1))
+    executor.put(lambda msg: done.append(msg.chat.id), message(1))
+    executor.close(timeout=10)
+    assert done == [1]
+    assert executor.stats()['failed'] == 1
+    assert executor.exception_event.is_set()
+    assert isinstance(executor.exception_info, ValueError)
+
+
+def pre_checkout(user_id):
+    return SimpleNamespace(from_user=SimpleNamespace(id=user_id), invoice_payload='order_1', total_amount=100)
+
+
+def test_free_worker_takes_payment_before_waiting_chats():
+    executor = ChatExecutor(min_workers=1, max_workers=1, reserved_workers=0)
+    release = threading.Event()
+    order = []
+    executor.put(lambda msg: release.wait(5), message(1))
+    wait_for(lambda: executor.stats()['running'] == 1)
+    executor.put(lambda msg: order.append('chat 2'), message(2))
+    executor.put(lambda msg: order.append('chat 3'), message(3))
+    executor.put(lambda msg: order.append('payment'), message(4, 'successful_payment'))
+    release.set()
+    executor.close(timeout=10)
+    assert order == ['payment', 'chat 2', 'chat 3']
+
+
+def test_payment_overtakes_queued_tasks_of_same_chat():
+    # Платёжная полоса чата не ждёт его обычных задач, в том числе выполняющейся
+    executor = ChatExecutor(SimpleNamespace(exception_handler=None), min_workers=1, max_workers=1,
+                            reserved_workers=1)
+    release = threading.Event()
+    order = []
+    executor.put(lambda msg: release.wait(5), message(1))
+    executor.put(lambda msg: order.append('text'), message(1))
+    executor.put(lambda query: order.append('pre_checkout'), pre_checkout(1))
+    executor.put(lambda msg: order.append('payment'), message(1, 'successful_payment'))
+    wait_for(lambda: len(order) == 2)
+    assert order == ['pre_checkout', 'payment']
+    release.set()
+    executor.close(timeout=10)
+    assert order == ['pre_checkout', 'payment', 'text']
+
+
+def test_payment_tasks_of_one_user_keep_order():
+    # pre-checkout приходит с from_user, оплата - с chat: в личке это один ключ
+    executor = ChatExecutor(SimpleNamespace(exception_handler=None), min_workers=2, max_workers=4,
+                            reserved_workers=2)
+    order = []
+    active = []
+
+    def handle(name):
+        active.append(name)
+        assert len(active) == 1
+        time.sleep(0.02)
+        order.append(name)
+        active.remove(name)
+
+    executor.put(lambda query: handle('pre_checkout'), pre_checkout(1))
+    executor.put(lambda msg: handle('payment'), message(1, 'successful_payment'))
+    executor.close(timeout=10)
+    assert order == ['pre_checkout', 'payment']
+    assert executor.stats()['failed'] == 0
+
+
+def test_lane_budget_misses_are_counted():
+    executor = ChatExecutor(min_workers=1, max_workers=1, reserved_workers=0,
+                            payment_budget=0.01, chat_budget=None)
+    executor.put(lambda msg: time.sleep(0.03), message(1, 'successful_payment'))
+    executor.put(lambda msg: time.sleep(0.03), message(1))
+    executor.close(timeout=10)
+    classes = executor.stats()['classes']
+    assert classes[PAYMENT]['deadline_misses'] == 1 and classes[PAYMENT]['max_latency_ms'] >= 30
+    assert classes[CHAT]['deadline_misses'] == 0 and classes[CHAT]['tasks'] == 1
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from invoices import InvoiceRejected, create_invoice_index
+from order_model import Order, OrderFile, PaperFormat, PrintType, Side
+
+
+def make_order(path=None):
+    return Order(type=PrintType.BW, page_count=3, format=PaperFormat.A4, side=Side.DOUBLE,
+                 file=OrderFile('a.pdf', 'f1', path=path, kind='pdf', pages=3), comment='-')
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_index(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            kwargs['path'] = str(tmp_path / 'orders.db')
+        return create_invoice_index(request.param, **kwargs)
+    return make
+
+
+def test_verify_accepts_matching_pre_checkout(make_index):
+    index = make_index()
+    snapshot = index.issue(10, 20, make_order(), 13500)
+    verified = index.verify(snapshot['payload'], 20, 13500, 'RUB')
+    assert verified['order_id'] == snapshot['order_id']
+    assert verified['order'] == {'type': 'чб', 'page_count': 3, 'format': 'A4', 'side': 'двухсторонняя',
+                                 'comment': '-', 'file_name': 'a.pdf'}
+
+
+@pytest.mark.parametrize('user_id, amount, currency, reason', [
+    (21, 13500, 'RUB', "другому пользователю"),
+    (20, 100, 'RUB', "Сумма"),
+    (20, 13500, 'USD', "Сумма"),
+])
+def test_verify_rejects_mismatch(make_index, user_id, amount, currency, reason):
+    index = make_index()
+    payload = index.issue(10, 20, make_order(), 13500)['payload']
+    with pytest.raises(InvoiceRejected, match=reason):
+        index.verify(payload, user_id, amount, currency)
+    # Отказ не трогает счёт: правильный pre-checkout проходит
+    assert index.verify(payload, 20, 13500, 'RUB')
+
+
+def test_verify_rejects_unknown_payload(make_index):
+    index = make_index()
+    with pytest.raises(InvoiceRejected, match="не найден"):
+        index.verify('order_nope', 20, 13500, 'RUB')
+
+
+def test_verify_rejects_expired_invoice(make_index):
+    expired = []
+    index = make_index(ttl=0.05, on_expire=expired.append)
+    payload = index.issue(10, 20, make_order('/tmp/a.pdf'), 13500)['payload']
+    assert index.verify(payload, 20, 13500, 'RUB')
+    time.sleep(0.1)
+    with pytest.raises(InvoiceRejected, match="устарел"):
+        index.verify(payload, 20, 13500, 'RUB')
+    assert [snapshot['payload'] for snapshot in expired] == [payload]
+    assert len(index) == 0 and index.file_paths() == set()
+
+
+def test_purge_expired(make_index):
+    expired = []
+    index = make_index(ttl=0.05, on_expire=expired.append)
+    old = index.issue(10, 20, make_order('/tmp/old.pdf'), 100)['payload']
+    time.sleep(0.1)
+    index.ttl = 60
+    fresh = index.issue(11, 21, make_order('/tmp/new.pdf'), 200)['payload']
+    assert index.purge_expired() == 1
+    assert [snapshot['payload'] for snapshot in expired] == [old]
+    assert index.get(old) is None and index.get(fresh)
+    assert index.file_paths() == {'/tmp/new.pdf'}
+
+
+def test_delete_returns_snapshot_once(make_index):
+    index = make_index()
+    snapshot = index.issue(10, 20, make_order(), 13500)
+    assert index.delete(snapshot['payload'])['order_id'] == snapshot['order_id']
+    assert index.delete(snapshot['payload']) is None
+
+
+def test_concurrent_delete_and_purge_take_invoice_once(make_index):
+    # Оплата и очистка по ttl удаляют один счёт одновременно: снимок достаётся ровно одному
+    expired = []
+    index = make_index(ttl=0.05, on_expire=expired.append)
+    payloads = [index.issue(chat_id, chat_id, make_order(), 100)['payload'] for chat_id in range(50)]
+    time.sleep(0.1)
+    paid = []
+    start = threading.Barrier(3)
+
+    def pay():
+        start.wait()
+        for payload in payloads:
+            snapshot = index.delete(payload)
+            if snapshot is not None:
+                paid.append(snapshot['payload'])
+
+    def purge():
+        start.wait()
+        for _ in payloads:
+            index.purge_expired()
+
+    threads = [threading.Thread(target=pay), threading.Thread(target=purge), threading.Thread(target=pay)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    taken = paid + [snapshot['payload'] for snapshot in expired]
+    assert sorted(taken) == sorted(payloads)
+    assert len(index) == 0
@@ -0,0 +1,79 @@
+import copy
+import json
+
+import pytest
+from telebot import types
+
+from lazy_types import LazyUpdate
+
+USER = {'id': 42, 'is_bot': False, 'first_name': 'Иван', 'username': 'ivan', 'language_code': 'ru'}
+CHAT = {'id': 42, 'type': 'private', 'first_name': 'Иван', 'username': 'ivan'}
+
+
+def message(**fields):
+    return {'update_id': 1, 'message': {'message_id': 7, 'date': 1700000000, 'chat': CHAT, 'from': USER, **fields}}
+
+
+UPDATES = {
+    'command': message(text='/start', entities=[{'type': 'bot_command', 'offset': 0, 'length': 6}]),
+    'button': message(text='🖨 Начать заказ'),
+    'document': message(document={'file_id': 'f1', 'file_unique_id': 'u1', 'file_name': 'a.pdf',
+                                  'mime_type': 'application/pdf', 'file_size': 1024}),
+    'photo': message(photo=[{'file_id': 'p1', 'file_unique_id': 'q1', 'width': 90, 'height': 90},
+                            {'file_id': 'p2', 'file_unique_id': 'q2', 'width': 800, 'height': 800,
+                             'file_size': 5000}]),
+    'payment': message(successful_payment={
+        'currency': 'RUB', 'total_amount': 13500, 'invoice_payload': 'order_1',
+        'telegram_payment_charge_id': 'tg1', 'provider_payment_charge_id': 'pr1',
+        'order_info': {'email': 'a@b.c', 'phone_number': '+7000'}}),
+    'topic': message(text='3', message_thread_id=5, is_topic_message=True),
+    # Поле, которое ленивый разбор не знает: объект дополняется обычным de_json
+    'caption': message(caption='подпись', caption_entities=[{'type': 'bold', 'offset': 0, 'length': 3}],
+                       document={'file_id': 'f1', 'file_unique_id': 'u1'}),
+    'pre_checkout': {'update_id': 2, 'pre_checkout_query': {
+        'id': 'q1', 'from': USER, 'currency': 'RUB', 'total_amount': 13500, 'invoice_payload': 'order_1',
+        'order_info': {'email': 'a@b.c'}}},
+}
+
+
+def assert_same(eager, lazy, path):
+    if isinstance(eager, list):
+        assert isinstance(lazy, list) and len(lazy) == len(eager), path
+        for i, (e, l) in enumerate(zip(eager, lazy)):
+            assert_same(e, l, f"{path}[{i}]")
+    elif isinstance(eager, types.JsonDeserializable):
+        assert isinstance(lazy, type(eager)), path
+        for name, value in vars(eager).items():
+            assert_same(value, getattr(lazy, name), f"{path}.{name}")
+    else:
+        assert lazy == eager, path
+
+
+@pytest.mark.parametrize('name', sorted(UPDATES))
+def test_lazy_update_matches_eager_update(name):
+    eager = types.Update.de_json(copy.deepcopy(UPDATES[name]))
+    lazy = LazyUpdate(copy.deepcopy(UPDATES[name]))
+    assert_same(eager, lazy, 'update')
+
+
+def test_fields_read_by_handlers_and_filters():
+    update = LazyUpdate(copy.deepcopy(UPDATES['command']))
+    msg = update.message
+    assert isinstance(msg, types.Message)
+    assert msg.content_type == 'text'
+    assert (msg.chat.id, msg.from_user.id, msg.from_user.username) == (42, 42, 'ivan')
+    assert [entity.type for entity in msg.entities] == ['bot_command']
+    assert msg.html_text == '/start'
+    assert msg.document is None and msg.photo is None and msg.successful_payment is None
+    assert update.callback_query is None
+
+    photo = LazyUpdate(copy.deepcopy(UPDATES['photo'])).message
+    assert photo.content_type == 'photo'
+    assert [size.file_id for size in photo.photo] == ['p1', 'p2']
+
+
+def test_de_json_accepts_string():
+    update = LazyUpdate.de_json(json.dumps(UPDATES['button'], ensure_ascii=False))
+    assert update.message.text == '🖨 Начать заказ'
+    with pytest.raises(KeyError):
+        LazyUpdate.de_json('{"message": {}}')
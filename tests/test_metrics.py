@@ -0,0 +1,160 @@
+import threading
+import urllib.error
+import urllib.request
+from types import SimpleNamespace
+
+import pytest
+from telebot import apihelper
+
+from metrics import MetricsServer, Registry, instrument_api, instrument_handlers
+
+
+def test_exposition_format():
+    registry = Registry()
+    requests = registry.counter('bot_requests', "Запросы", labels=('method',))
+    latency = registry.histogram('bot_latency_seconds', "Задержка", buckets=(0.5, 0.001, 1))
+    registry.gauge('bot_queue', "Очередь", lambda: 3)
+    registry.gauge('bot_lanes', "Полосы", lambda: {('payment',): 1, ('chat',): 2.5}, labels=('lane',))
+    requests.labels('sendMessage').inc()
+    requests.labels('sendMessage').inc(2)
+    requests.labels('say "hi"\n').inc()
+    # Граница корзины входит в неё (le - "меньше или равно")
+    for value in (0.001, 0.2, 0.7, 30):
+        latency.observe(value)
+
+    assert registry.render() == "\n".join([
+        '# HELP bot_requests Запросы',
+        '# TYPE bot_requests counter',
+        'bot_requests_total{method="sendMessage"} 3',
+        'bot_requests_total{method="say \\"hi\\"\\n"} 1',
+        '# HELP bot_latency_seconds Задержка',
+        '# TYPE bot_latency_seconds histogram',
+        'bot_latency_seconds_bucket{le="0.001"} 1',
+        'bot_latency_seconds_bucket{le="0.5"} 2',
+        'bot_latency_seconds_bucket{le="1"} 3',
+        'bot_latency_seconds_bucket{le="+Inf"} 4',
+        'bot_latency_seconds_sum 30.901',
+        'bot_latency_seconds_count 4',
+        '# HELP bot_queue Очередь',
+        '# TYPE bot_queue gauge',
+        'bot_queue 3',
+        '# HELP bot_lanes Полосы',
+        '# TYPE bot_lanes gauge',
+        'bot_lanes{lane="payment"} 1',
+        'bot_lanes{lane="chat"} 2.5',
+    ]) + "\n"
+
+
+def test_broken_gauge_does_not_break_render():
+    registry = Registry()
+    registry.gauge('bot_broken', "Сломана", lambda: 1 / 0)
+    registry.counter('bot_ok', "Работает").inc()
+    assert registry.render() == '# HELP bot_ok Работает\n# TYPE bot_ok counter\nbot_ok_total 1\n'
+
+
+def test_wrong_label_count_is_rejected():
+    counter = Registry().counter('bot_requests', "Запросы", labels=('method', 'code'))
+    with pytest.raises(ValueError):
+        counter.labels('sendMessage')
+
+
+def test_thread_shards_are_merged():
+    registry = Registry()
+    counter = registry.counter('bot_events', "События")
+    histogram = registry.histogram('bot_seconds', "Время", buckets=(1,))
+    child = counter.labels()
+    counted = threading.Semaphore(0)
+    release = threading.Event()
+
+    def work(wait):
+        for _ in range(1000):
+            child.inc()
+            histogram.observe(0.5)
+        if wait:
+            counted.release()
+            release.wait(5)
+
+    # Половина потоков завершилась, половина ещё жива: сумма одна и та же
+    finished = [threading.Thread(target=work, args=(False,)) for _ in range(4)]
+    alive = [threading.Thread(target=work, args=(True,)) for _ in range(4)]
+    for thread in finished + alive:
+        thread.start()
+    for thread in finished:
+        thread.join()
+    for _ in alive:
+        assert counted.acquire(timeout=5)
+    assert child.value() == 8000
+    assert len(child._shards._cells) == 4
+    release.set()
+    for thread in alive:
+        thread.join()
+    assert child.value() == 8000
+    # Ячейки завершившихся потоков слиты в общую сумму и больше не хранятся
+    assert child._shards._cells == []
+    child.inc()
+    assert 'bot_events_total 8001' in registry.render()
+    assert 'bot_seconds_count 8000' in registry.render()
+
+
+def test_instrument_handlers_times_buttons_not_dispatcher():
+    registry = Registry()
+    histogram = registry.histogram('bot_handler_seconds', "Обработчики", labels=('handler',))
+    calls = []
+
+    def start(message):
+        calls.append('start')
+
+    def paper(message):
+        calls.append('paper')
+
+    router = SimpleNamespace(routes={'A4': paper, 'A5': paper}, dispatch=lambda message: None)
+    bot = SimpleNamespace(message_handlers=[{'function': start}, {'function': router.dispatch}])
+    instrument_handlers(bot, histogram, routers=(router,))
+    bot.message_handlers[0]['function'](None)
+    router.routes['A4'](None)
+    router.routes['A5'](None)
+    assert calls == ['start', 'paper', 'paper']
+    assert bot.message_handlers[1]['function'] is router.dispatch
+    assert router.routes['A4'] is router.routes['A5']
+    text = registry.render()
+    assert 'bot_handler_seconds_count{handler="start"} 1' in text
+    assert 'bot_handler_seconds_count{handler="paper"} 2' in text
+
+
+def test_instrument_api_counts_errors_by_code(monkeypatch):
+    def make_request(token, method_name, method='get', params=None, files=None):
+        if method_name == 'sendMessage':
+            raise apihelper.ApiTelegramException(method_name, None, {'error_code': 429, 'description': 'x'})
+        if method_name == 'getFile':
+            raise ConnectionError("нет сети")
+        return {'ok': True}
+
+    monkeypatch.setattr(apihelper, '_make_request', make_request)
+    registry = Registry()
+    histogram = registry.histogram('bot_api_seconds', "API", labels=('method',))
+    errors = registry.counter('bot_api_errors', "Ошибки API", labels=('method', 'code'))
+    instrument_api(histogram, errors)
+    instrument_api(histogram, errors)  # повторный вызов не оборачивает второй раз
+    assert apihelper._make_request.__wrapped__ is make_request
+    apihelper._make_request('t', 'getMe')
+    for method_name in ('sendMessage', 'getFile'):
+        with pytest.raises(Exception):
+            apihelper._make_request('t', method_name)
+    text = registry.render()
+    assert 'bot_api_errors_total{method="sendMessage",code="429"} 1' in text
+    assert 'bot_api_errors_total{method="getFile",code="ConnectionError"} 1' in text
+    assert all(f'bot_api_seconds_count{{method="{name}"}} 1' in text for name in ('getMe', 'sendMessage', 'getFile'))
+
+
+def test_metrics_server():
+    registry = Registry()
+    registry.counter('bot_ok', "Работает").inc()
+    server = MetricsServer(registry, port=0).start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics', timeout=5) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            assert b'bot_ok_total 1' in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f'http://127.0.0.1:{server.port}/other', timeout=5)
+    finally:
+        server.stop()
@@ -0,0 +1,34 @@
+import pytest
+
+from order_flow import MAX_PAGE_COUNT, file_pages, parse_page_count
+from order_model import Order
+
+
+@pytest.mark.parametrize('text, pages', [('1', 1), (' 12 ', 12), (str(MAX_PAGE_COUNT), MAX_PAGE_COUNT)])
+def test_page_count_is_parsed(text, pages):
+    assert parse_page_count(text) == pages
+
+
+@pytest.mark.parametrize('text', ['0', '-3', 'десять', '1.5', '', None, str(MAX_PAGE_COUNT + 1), '9' * 20])
+def test_bad_page_count_is_asked_again(text):
+    with pytest.raises((ValueError, TypeError)):
+        parse_page_count(text)
+
+
+def test_page_count_limit_fits_binary_order():
+    assert Order.from_bytes(Order(page_count=parse_page_count(str(MAX_PAGE_COUNT))).to_bytes()).page_count \
+        == MAX_PAGE_COUNT
+
+
+@pytest.mark.parametrize('analysis, pages', [
+    ({'kind': 'pdf', 'pages': 5}, 5),
+    ({'kind': 'docx', 'pages': 2}, 2),
+    ({'kind': 'pdf', 'pages': None}, None),
+    ({'kind': 'image', 'pages': 1}, None),
+    ({'kind': None, 'pages': None}, None),
+    # Испорченный /Count в PDF: такое число страниц не берём
+    ({'kind': 'pdf', 'pages': MAX_PAGE_COUNT + 1}, None),
+    ({'kind': 'pdf', 'pages': 2 ** 40}, None),
+])
+def test_file_pages(analysis, pages):
+    assert file_pages(analysis) == pages
@@ -0,0 +1,75 @@
+import struct
+
+import pytest
+
+from order_model import Order, OrderFile, PaperFormat, PrintType, Side
+
+
+FULL = Order(type=PrintType.COLOR, page_count=12, format=PaperFormat.A3, side=Side.DOUBLE,
+             file=OrderFile('отчёт.pdf', 'f1', '/tmp/uploads/x.pdf', 'pdf', 12),
+             comment='скрепить 📎', total=54000, state='summary', state_data={'шаг': 1, 'list': [1, None]})
+
+
+@pytest.mark.parametrize('order', [
+    FULL,
+    Order(),
+    Order(type='чб', page_count=1, format='A5'),
+    Order(file=OrderFile('a.png', 'f2', kind='image')),
+    Order(comment='', state_data={}),
+    Order(page_count=0, total=0),
+])
+def test_binary_round_trip(order):
+    data = order.to_bytes()
+    assert Order.from_bytes(data) == order
+    # Чтение из memoryview (как отдаёт SQLite) даёт то же
+    assert Order.from_bytes(memoryview(data)) == order
+
+
+def test_round_trip_keeps_unset_fields_unset():
+    order = Order.from_bytes(Order(type='чб').to_bytes())
+    assert order.page_count is None and order.total is None and order.side is None
+    assert order.file is None and order.comment is None and order.state_data is None
+
+
+def test_page_count_limits_of_binary_format():
+    # Страницы заказа - 4 байта без знака, страницы файла - 4 байта со знаком
+    assert Order.from_bytes(Order(page_count=2 ** 32 - 1).to_bytes()).page_count == 2 ** 32 - 1
+    with pytest.raises(struct.error):
+        Order(page_count=2 ** 32).to_bytes()
+    with pytest.raises(struct.error):
+        Order(page_count=-1).to_bytes()
+    file = OrderFile('a.pdf', 'f1', pages=2 ** 31 - 1)
+    assert Order.from_bytes(Order(file=file).to_bytes()).file.pages == 2 ** 31 - 1
+    with pytest.raises(struct.error):
+        Order(file=OrderFile('a.pdf', 'f1', pages=2 ** 31)).to_bytes()
+
+
+def test_unknown_version_and_long_strings_are_rejected():
+    data = bytearray(FULL.to_bytes())
+    data[0] = 99
+    with pytest.raises(ValueError):
+        Order.from_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        Order(comment='x' * 70000).to_bytes()
+
+
+def test_values_are_converted_on_write():
+    order = Order.from_dict({'type': 'цветная', 'format': 'A4', 'side': 'односторонняя', 'page_count': '7',
+                             'file': {'file_name': 'a.pdf', 'file_id': 'f1'}})
+    assert (order.type, order.format, order.side, order.page_count) == \
+        (PrintType.COLOR, PaperFormat.A4, Side.SINGLE, 7)
+    assert order.file == OrderFile('a.pdf', 'f1')
+    assert order.to_dict() == {'type': 'цветная', 'page_count': 7, 'format': 'A4', 'side': 'односторонняя',
+                               'file': {'file_name': 'a.pdf', 'file_id': 'f1', 'path': None, 'kind': None,
+                                        'pages': None}}
+    with pytest.raises(AttributeError):
+        order.update(pages=3)
+    with pytest.raises(ValueError):
+        order.update(format='A0')
+
+
+def test_copy_has_own_state_data():
+    copy = FULL.copy()
+    assert copy == FULL and copy.file is FULL.file
+    copy.state_data['шаг'] = 2
+    assert FULL.state_data['шаг'] == 1
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from order_states import (OrderStates, OrderStateStorage, AsyncOrderStateStorage, InvalidTransition,
+                          TRANSITIONS, check_transition, check_step)
+from order_store import create_order_store, AsyncOrderStore
+
+
+def test_full_order_path_is_allowed():
+    path = [OrderStates.color, OrderStates.pages, OrderStates.format, OrderStates.sides,
+            OrderStates.file, OrderStates.comment, OrderStates.summary]
+    current = None
+    for state in path:
+        current = check_transition(current, state)
+    assert current == OrderStates.summary.name
+
+
+def test_sides_after_file_is_allowed():
+    # Клиент указал одну страницу, в файле больше: стороны спрашиваются после файла
+    assert check_transition(OrderStates.file.name, OrderStates.sides) == OrderStates.sides.name
+    assert check_transition(OrderStates.sides.name, OrderStates.comment) == OrderStates.comment.name
+
+
+@pytest.mark.parametrize('current, new', [
+    (None, OrderStates.summary),
+    (OrderStates.color.name, OrderStates.file),
+    (OrderStates.pages.name, OrderStates.summary),
+    (OrderStates.summary.name, OrderStates.color),
+    ('unknown', OrderStates.color),
+])
+def test_invalid_transitions_are_rejected(current, new):
+    with pytest.raises(InvalidTransition):
+        check_transition(current, new)
+
+
+def test_every_target_is_a_known_state():
+    for targets in TRANSITIONS.values():
+        assert targets <= set(TRANSITIONS)
+
+
+def test_check_step():
+    check_step(OrderStates.format.name, OrderStates.format)
+    with pytest.raises(InvalidTransition):
+        check_step(OrderStates.pages.name, OrderStates.format)
+    with pytest.raises(InvalidTransition):
+        check_step(None, OrderStates.color)
+
+
+def test_state_lives_in_the_order(tmp_path):
+    orders = create_order_store('sqlite', path=str(tmp_path / 'orders.db'))
+    storage = OrderStateStorage(orders)
+    # Без заказа состояние не хранится
+    assert not storage.set_state(1, 1, OrderStates.color)
+    assert storage.get_state(1, 1) is None
+
+    orders.create(1)
+    assert storage.set_state(1, 1, OrderStates.color)
+    storage.set_data(1, 1, 'key', 'value')
+    reopened = OrderStateStorage(create_order_store('sqlite', path=str(tmp_path / 'orders.db')))
+    assert reopened.get_state(1, 1) == OrderStates.color.name
+    assert reopened.get_data(1, 1) == {'key': 'value'}
+
+    storage.delete_state(1, 1)
+    assert storage.get_state(1, 1) is None
+    assert storage.get_data(1, 1) == {}
+
+
+def test_async_storage_matches_sync_storage():
+    async def scenario():
+        orders = AsyncOrderStore(create_order_store('memory'))
+        storage = AsyncOrderStateStorage(orders)
+        assert not await storage.set_state(1, 1, OrderStates.pages)
+        await orders.create(1)
+        assert await storage.set_state(1, 1, OrderStates.pages)
+        async with storage.get_interactive_data(1, 1) as data:
+            data['key'] = 'value'
+        state, data = await storage.get_state(1, 1), await storage.get_data(1, 1)
+        await storage.delete_state(1, 1)
+        return state, data, await storage.get_state(1, 1)
+
+    assert asyncio.run(scenario()) == (OrderStates.pages.name, {'key': 'value'}, None)
@@ -0,0 +1,128 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from order_model import Order, OrderFile, PaperFormat
+from order_store import MemoryOrderStore, create_order_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'sqlite':
+            kwargs['path'] = str(tmp_path / 'orders.db')
+        return create_order_store(request.param, **kwargs)
+    return make
+
+
+def test_orders_are_returned_as_copies(make_store):
+    orders = make_store()
+    order = orders.create(1, {'type': 'чб', 'page_count': '3'})
+    assert order.page_count == 3
+    order.update(page_count=100)
+    assert orders[1].page_count == 3
+    orders.get(1).update(comment='чужой')
+    assert orders.update(1, format='A4').comment is None
+    assert orders[1].format is PaperFormat.A4
+    assert orders.delete(1).page_count == 3
+    assert orders.get(1) is None and orders.delete(1) is None
+    with pytest.raises(KeyError):
+        orders.update(1, comment='-')
+    with pytest.raises(KeyError):
+        orders[1]
+
+
+def test_parallel_updates_are_not_lost(make_store):
+    # Разные поля одного заказа и разные чаты правятся одновременно
+    orders = make_store()
+    for chat_id in range(8):
+        orders.create(chat_id)
+
+    def edit(chat_id, field, values):
+        for value in values:
+            orders.update(chat_id, **{field: value})
+
+    threads = []
+    for chat_id in range(8):
+        threads.append(threading.Thread(target=edit, args=(chat_id, 'page_count', range(1, 51))))
+        threads.append(threading.Thread(target=edit, args=(chat_id, 'comment', [f"{i}" for i in range(50)])))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for chat_id in range(8):
+        assert (orders[chat_id].page_count, orders[chat_id].comment) == (50, '49')
+    assert len(orders) == 8
+
+
+def test_expired_orders_are_purged(make_store):
+    expired = []
+    orders = make_store(ttl=0.05, on_expire=expired.append)
+    orders.create(1, {'file': {'file_name': 'a.pdf', 'file_id': 'f1', 'path': '/tmp/a.pdf'}})
+    orders.create(2)
+    time.sleep(0.1)
+    orders.create(3, {'file': {'file_name': 'c.pdf', 'file_id': 'f3', 'path': '/tmp/c.pdf'}})
+    # Просроченный черновик не оживает при правке
+    with pytest.raises(KeyError):
+        orders.update(2, comment='-')
+    assert orders.purge_expired() == 1
+    assert sorted(order.file.file_name if order.file else '' for order in expired) == ['', 'a.pdf']
+    assert 1 not in orders and 2 not in orders and 3 in orders
+    assert orders.file_paths() == {'/tmp/c.pdf'}
+
+
+def test_sweeper_purges_in_background(make_store):
+    orders = make_store(ttl=0.01)
+    orders.create(1)
+    orders.start_sweeper(interval=0.02)
+    deadline = time.monotonic() + 5
+    while orders.purged == 0:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert len(orders) == 0
+    orders.close()
+
+
+def test_memory_store_spreads_chats_over_shards():
+    orders = MemoryOrderStore(shards=4)
+    for chat_id in range(100):
+        orders.create(chat_id)
+    assert all(data for data, _ in orders._shards)
+    assert len(orders) == 100
+
+
+def test_sqlite_transaction_commits_expiry_and_rolls_back_errors(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    expired = []
+    orders = create_order_store('sqlite', path=path, ttl=0.05, on_expire=expired.append)
+    orders.create(1, Order(page_count=2))
+    # Ошибка внутри транзакции откатывает её, заказ не меняется
+    with pytest.raises(AttributeError):
+        orders.update(1, pages=3)
+    assert orders[1].page_count == 2
+    # KeyError после удаления просроченного черновика - удаление сохраняется
+    time.sleep(0.1)
+    with pytest.raises(KeyError):
+        orders.update(1, page_count=3)
+    assert [order.page_count for order in expired] == [2]
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == 0
+
+
+def test_sqlite_reads_orders_of_previous_versions(tmp_path):
+    path = str(tmp_path / 'orders.db')
+    orders = create_order_store('sqlite', path=path)
+    file = {'file_name': 'a.pdf', 'file_id': 'f1'}
+    with sqlite3.connect(path) as conn:
+        conn.execute("INSERT INTO orders (chat_id, data, touched) VALUES (?, ?, ?)",
+                     (1, json.dumps({'type': 'цветная', 'page_count': 4, 'file': file}), time.time()))
+    order = orders[1]
+    assert (order.page_count, order.file) == (4, OrderFile('a.pdf', 'f1'))
+    # После записи заказ хранится двоично
+    orders.update(1, comment='-')
+    with sqlite3.connect(path) as conn:
+        assert isinstance(conn.execute("SELECT data FROM orders").fetchone()[0], bytes)
+    assert create_order_store('sqlite', path=path)[1].comment == '-'
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+from telebot import apihelper
+
+from outbound import ADMIN, BROADCAST, ORDER, PAYMENT, OutboundScheduler, TokenBucket
+
+
+class Recorder:
+    # Метод бота: запоминает (chat_id, текст, время) и бросает заготовленные ошибки
+    def __init__(self, errors=None):
+        self.sent = []
+        self.errors = errors or {}
+        self.lock = threading.Lock()
+
+    def __call__(self, chat_id, text):
+        with self.lock:
+            errors = self.errors.get(text)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append((chat_id, text, time.monotonic()))
+        return text
+
+
+def api_error(code, **parameters):
+    return apihelper.ApiTelegramException('sendMessage', None, {
+        'error_code': code, 'description': 'error', 'parameters': parameters})
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.stamp
+    assert bucket.delay(now) == 0
+    bucket.take(now)
+    bucket.take(now)
+    assert bucket.delay(now) == pytest.approx(0.1)
+    assert bucket.delay(now, tokens=2) == pytest.approx(0.2)
+    assert bucket.delay(now + 0.05) == pytest.approx(0.05)
+    # Запас не копится выше burst
+    assert bucket.delay(now + 10, tokens=2) == 0
+    assert bucket.tokens == 2
+
+
+def test_chat_rate_and_order_within_chat():
+    send = Recorder()
+    outbound = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=1)
+    futures = [outbound.submit(send, 1, text, priority=priority)
+               for text, priority in [('a', BROADCAST), ('b', ORDER), ('c', PAYMENT)]]
+    assert [future.result(timeout=5) for future in futures] == ['a', 'b', 'c']
+    # Внутри чата класс не обгоняет порядок, а чат шлёт не чаще chat_rate
+    assert [text for _, text, _ in send.sent] == ['a', 'b', 'c']
+    stamps = [stamp for _, _, stamp in send.sent]
+    assert all(later - earlier >= 0.04 for earlier, later in zip(stamps, stamps[1:]))
+    outbound.close()
+
+
+def test_higher_class_goes_first_across_chats():
+    send = Recorder()
+    outbound = OutboundScheduler(global_rate=20, workers=1)
+    # Один токен на всего бота: остальные чаты ждут и выбираются по классу
+    outbound._global = TokenBucket(20, 1)
+    futures = [outbound.submit(send, 1, 'first')]
+    wait_for(lambda: send.sent)
+    futures += [outbound.submit(send, chat_id, text, priority=priority)
+                for chat_id, text, priority in [(2, 'broadcast', BROADCAST), (3, 'admin', ADMIN),
+                                                (4, 'order', ORDER), (5, 'payment', PAYMENT)]]
+    for future in futures:
+        future.result(timeout=5)
+    assert [text for _, text, _ in send.sent] == ['first', 'payment', 'order', 'admin', 'broadcast']
+    outbound.close()
+
+
+def test_waiting_chat_is_promoted_by_new_payment():
+    send = Recorder()
+    outbound = OutboundScheduler(global_rate=20, workers=1)
+    outbound._global = TokenBucket(20, 1)
+    futures = [outbound.submit(send, 1, 'first')]
+    wait_for(lambda: send.sent)
+    futures += [outbound.submit(send, 2, 'order'),
+                outbound.submit(send, 3, 'broadcast', priority=BROADCAST)]
+    # Оплата в чат, который уже ждёт с рассылкой: чат обгоняет остальных, но его порядок сохраняется
+    futures.append(outbound.submit(send, 3, 'payment', priority=PAYMENT))
+    for future in futures:
+        future.result(timeout=5)
+    assert [text for _, text, _ in send.sent] == ['first', 'broadcast', 'payment', 'order']
+    outbound.close()
+
+
+def test_429_pauses_chat_for_retry_after_and_resends():
+    send = Recorder({'slow': [api_error(429, retry_after=0.3)]})
+    outbound = OutboundScheduler(global_rate=1000)
+    submitted = time.monotonic()
+    slow = outbound.submit(send, 1, 'slow')
+    later = outbound.submit(send, 1, 'later')
+    other = outbound.submit(send, 2, 'other')
+    # Другие чаты паузу не ждут
+    assert other.result(timeout=5) == 'other'
+    assert not slow.done()
+    assert slow.result(timeout=5) == 'slow' and later.result(timeout=5) == 'later'
+    sent = {text: stamp for _, text, stamp in send.sent}
+    assert sent['slow'] - submitted >= 0.3
+    assert sent['slow'] < sent['later']
+    assert outbound.stats()['throttled'] == 1
+    outbound.close()
+
+
+def test_429_without_retries_fails_future_but_pauses_chat():
+    send = Recorder({'once': [api_error(429, retry_after=0.3)]})
+    outbound = OutboundScheduler(global_rate=1000)
+    failed = outbound.submit(send, 1, 'once', max_retries=0)
+    error = failed.exception(timeout=5)
+    assert isinstance(error, apihelper.ApiTelegramException) and error.error_code == 429
+    rejected_at = time.monotonic()
+    assert outbound.submit(send, 1, 'next').result(timeout=5) == 'next'
+    assert send.sent[-1][2] - rejected_at >= 0.25
+    assert outbound.stats()['failed'] == 1
+    outbound.close()
+
+
+def test_idle_chats_are_dropped():
+    send = Recorder()
+    outbound = OutboundScheduler(global_rate=1000, chat_rate=20, chat_burst=2)
+    for chat_id in range(10):
+        outbound.submit(send, chat_id, 'x').result(timeout=5)
+    # Чат без очереди удаляется, когда восстановится запас токенов
+    wait_for(lambda: outbound.stats()['chats'] == 0)
+    assert outbound.stats()['sent'] == 10
+    outbound.close()
@@ -0,0 +1,108 @@
+import os
+import time
+from concurrent.futures import Future
+
+from telebot import apihelper, types
+
+from outbox import Outbox
+
+
+class FakeBot:
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text, kwargs))
+        return len(self.sent)
+
+
+class InlineOutbound:
+    # Отправляет сразу в вызывающем потоке
+    def submit(self, func, *args, priority=None, max_retries=None, **kwargs):
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class StalledOutbound:
+    # Сообщения не уходят: Telegram недоступен до остановки бота
+    def submit(self, func, *args, priority=None, max_retries=None, **kwargs):
+        return Future()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def api_error(code, **parameters):
+    return apihelper.ApiTelegramException('sendMessage', None, {
+        'error_code': code, 'description': 'error', 'parameters': parameters})
+
+
+def test_delivered_messages_are_not_sent_again(tmp_path):
+    bot = FakeBot()
+    outbox = Outbox(bot, InlineOutbound(), directory=str(tmp_path))
+    assert outbox.submit('send_message', 1, "первое").result(timeout=5) == 1
+    assert outbox.submit('send_message', 2, "второе").result(timeout=5) == 2
+    assert outbox.stats()['pending'] == 0
+    outbox.close()
+
+    bot = FakeBot()
+    outbox = Outbox(bot, InlineOutbound(), directory=str(tmp_path))
+    assert outbox.stats()['pending'] == 0
+    outbox.close()
+    assert bot.sent == []
+
+
+def test_undelivered_messages_are_replayed_after_restart(tmp_path):
+    outbox = Outbox(FakeBot(), StalledOutbound(), directory=str(tmp_path))
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add('Пропустить')
+    outbox.submit('send_message', 1, "первое", reply_markup=markup)
+    outbox.submit('send_message', 2, "второе")
+    outbox.close()
+
+    bot = FakeBot()
+    outbox = Outbox(bot, InlineOutbound(), directory=str(tmp_path))
+    wait_for(lambda: outbox.stats()['pending'] == 0)
+    outbox.close()
+    assert [(chat_id, text) for chat_id, text, _ in bot.sent] == [(1, "первое"), (2, "второе")]
+    # Клавиатура из журнала уходит тем же JSON
+    assert bot.sent[0][2]['reply_markup'].to_json() == markup.to_json()
+
+    bot = FakeBot()
+    outbox = Outbox(bot, InlineOutbound(), directory=str(tmp_path))
+    outbox.close()
+    assert bot.sent == []
+
+
+def test_server_error_is_retried_and_client_error_dropped(tmp_path):
+    bot = FakeBot(errors=[api_error(502)])
+    outbox = Outbox(bot, InlineOutbound(), directory=str(tmp_path), base_delay=0.01)
+    assert outbox.submit('send_message', 1, "после повтора").result(timeout=5) == 1
+
+    bot.errors.append(api_error(400))
+    rejected = outbox.submit('send_message', 2, "чат не найден")
+    assert isinstance(rejected.exception(timeout=5), apihelper.ApiTelegramException)
+    stats = outbox.stats()
+    outbox.close()
+    assert stats['retried'] == 1 and stats['dropped'] == 1 and stats['pending'] == 0
+
+
+def test_delivered_segments_are_removed(tmp_path):
+    outbox = Outbox(FakeBot(), InlineOutbound(), directory=str(tmp_path), segment_size=200)
+    for i in range(20):
+        outbox.submit('send_message', i, "сообщение").result(timeout=5)
+    segment = outbox.stats()['segment']
+    outbox.close()
+    assert segment > 1
+    assert os.listdir(tmp_path) == [f"outbox-{segment:06d}.jsonl"]
@@ -0,0 +1,110 @@
+import zipfile
+import zlib
+
+import pytest
+
+from page_counter import PageCounter, detect_kind
+
+
+def pdf(*objects):
+    body = b'%PDF-1.7\n'
+    for number, obj in enumerate(objects, 1):
+        body += b'%d 0 obj\n' % number + obj + b'\nendobj\n'
+    return body + b'trailer\n<< /Root 1 0 R >>\n%%EOF\n'
+
+
+def stream(header, data):
+    return header + b'\nstream\n' + data + b'\nendstream'
+
+
+def count(data, file_name='file.pdf', chunk_size=7):
+    counter = PageCounter(file_name)
+    for i in range(0, len(data), chunk_size):
+        counter.feed(data[i:i + chunk_size])
+    return counter.finish()
+
+
+PLAIN = pdf(
+    b'<< /Type /Catalog /Pages 2 0 R >>',
+    b'<< /Type /Pages /Kids [3 0 R 4 0 R 5 0 R] /Count 3 >>',
+    b'<< /Type /Page /Parent 2 0 R >>',
+    b'<< /Type /Page /Parent 2 0 R >>',
+    b'<< /Type /Page /Parent 2 0 R >>',
+)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64 * 1024])
+def test_pages_tree_count_across_chunk_boundaries(chunk_size):
+    assert count(PLAIN, chunk_size=chunk_size) == {'kind': 'pdf', 'pages': 3}
+
+
+def test_compact_syntax_without_spaces():
+    data = pdf(b'<</Type/Pages/Kids[2 0 R 3 0 R]/Count 2>>', b'<</Type/Page>>', b'<</Type/Page>>')
+    assert count(data)['pages'] == 2
+
+
+def test_page_objects_when_tree_has_no_count():
+    data = pdf(b'<< /Type /Page >>', b'<< /Type /Page >>', b'<< /Type /Page >>', b'<< /Type /Page >>')
+    assert count(data)['pages'] == 4
+
+
+def test_pages_inside_compressed_object_stream():
+    objects = b'2 0 3 60 << /Type /Pages /Kids [3 0 R] /Count 12 >> << /Type /Page /Parent 2 0 R >>'
+    data = pdf(
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        stream(b'<< /Type /ObjStm /N 2 /First 8 /Filter /FlateDecode /Length %d >>' % len(objects),
+               zlib.compress(objects)),
+    )
+    assert count(data)['pages'] == 12
+
+
+@pytest.mark.parametrize('chunk_size', [13, 1000, 64 * 1024])
+def test_long_objects_split_into_many_chunks(chunk_size):
+    # Длинный объект без потока и большой несжатый поток объектов: поиск
+    # продолжается с места остановки и не теряет ключевые слова на стыках кусков
+    drawing = b'[' + b'0 0 1 rg 10 10 m 20 20 l S ' * 5000 + b']'
+    objects = b'2 0 ' + b'<< /Type /Page >> ' * 5000 + b'<< /Type /Pages /Count 7 >>'
+    data = pdf(
+        b'<< /Type /Pages /Count 5 /Drawing ' + drawing + b' >>',
+        stream(b'<< /Type /ObjStm /N 2 /First 4 /Length %d >>' % len(objects), objects),
+    )
+    assert count(data, chunk_size=chunk_size)['pages'] == 7
+    assert count(data.replace(b'/Count 7', b'/Count 3'), chunk_size=chunk_size)['pages'] == 5
+
+
+def test_binary_streams_are_skipped():
+    # Текст внутри картинки похож на дерево страниц, но не считается
+    noise = b'\x00\xff /Type /Pages /Count 99 \x00'
+    data = pdf(
+        b'<< /Type /Pages /Kids [2 0 R] /Count 1 >>',
+        stream(b'<< /Type /XObject /Subtype /Image /Length %d >>' % len(noise), noise),
+        b'<< /Type /Page >>',
+    )
+    assert count(data)['pages'] == 1
+
+
+def test_docx_pages_from_app_properties(tmp_path):
+    path = tmp_path / 'file.docx'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('word/document.xml', '<w:document/>')
+        archive.writestr('docProps/app.xml', '<Properties><Pages>7</Pages></Properties>')
+    counter = PageCounter('file.docx')
+    counter.feed(path.read_bytes())
+    assert counter.finish(str(path)) == {'kind': 'docx', 'pages': 7}
+
+
+def test_file_from_cache_is_read_from_disk(tmp_path):
+    path = tmp_path / 'file.pdf'
+    path.write_bytes(PLAIN)
+    assert PageCounter('file.pdf').finish(str(path)) == {'kind': 'pdf', 'pages': 3}
+
+
+@pytest.mark.parametrize('head, file_name, kind', [
+    (b'\x89PNG\r\n\x1a\n' + b'\x00' * 8, 'photo.png', 'image'),
+    (b'\xff\xd8\xff\xe0' + b'\x00' * 12, 'photo.jpg', 'image'),
+    (b'PK\x03\x04' + b'\x00' * 12, 'archive.zip', 'zip'),
+    (b'just some text..', 'notes.txt', None),
+])
+def test_detect_kind(head, file_name, kind):
+    assert detect_kind(head, file_name) == kind
+    assert count(head, file_name)['pages'] == (1 if kind == 'image' else None)
@@ -0,0 +1,76 @@
+from payment_ledger import PaymentLedger
+
+
+def entry(charge_id, amount=13500, time=None):
+    data = {
+        'charge_id': charge_id,
+        'provider_charge_id': f"p-{charge_id}",
+        'payload': f"order_{charge_id}",
+        'order_id': charge_id,
+        'chat_id': 1,
+        'user_id': 1,
+        'username': 'user',
+        'amount': amount,
+        'currency': 'RUB',
+        'email': None,
+        'phone': None,
+        'order': {'type': 'цветная', 'side': 'односторонняя'},
+    }
+    if time is not None:
+        data['time'] = time
+    return data
+
+
+def test_duplicate_delivery_returns_stored_entry(tmp_path):
+    ledger = PaymentLedger(str(tmp_path))
+    first, created = ledger.record(entry('c1', amount=100))
+    again, created_again = ledger.record(entry('c1', amount=999))
+    assert created and not created_again
+    assert again == first
+    assert len(ledger) == 1
+    ledger.close()
+
+
+def test_notified_marker_survives_reload(tmp_path):
+    ledger = PaymentLedger(str(tmp_path))
+    ledger.record(entry('c1'))
+    ledger.record(entry('c2'))
+    ledger.mark_notified('c1')
+    ledger.mark_notified('c1')
+    ledger.close()
+
+    ledger = PaymentLedger(str(tmp_path))
+    # Платёж c2 записан, но уведомления не отправлены: повторная доставка их доделает
+    assert ledger.notified('c1')
+    assert not ledger.notified('c2')
+    assert 'c2' in ledger
+    assert len(ledger) == 2
+    ledger.close()
+
+
+def test_scan_skips_markers_and_revenue_counts_payments_once(tmp_path):
+    ledger = PaymentLedger(str(tmp_path))
+    ledger.record(entry('c1', amount=100, time=1000))
+    ledger.mark_notified('c1')
+    ledger.record(entry('c2', amount=200, time=2000))
+    ledger.record(entry('c2', amount=200, time=2001))
+    assert [e['charge_id'] for e in ledger.scan()] == ['c1', 'c2']
+    assert [e['charge_id'] for e in ledger.scan(start=1500)] == ['c2']
+    assert sum(day['amount'] for day in ledger.revenue().values()) == 300
+    ledger.close()
+
+
+def test_damaged_tail_is_truncated(tmp_path):
+    ledger = PaymentLedger(str(tmp_path))
+    ledger.record(entry('c1'))
+    ledger.close()
+    with open(ledger._path(1), 'ab') as f:
+        f.write(b'{"charge_id": "c2", "amo')
+
+    ledger = PaymentLedger(str(tmp_path))
+    assert len(ledger) == 1
+    ledger.record(entry('c3'))
+    ledger.close()
+    ledger = PaymentLedger(str(tmp_path))
+    assert len(ledger) == 2
+    ledger.close()
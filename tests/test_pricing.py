@@ -0,0 +1,50 @@
+import pytest
+
+from order_model import Order, PaperFormat, PrintType, Side
+from pricing import PriceTable, prices, format_rub
+
+
+def order(pages, color_type=PrintType.BW, side=Side.SINGLE, paper_format=PaperFormat.A4):
+    return Order(type=color_type, page_count=pages, side=side, format=paper_format)
+
+
+def test_unit_prices_in_kopecks():
+    table = PriceTable(prices)
+    assert len(table.table) == 2 * 2 * 4
+    assert table.unit_price('чб', 'односторонняя', 'A5') == 1000
+    assert table.unit_price(PrintType.COLOR, Side.DOUBLE, PaperFormat.A2) == 9000
+    # 15 * 1.5 = 22.5 руб.: дробный множитель без ошибок float
+    assert table.unit_price('чб', 'двухсторонняя', 'A4') == 2250
+
+
+def test_quote_without_discounts():
+    table = PriceTable(prices)
+    assert table.quote(order(10)) == 15000
+    assert table.quote(order(3, PrintType.COLOR, Side.DOUBLE, PaperFormat.A3)) == 18000
+
+
+def test_one_page_order_uses_default_side():
+    table = PriceTable(prices)
+    assert table.quote(order(1, side=None)) == table.quote(order(1, side=Side.SINGLE))
+
+
+@pytest.mark.parametrize('pages, percent', [(1, 0), (49, 0), (50, 5), (99, 5), (100, 10), (1000, 10)])
+def test_volume_discount_tiers(pages, percent):
+    # Порядок ступеней в настройке не важен
+    table = PriceTable(prices, [(100, 10), (50, 5)])
+    assert table.discount(pages) == percent
+    full = PriceTable(prices).quote(order(pages))
+    assert table.quote(order(pages)) == full - full * percent // 100
+
+
+def test_discount_keeps_whole_kopecks():
+    table = PriceTable(prices, [(1, 3)])
+    # 3 стр. по 10.00 руб. (A5): 3000 коп., скидка 3% - 90 коп.
+    assert table.quote(order(3, paper_format=PaperFormat.A5)) == 2910
+    assert table.quote_many([order(1, paper_format=PaperFormat.A5), order(2)]) == [970, 2910]
+
+
+def test_format_rub():
+    assert format_rub(15000) == "150 руб."
+    assert format_rub(2910) == "29.10 руб."
+    assert format_rub(5) == "0.05 руб."
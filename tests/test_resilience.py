@@ -0,0 +1,146 @@
+import time
+
+import pytest
+import requests
+from telebot import apihelper
+
+from resilience import (CircuitBreaker, CircuitOpen, ResilientApi, RetryBudget, CLOSED, HALF_OPEN, OPEN,
+                        single_attempt)
+
+
+def api_error(code, **parameters):
+    return apihelper.ApiTelegramException('method', None, {
+        'error_code': code, 'description': 'error', 'parameters': parameters})
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker('sendMessage', failure_threshold=3, reset_timeout=10)
+    for _ in range(2):
+        breaker.acquire()
+        breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.acquire()
+    breaker.failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.acquire()
+    assert 9 < error.value.retry_after <= 10
+    assert breaker.stats() == {'state': OPEN, 'failures': 3, 'opened': 1, 'rejected': 1}
+
+
+def test_success_resets_failure_streak():
+    breaker = CircuitBreaker('sendMessage', failure_threshold=2)
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker('sendMessage', failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.success()
+    assert breaker.state == CLOSED
+    breaker.acquire()
+
+
+def test_failed_probe_doubles_timeout_up_to_limit():
+    breaker = CircuitBreaker('sendMessage', failure_threshold=1, reset_timeout=0.05, max_reset_timeout=0.08)
+    breaker.failure()
+    for expected in (0.08, 0.08):
+        time.sleep(breaker._timeout + 0.01)
+        breaker.acquire()
+        breaker.failure()
+        assert breaker.state == OPEN
+        assert breaker._timeout == expected
+    time.sleep(0.09)
+    breaker.acquire()
+    breaker.success()
+    assert breaker._timeout == 0.05
+
+
+def test_released_probe_allows_next_probe():
+    # 429 на пробный вызов ничего не говорит о здоровье API
+    breaker = CircuitBreaker('sendMessage', failure_threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.06)
+    breaker.acquire()
+    breaker.release()
+    breaker.acquire()
+    assert breaker.state == HALF_OPEN
+
+
+def resilient(errors, **kwargs):
+    calls = []
+
+    def make_request(token, method_name, method='get', params=None, files=None):
+        calls.append(method_name)
+        if errors:
+            raise errors.pop(0)
+        return {'ok': True}
+
+    kwargs.setdefault('base_delay', 0.001)
+    api = ResilientApi(budget=RetryBudget(max_tokens=100, max_waiting=100), **kwargs)
+    api._make_request = make_request
+    return api, calls
+
+
+def test_idempotent_method_is_retried_after_server_error():
+    api, calls = resilient([api_error(502), requests.exceptions.ReadTimeout()])
+    assert api.call('token', 'getFile') == {'ok': True}
+    assert len(calls) == 3
+
+
+def test_send_is_not_retried_once_request_may_have_arrived():
+    for error in (api_error(502), requests.exceptions.ReadTimeout()):
+        api, calls = resilient([error])
+        with pytest.raises(type(error)):
+            api.call('token', 'sendMessage')
+        assert len(calls) == 1
+
+
+def test_send_is_retried_when_request_was_not_sent():
+    api, calls = resilient([requests.exceptions.ConnectTimeout()])
+    assert api.call('token', 'sendMessage') == {'ok': True}
+    assert len(calls) == 2
+
+
+def test_client_error_is_not_retried_and_keeps_breaker_closed():
+    api, calls = resilient([api_error(400)] * 10, failure_threshold=2)
+    for _ in range(3):
+        with pytest.raises(apihelper.ApiTelegramException):
+            api.call('token', 'getFile')
+    assert len(calls) == 3
+    assert api.breaker('getFile').state == CLOSED
+
+
+def test_throttled_call_waits_retry_after_unless_too_long():
+    api, calls = resilient([api_error(429, retry_after=0)], max_delay=1)
+    assert api.call('token', 'sendMessage') == {'ok': True}
+    assert len(calls) == 2
+
+    api, calls = resilient([api_error(429, retry_after=30)], max_delay=1)
+    with pytest.raises(apihelper.ApiTelegramException):
+        api.call('token', 'sendMessage')
+    assert len(calls) == 1
+
+
+def test_single_attempt_and_open_breaker():
+    api, calls = resilient([api_error(502)] * 10, failure_threshold=2)
+    with single_attempt():
+        with pytest.raises(apihelper.ApiTelegramException):
+            api.call('token', 'getFile')
+    assert len(calls) == 1
+    # Второй сбой размыкает предохранитель, дальше вызовы не доходят до сети
+    with pytest.raises(apihelper.ApiTelegramException):
+        api.call('token', 'getFile')
+    assert len(calls) == 2
+    with pytest.raises(CircuitOpen):
+        api.call('token', 'getFile')
+    assert len(calls) == 2
+    assert api.stats()['methods']['getFile']['state'] == OPEN
@@ -0,0 +1,77 @@
+import pytest
+import telebot
+from telebot import types
+from telebot.custom_filters import StateFilter
+from telebot.storage import StateMemoryStorage
+
+from order_states import OrderStates
+from text_router import TextRouter
+
+USER = {'id': 42, 'is_bot': False, 'first_name': 'Иван'}
+CHAT = {'id': 42, 'type': 'private', 'first_name': 'Иван'}
+
+
+def text_update(text):
+    return types.Update.de_json({'update_id': 1, 'message': {
+        'message_id': 1, 'date': 1700000000, 'chat': CHAT, 'from': USER, 'text': text}})
+
+
+def make_bot():
+    # Бот без сети: обновления подаются в process_new_updates, обработчики выполняются в этом же потоке
+    bot = telebot.TeleBot('1:test', threaded=False, state_storage=StateMemoryStorage())
+    bot.add_custom_filter(StateFilter(bot))
+    handled = []
+    router = TextRouter()
+
+    @bot.message_handler(commands=['start'])
+    def start(message):
+        handled.append(('start', message.text))
+
+    @bot.message_handler(state=OrderStates.pages, content_types=['text'])
+    def pages(message):
+        handled.append(('pages', message.text))
+
+    @router.handler('A4', 'A5')
+    def paper(message):
+        handled.append(('paper', message.text))
+
+    @router.handler('❌ Отменить')
+    def cancel(message):
+        handled.append(('cancel', message.text))
+
+    router.attach(bot)
+    return bot, router, handled
+
+
+def test_button_text_is_dispatched_by_exact_match():
+    bot, router, handled = make_bot()
+    for text in ('A4', 'A5', '❌ Отменить', 'a4', ' A4', 'A4 ', 'привет', '/start'):
+        bot.process_new_updates([text_update(text)])
+    assert handled == [('paper', 'A4'), ('paper', 'A5'), ('cancel', '❌ Отменить'), ('start', '/start')]
+
+
+def test_state_handler_registered_first_takes_button_text():
+    # Обработчики шагов зарегистрированы раньше кнопок: на шаге ввода числа
+    # текст кнопки достаётся обработчику шага, а не кнопке
+    bot, router, handled = make_bot()
+    bot.set_state(42, OrderStates.pages, 42)
+    bot.process_new_updates([text_update('A4')])
+    bot.process_new_updates([text_update('12')])
+    bot.delete_state(42, 42)
+    bot.process_new_updates([text_update('A4')])
+    bot.process_new_updates([text_update('12')])
+    assert handled == [('pages', 'A4'), ('pages', '12'), ('paper', 'A4')]
+
+
+def test_router_registers_single_handler():
+    bot, router, handled = make_bot()
+    dispatchers = [handler for handler in bot.message_handlers if handler['function'] == router.dispatch]
+    assert len(dispatchers) == 1
+    assert set(router.routes) == {'A4', 'A5', '❌ Отменить'}
+
+
+def test_same_button_cannot_be_routed_twice():
+    router = TextRouter()
+    router.handler('A4')(lambda message: None)
+    with pytest.raises(ValueError):
+        router.handler('A3', 'A4')(lambda message: None)
@@ -0,0 +1,135 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+import urllib3
+from telebot import apihelper
+
+from transport import API, PooledTransport, _requests_error
+
+
+class Handler(BaseHTTPRequestHandler):
+    # /ok - ответ Bot API, /short - тело короче заявленного, /slow - ответа нет
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            self.server.release.wait(5)
+            return
+        if self.path.startswith('/short'):
+            self.send_response(200)
+            self.send_header('Content-Length', '100')
+            self.end_headers()
+            self.wfile.write(b'{"ok": tr')
+            self.close_connection = True
+            return
+        data = json.dumps({'ok': True, 'result': {'id': 1, 'is_bot': True, 'first_name': 'bot',
+                                                  'username': 'bot'}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_POST = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.release = threading.Event()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}'
+    httpd.release.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize('error, expected', [
+    (urllib3.exceptions.NewConnectionError(None, "отказ"), requests.exceptions.ConnectionError),
+    (urllib3.exceptions.NameResolutionError('api.telegram.org', None, OSError()), requests.exceptions.ConnectionError),
+    (urllib3.exceptions.ConnectTimeoutError("долго"), requests.exceptions.ConnectTimeout),
+    (urllib3.exceptions.ReadTimeoutError(None, '/', "долго"), requests.exceptions.ReadTimeout),
+    (urllib3.exceptions.TimeoutError("долго"), requests.exceptions.ReadTimeout),
+    (urllib3.exceptions.SSLError("сертификат"), requests.exceptions.SSLError),
+    (urllib3.exceptions.ProxyError("прокси", OSError()), requests.exceptions.ProxyError),
+    (urllib3.exceptions.EmptyPoolError(None, "пусто"), requests.exceptions.ConnectionError),
+    (urllib3.exceptions.ProtocolError("обрыв"), requests.exceptions.ConnectionError),
+])
+def test_urllib3_errors_map_to_requests(error, expected):
+    mapped = _requests_error(error)
+    assert type(mapped) is expected
+    # NewConnectionError в urllib3 - подкласс ConnectTimeoutError, но это отказ, а не таймаут
+    if isinstance(error, urllib3.exceptions.NewConnectionError):
+        assert not isinstance(mapped, requests.exceptions.Timeout)
+
+
+def test_refused_connection_raises_connection_error():
+    transport = PooledTransport()
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError) as info:
+            transport.request('get', f'http://127.0.0.1:{closed_port()}/bot1:test/getMe', timeout=(1, 1))
+        assert not isinstance(info.value, requests.exceptions.Timeout)
+        assert isinstance(info.value.__cause__, urllib3.exceptions.NewConnectionError)
+    finally:
+        transport.close()
+
+
+def test_read_timeout_raises_read_timeout(server):
+    transport = PooledTransport()
+    try:
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            transport.request('get', f'{server}/slow', timeout=(1, 0.2))
+    finally:
+        transport.close()
+
+
+def test_busy_pool_raises_connection_error(server):
+    transport = PooledTransport(api_pool_size=1, pool_timeout=0.1)
+    try:
+        # Ответ не дочитан - единственное соединение пула занято
+        held = transport._urlopen(API, 'GET', f'{server}/ok', None, {}, None, None, stream=True)
+        with pytest.raises(requests.exceptions.ConnectionError, match="Нет свободного соединения"):
+            transport.request('get', f'{server}/ok')
+        held.close()
+        assert transport.request('get', f'{server}/ok').json()['ok']
+    finally:
+        transport.close()
+
+
+def test_truncated_body_raises_connection_error(server):
+    transport = PooledTransport()
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            transport.request('get', f'{server}/short')
+        with transport.stream(f'{server}/short') as response:
+            with pytest.raises(requests.exceptions.ConnectionError):
+                b''.join(response.iter_content(16))
+    finally:
+        transport.close()
+
+
+def test_telebot_sees_requests_errors(server, monkeypatch):
+    # Через CUSTOM_REQUEST_SENDER ответы и ошибки доходят до telebot как от requests
+    transport = PooledTransport().install()
+    try:
+        monkeypatch.setattr(apihelper, 'API_URL', server + '/bot{0}/{1}')
+        assert apihelper.get_me('1:test')['username'] == 'bot'
+        monkeypatch.setattr(apihelper, 'API_URL', f'http://127.0.0.1:{closed_port()}/bot{{0}}/{{1}}')
+        with pytest.raises(requests.exceptions.ConnectionError):
+            apihelper.get_me('1:test')
+    finally:
+        transport.close()
+    assert apihelper.CUSTOM_REQUEST_SENDER is None
@@ -0,0 +1,94 @@
+import json
+import os
+
+from upload_cache import UploadCache
+
+
+def make_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(name.encode().ljust(size, b'.'))
+    return str(path)
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'), max_bytes=250)
+    for name in ('a', 'b'):
+        cache.put(name, make_file(tmp_path, f'{name}.pdf', 100), {'pages': 1})
+    # Обращение к a делает вытесняемым b
+    assert cache.get('a')['analysis'] == {'pages': 1}
+    cache.put('c', make_file(tmp_path, 'c.pdf', 100))
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.size == 200 and len(cache) == 2
+    # Файл больше всего кеша не кешируется
+    assert cache.put('d', make_file(tmp_path, 'd.pdf', 300)) is None
+
+
+def test_same_content_is_stored_once(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'))
+    first = cache.put('a', make_file(tmp_path, 'x.pdf', 100))
+    second = cache.put('b', str(tmp_path / 'x.pdf'))
+    assert first['digest'] == second['digest']
+    assert cache.size == 100 and len(cache) == 2
+
+
+def test_checkout_hard_links_blob_and_survives_eviction(tmp_path):
+    cache = UploadCache(str(tmp_path / 'cache'), max_bytes=150)
+    entry = cache.put('a', make_file(tmp_path, 'a.pdf', 100))
+    orders = tmp_path / 'orders'
+    orders.mkdir()
+    path, checked_out = cache.checkout('a', str(orders))
+    assert checked_out is entry and path.endswith('.pdf')
+    blob = os.path.join(cache.directory, entry['digest'])
+    assert os.path.samefile(path, blob)
+    assert cache.checkout('missing', str(orders)) == (None, None)
+    # Вытеснение из кеша не трогает файл заказа
+    cache.put('b', make_file(tmp_path, 'b.pdf', 100))
+    assert not os.path.exists(blob)
+    assert open(path, 'rb').read().startswith(b'a.pdf')
+
+
+def test_index_is_journaled_and_reloaded(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = UploadCache(directory, max_bytes=250)
+    journal = os.path.join(directory, 'index.jsonl')
+    cache.put('old', make_file(tmp_path, 'old.pdf', 100))
+    cache.put('a', make_file(tmp_path, 'a.pdf', 100), {'pages': 2})
+    lines = open(journal, encoding='utf-8').read().count('\n')
+    # Новый файл, обращение и вытеснение - по строке в журнале, а не переписанный индекс
+    cache.put('b', make_file(tmp_path, 'b.pdf', 100))
+    cache.get('a')
+    assert open(journal, encoding='utf-8').read().count('\n') == lines + 3
+
+    # Недописанная при падении строка не мешает загрузке
+    with open(journal, 'a', encoding='utf-8') as f:
+        f.write('{"id": "d", "dig')
+    reopened = UploadCache(directory, max_bytes=250)
+    assert len(reopened) == 2 and reopened.size == 200
+    # Обращение к a пережило перезапуск: вытесняется b
+    reopened.put('c', make_file(tmp_path, 'c.pdf', 100))
+    assert reopened.get('b') is None and reopened.get('old') is None
+    assert reopened.get('a')['analysis'] == {'pages': 2}
+
+
+def test_journal_is_compacted(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = UploadCache(directory)
+    cache.put('a', make_file(tmp_path, 'a.pdf', 10))
+    for _ in range(1500):
+        cache.get('a')
+    lines = open(os.path.join(directory, 'index.jsonl'), encoding='utf-8').read().count('\n')
+    assert lines <= 1001
+
+
+def test_legacy_index_is_migrated(tmp_path):
+    directory = tmp_path / 'cache'
+    cache = UploadCache(str(directory))
+    entry = cache.put('a', make_file(tmp_path, 'a.pdf', 100), {'pages': 3})
+    os.remove(directory / 'index.jsonl')
+    (directory / 'index.json').write_text(json.dumps({'a': entry}), encoding='utf-8')
+
+    reopened = UploadCache(str(directory))
+    assert reopened.get('a')['analysis'] == {'pages': 3}
+    assert not (directory / 'index.json').exists()
+    assert UploadCache(str(directory)).get('a')
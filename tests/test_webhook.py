@@ -0,0 +1,87 @@
+import http.client
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+from lazy_types import LazyUpdate
+from webhook import WebhookReceiver
+
+
+def make_bot():
+    batches = []
+    return SimpleNamespace(token='1:test', batches=batches, process_new_updates=batches.append)
+
+
+def body(update_id, text='привет'):
+    return json.dumps({'update_id': update_id, 'message': {
+        'message_id': update_id, 'date': 1700000000, 'chat': {'id': 1, 'type': 'private'}, 'text': text}})
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_repeated_update_is_queued_once():
+    receiver = WebhookReceiver(make_bot())
+    assert receiver.receive(body(1)) == 200
+    # Telegram повторил доставку: ответ 200, но в очередь второй раз не попадает
+    assert receiver.receive(body(1)) == 200
+    assert receiver.receive(body(2)) == 200
+    assert [receiver.updates.get_nowait().update_id for _ in range(receiver.updates.qsize())] == [1, 2]
+
+
+def test_full_queue_answers_503_and_accepts_redelivery():
+    receiver = WebhookReceiver(make_bot(), queue_size=2)
+    assert [receiver.receive(body(update_id)) for update_id in (1, 2, 3)] == [200, 200, 503]
+    # Отклонённое обновление не считается увиденным: повтор после разгрузки очереди принимается
+    receiver.updates.get_nowait()
+    assert receiver.receive(body(3)) == 200
+    assert receiver.receive(body(3)) == 200
+    assert receiver.updates.qsize() == 2
+
+
+def test_dedupe_window_is_bounded():
+    receiver = WebhookReceiver(make_bot(), dedupe_size=2)
+    for update_id in (1, 2, 3):
+        receiver.receive(body(update_id))
+    assert len(receiver._seen) == 2
+    receiver.receive(body(1))
+    assert receiver.updates.qsize() == 4
+
+
+def test_rejects_wrong_secret_and_malformed_body():
+    receiver = WebhookReceiver(make_bot(), secret_token='s3cret', update_class=LazyUpdate)
+    assert receiver.receive(body(1)) == 403
+    assert receiver.receive(body(1), 'wrong') == 403
+    assert receiver.receive(b'not json', 's3cret') == 400
+    assert receiver.receive(b'{"message": {}}', 's3cret') == 400
+    assert receiver.receive(body(1), 's3cret') == 200
+    assert receiver.updates.qsize() == 1
+
+
+def test_updates_are_processed_in_batches_over_http():
+    bot = make_bot()
+    receiver = WebhookReceiver(bot, port=0, batch_size=3)
+    server = receiver.start()
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    try:
+        host, port = server.server_address
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+        statuses = []
+        for path, update_id in [('/1:test', 1), ('/wrong', 2), ('/1:test', 2), ('/1:test', 1), ('/1:test', 3)]:
+            conn.request('POST', path, body(update_id), {'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+        assert statuses == [200, 404, 200, 200, 200]
+        wait_for(lambda: sum(len(batch) for batch in bot.batches) == 3)
+        assert [update.update_id for batch in bot.batches for update in batch] == [1, 2, 3]
+        assert all(len(batch) <= 3 for batch in bot.batches)
+    finally:
+        server.shutdown()
+        receiver.stop()
@@ -0,0 +1,28 @@
+# ===== МАРШРУТИЗАЦИЯ КНОПОК =====
+class TextRouter:
+    # Обработчики кнопок клавиатуры в словаре "текст кнопки -> функция".
+    # В telebot регистрируется один обработчик, и выбор функции - это одна
+    # проверка в словаре, сколько бы кнопок ни было. Остальные обработчики
+    # (команды, типы контента, произвольные условия) работают как обычно.
+    def __init__(self, bot=None):
+        self.routes = {}
+        if bot is not None:
+            self.attach(bot)
+
+    def attach(self, bot):
+        bot.register_message_handler(self.dispatch, content_types=['text'], func=self.match)
+
+    def handler(self, *texts):
+        def decorator(function):
+            for text in texts:
+                if text in self.routes:
+                    raise ValueError(f"Кнопка уже обрабатывается: {text}")
+                self.routes[text] = function
+            return function
+        return decorator
+
+    def match(self, message):
+        return message.text in self.routes
+
+    def dispatch(self, message):
+        return self.routes[message.text](message)
@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+import requests
+import urllib3
+from telebot import apihelper
+
+logger = logging.getLogger(__name__)
+
+# Куда идёт запрос: long polling, файлы, остальные методы API
+UPDATES, API, FILES = 'updates', 'api', 'files'
+
+
+# ===== HTTP-ТРАНСПОРТ BOT API =====
+class PooledTransport:
+    # Один транспорт на процесс вместо сессии requests на каждый поток
+    # (apihelper._get_req_session), которая к тому же пересоздаётся каждые
+    # SESSION_TIME_TO_LIVE секунд. Соединения keep-alive общие для всех потоков
+    # и живут в трёх отдельных пулах urllib3: getUpdates, вызовы API, файлы.
+    # Долгий опрос держит соединение до long_polling_timeout секунд и не должен
+    # занимать соединение, нужное sendMessage, а скачивание файла - тем более.
+    #
+    # Размер пула - число потоков, которые через него ходят: если все соединения
+    # заняты, поток ждёт освободившееся не дольше pool_timeout секунд, лишних
+    # соединений не открывается. Подключается через apihelper.CUSTOM_REQUEST_SENDER
+    # (install()), ответы и ошибки - как у requests, поэтому telebot разницы не видит.
+    def __init__(self, api_pool_size=8, updates_pool_size=1, files_pool_size=4, pool_timeout=30):
+        self.sizes = {UPDATES: updates_pool_size, API: api_pool_size, FILES: files_pool_size}
+        self.pool_timeout = pool_timeout
+        self._managers = {}  # (пул, прокси) -> PoolManager
+        self._lock = threading.Lock()
+
+    def install(self):
+        apihelper.CUSTOM_REQUEST_SENDER = self.request
+        return self
+
+    def uninstall(self):
+        if apihelper.CUSTOM_REQUEST_SENDER == self.request:
+            apihelper.CUSTOM_REQUEST_SENDER = None
+
+    # ===== ЗАПРОСЫ =====
+    def request(self, method, url, params=None, files=None, timeout=None, proxies=None):
+        # Сигнатура CUSTOM_REQUEST_SENDER. Параметры GET - в строке запроса,
+        # POST - в теле формы (с файлами - multipart), как принимает Bot API
+        method = method.upper()
+        body = None
+        headers = {}
+        if files:
+            body, content_type = urllib3.encode_multipart_formdata(_multipart(params, files))
+            headers['Content-Type'] = content_type
+        elif params and method != 'GET':
+            body = urlencode(params, doseq=True)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif params:
+            url += ('&' if '?' in url else '?') + urlencode(params, doseq=True)
+        pool = UPDATES if url.split('?', 1)[0].endswith('/getUpdates') else API
+        return self._urlopen(pool, method, url, body, headers, timeout, proxies, stream=False)
+
+    def stream(self, url, timeout=None, proxies=None):
+        # Скачивание файла кусками через пул файлов; ответ закрывать (with)
+        return self._urlopen(FILES, 'GET', url, None, {}, timeout, proxies, stream=True)
+
+    def _urlopen(self, pool, method, url, body, headers, timeout, proxies, stream):
+        manager = self._manager(pool, _proxy_for(url, proxies))
+        try:
+            response = manager.urlopen(
+                method, url, body=body, headers=headers or None,
+                timeout=_timeout(timeout), retries=False, redirect=False,
+                preload_content=not stream, pool_timeout=self.pool_timeout
+            )
+        except urllib3.exceptions.HTTPError as e:
+            raise _requests_error(e) from e
+        return Response(response, url)
+
+    def _manager(self, pool, proxy):
+        manager = self._managers.get((pool, proxy))
+        if manager is None:
+            with self._lock:
+                manager = self._managers.get((pool, proxy))
+                if manager is None:
+                    kwargs = {'num_pools': 4, 'maxsize': self.sizes[pool], 'block': True}
+                    if proxy is None:
+                        manager = urllib3.PoolManager(**kwargs)
+                    elif proxy.startswith('socks'):
+                        from urllib3.contrib.socks import SOCKSProxyManager
+                        manager = SOCKSProxyManager(proxy, **kwargs)
+                    else:
+                        manager = urllib3.ProxyManager(proxy, **kwargs)
+                    self._managers[(pool, proxy)] = manager
+        return manager
+
+    # ===== ПРОГРЕВ =====
+    def prewarm(self, token, api=2, updates=1):
+        # Заранее открывает несколько соединений (TCP и TLS), чтобы первые
+        # обновления не ждали рукопожатий: по одному дешёвому getMe на
+        # соединение, в пуле API не больше api, в пуле опроса не больше updates.
+        # Остальные соединения откроются по мере нагрузки. Пул файлов не
+        # греется: файлы лежат по другому адресу (/file/bot...), и getMe там нет.
+        # Ошибки только пишутся в лог. Возвращает число открытых соединений по пулам.
+        counts = {UPDATES: updates, API: api}
+        if apihelper.API_URL:
+            url = apihelper.API_URL.format(token, 'getMe')
+        else:
+            url = "https://api.telegram.org/bot{0}/getMe".format(token)
+        jobs = [pool for pool, count in counts.items() for _ in range(min(count, self.sizes[pool]))]
+        if not jobs:
+            return {}
+        started, answered = threading.Barrier(len(jobs)), threading.Barrier(len(jobs))
+
+        def warm(pool):
+            # Соединение держится, пока ответ не прочитан: читаем, только когда
+            # ответили все, иначе следующий запрос возьмёт уже открытое соединение
+            started.wait(timeout=self.pool_timeout)
+            try:
+                response = self._urlopen(pool, 'GET', url, None, {}, None, apihelper.proxy, stream=True)
+            except Exception:
+                answered.abort()
+                raise
+            with response:
+                try:
+                    answered.wait(timeout=self.pool_timeout)
+                except threading.BrokenBarrierError:
+                    pass
+                response.content
+
+        opened = {}
+        with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='TransportWarmup') as warmers:
+            futures = [(pool, warmers.submit(warm, pool)) for pool in jobs]
+            for pool, future in futures:
+                try:
+                    future.result()
+                    opened[pool] = opened.get(pool, 0) + 1
+                except Exception as e:
+                    logger.error(f"Не удалось открыть соединение пула {pool}: {str(e)}")
+        return opened
+
+    # ===== СОСТОЯНИЕ =====
+    def stats(self):
+        # По пулам: размер, открыто соединений за всё время, свободно сейчас, запросов
+        result = {}
+        for (pool, _), manager in list(self._managers.items()):
+            row = result.setdefault(pool, {'size': self.sizes[pool], 'opened': 0, 'idle': 0, 'requests': 0})
+            for key in list(manager.pools.keys()):
+                connection_pool = manager.pools.get(key)
+                if connection_pool is None:
+                    continue
+                row['opened'] += connection_pool.num_connections
+                row['requests'] += connection_pool.num_requests
+                row['idle'] += sum(1 for conn in list(connection_pool.pool.queue) if conn is not None)
+        return result
+
+    def close(self):
+        self.uninstall()
+        with self._lock:
+            for manager in self._managers.values():
+                manager.clear()
+            self._managers.clear()
+
+
+class Response:
+    # Ответ в том виде, который читает apihelper: status_code, reason, text, json()
+    __slots__ = ('status_code', 'reason', 'headers', 'url', '_raw', '_content')
+
+    def __init__(self, raw, url):
+        self.status_code = raw.status
+        self.reason = raw.reason
+        self.headers = raw.headers
+        self.url = url
+        self._raw = raw
+        self._content = None
+
+    @property
+    def content(self):
+        if self._content is None:
+            try:
+                self._content = self._raw.data
+            except urllib3.exceptions.HTTPError as e:
+                raise _requests_error(e) from e
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_content(self, chunk_size=64 * 1024):
+        try:
+            yield from self._raw.stream(chunk_size)
+        except urllib3.exceptions.HTTPError as e:
+            raise _requests_error(e) from e
+
+    def close(self):
+        # Соединение возвращается в пул. Если ответ дочитан не до конца (файл
+        # оказался слишком большим), остаток не качается: соединение закрывается,
+        # пул откроет новое при следующем запросе
+        raw = self._raw
+        if not raw.isclosed():
+            raw.close()
+        raw.release_conn()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def _timeout(timeout):
+    if timeout is None:
+        return urllib3.Timeout(connect=apihelper.CONNECT_TIMEOUT, read=apihelper.READ_TIMEOUT)
+    if isinstance(timeout, tuple):
+        return urllib3.Timeout(connect=timeout[0], read=timeout[1])
+    return urllib3.Timeout(total=timeout)
+
+
+def _proxy_for(url, proxies):
+    # proxies как у requests: {'https': 'http://proxy:3128'}
+    if not proxies:
+        return None
+    scheme = urlsplit(url).scheme
+    return proxies.get(scheme) or proxies.get('all')
+
+
+def _multipart(params, files):
+    # Поля формы и файлы в виде, который понимает urllib3: (имя файла, байты[, тип])
+    fields = dict(params or {})
+    for name, value in files.items():
+        if isinstance(value, tuple):
+            filename, data = value[0], value[1]
+            extra = value[2:3]
+        else:
+            filename, data, extra = os.path.basename(getattr(value, 'name', '') or name), value, ()
+        if hasattr(data, 'read'):
+            data = data.read()
+        fields[name] = (filename, data) + tuple(extra)
+    return fields
+
+
+def _requests_error(e):
+    # Ошибки urllib3 - в исключения requests, которые ждут telebot и обработчики
+    if isinstance(e, urllib3.exceptions.NewConnectionError):
+        return requests.exceptions.ConnectionError(str(e))
+    if isinstance(e, urllib3.exceptions.ConnectTimeoutError):
+        return requests.exceptions.ConnectTimeout(str(e))
+    if isinstance(e, (urllib3.exceptions.ReadTimeoutError, urllib3.exceptions.TimeoutError)):
+        return requests.exceptions.ReadTimeout(str(e))
+    if isinstance(e, urllib3.exceptions.SSLError):
+        return requests.exceptions.SSLError(str(e))
+    if isinstance(e, urllib3.exceptions.ProxyError):
+        return requests.exceptions.ProxyError(str(e))
+    if isinstance(e, urllib3.exceptions.EmptyPoolError):
+        return requests.exceptions.ConnectionError(f"Нет свободного соединения в пуле: {str(e)}")
+    return requests.exceptions.ConnectionError(str(e))
@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+# ===== КЕШ ЗАГРУЖЕННЫХ ФАЙЛОВ =====
+class UploadCache:
+    # Файлы лежат на диске под именем sha256 содержимого, индекс в памяти
+    # связывает file_unique_id с файлом и результатом анализа (тип, страницы).
+    # Повторно присланный документ не скачивается и не разбирается заново.
+    # При превышении max_bytes удаляются давно не использованные файлы.
+    #
+    # Индекс на диске - журнал index.jsonl: каждое добавление, обращение и
+    # удаление дописывается в него одной строкой, без fsync (потерянный хвост
+    # журнала означает лишь повторное скачивание файла). Когда записей в журнале
+    # становится вдвое больше, чем файлов в кеше, он переписывается заново,
+    # поэтому put() не переписывает весь индекс на каждый новый файл.
+    def __init__(self, directory='upload_cache', max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(directory, 'index.json')
+        self._journal_path = os.path.join(directory, 'index.jsonl')
+        self._entries = OrderedDict()
+        self._blobs = {}
+        self._size = 0
+        self._records = 0
+        self._journal = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _blob_path(self, entry):
+        return os.path.join(self.directory, entry['digest'])
+
+    def _load(self):
+        # Индекс прежних версий (index.json целиком) читается один раз и переносится в журнал
+        entries = {}
+        legacy = os.path.exists(self._index_path)
+        if legacy:
+            try:
+                with open(self._index_path, encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+        try:
+            with open(self._journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # недописанная при падении строка - конец журнала
+                    file_unique_id = record.pop('id')
+                    if record.get('deleted'):
+                        entries.pop(file_unique_id, None)
+                    elif 'digest' in record:
+                        entries[file_unique_id] = record
+                    elif file_unique_id in entries:
+                        entries[file_unique_id]['used'] = record['used']
+        except OSError:
+            pass
+        for file_unique_id, entry in sorted(entries.items(), key=lambda item: item[1]['used']):
+            if os.path.exists(self._blob_path(entry)):
+                self._add(file_unique_id, entry)
+        # Журнал сразу переписывается: в нём не остаётся ни недописанной строки, ни удалённых файлов
+        self._compact()
+        if legacy:
+            os.remove(self._index_path)
+
+    def _append(self, file_unique_id, **record):
+        # Под self._lock
+        self._journal.write(json.dumps({'id': file_unique_id, **record}, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        self._records += 1
+        if self._records > max(1000, 2 * len(self._entries)):
+            self._compact()
+
+    def _compact(self):
+        # Под self._lock (или из конструктора): журнал из одних текущих записей
+        if self._journal is not None:
+            self._journal.close()
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for file_unique_id, entry in self._entries.items():
+                f.write(json.dumps({'id': file_unique_id, **entry}, ensure_ascii=False) + '\n')
+        os.replace(tmp, self._journal_path)
+        self._records = len(self._entries)
+        self._journal = open(self._journal_path, 'a', encoding='utf-8')
+
+    def _add(self, file_unique_id, entry):
+        self._entries[file_unique_id] = entry
+        refs = self._blobs.get(entry['digest'], 0)
+        if refs == 0:
+            self._size += entry['size']
+        self._blobs[entry['digest']] = refs + 1
+
+    def _remove(self, file_unique_id):
+        entry = self._entries.pop(file_unique_id)
+        refs = self._blobs[entry['digest']] - 1
+        if refs:
+            self._blobs[entry['digest']] = refs
+            return
+        del self._blobs[entry['digest']]
+        self._size -= entry['size']
+        try:
+            os.remove(self._blob_path(entry))
+        except OSError:
+            pass
+
+    def _touch(self, file_unique_id, entry):
+        # Под self._lock: файл использован, в конец очереди на вытеснение
+        entry['used'] = time.time()
+        self._entries.move_to_end(file_unique_id)
+        self._append(file_unique_id, used=entry['used'])
+
+    def get(self, file_unique_id):
+        with self._lock:
+            entry = self._entries.get(file_unique_id)
+            if entry is not None:
+                self._touch(file_unique_id, entry)
+            return entry
+
+    def checkout(self, file_unique_id, directory):
+        # Копия файла из кеша для заказа: жёсткая ссылка, если получится,
+        # поэтому вытеснение из кеша не трогает файлы уже оформленных заказов
+        with self._lock:
+            entry = self._entries.get(file_unique_id)
+            if entry is None:
+                return None, None
+            self._touch(file_unique_id, entry)
+            fd, path = tempfile.mkstemp(suffix=entry['suffix'], dir=directory)
+            os.close(fd)
+            _link(self._blob_path(entry), path)
+            return path, entry
+
+    def put(self, file_unique_id, path, analysis=None):
+        digest = _file_digest(path)
+        entry = {
+            'digest': digest,
+            'suffix': os.path.splitext(path)[1],
+            'size': os.path.getsize(path),
+            'analysis': analysis,
+            'used': time.time()
+        }
+        with self._lock:
+            if entry['size'] > self.max_bytes:
+                return None
+            if file_unique_id in self._entries:
+                self._remove(file_unique_id)
+            if not os.path.exists(self._blob_path(entry)):
+                _link(path, self._blob_path(entry))
+            self._add(file_unique_id, entry)
+            self._append(file_unique_id, **entry)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                evicted = next(iter(self._entries))
+                self._remove(evicted)
+                self._append(evicted, deleted=True)
+        return entry
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+
+def _link(src, dst):
+    try:
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
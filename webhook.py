@@ -0,0 +1,135 @@
+import json
+import logging
+import queue
+import ssl
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+
+# ===== ПРИЁМ ОБНОВЛЕНИЙ ЧЕРЕЗ ВЕБХУК =====
+class WebhookReceiver:
+    # Принимает обновления от Telegram по HTTP: разбирает JSON, отбрасывает
+    # повторы по update_id и кладёт обновление в ограниченную очередь.
+    # Ответ 200 уходит сразу, обработчики бота работают уже из очереди,
+    # поэтому медленный обработчик не заставляет Telegram повторять доставку.
+    # Если очередь заполнена, отвечаем 503 - Telegram пришлёт обновление позже.
+    def __init__(self, bot, listen='127.0.0.1', port=8443, url_path=None, secret_token=None,
+                 queue_size=1000, batch_size=100, dedupe_size=10000, certificate=None, certificate_key=None,
+                 update_class=types.Update):
+        self.bot = bot
+        self.update_class = update_class
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path or '/' + bot.token
+        self.secret_token = secret_token
+        self.batch_size = batch_size
+        self.certificate = certificate
+        self.certificate_key = certificate_key
+        self.updates = queue.Queue(maxsize=queue_size)
+        self._seen = set()
+        self._seen_order = deque()
+        self._dedupe_size = dedupe_size
+        self._lock = threading.Lock()
+        self._server = None
+        self._worker = None
+
+    def receive(self, body, secret_token=None):
+        # Возвращает HTTP-код ответа, отдельно от сервера - удобно проверять локально
+        if self.secret_token and secret_token != self.secret_token:
+            return 403
+        try:
+            update = self.update_class.de_json(json.loads(body))
+        except (ValueError, KeyError, TypeError):
+            logger.error("Webhook: некорректное обновление")
+            return 400
+
+        with self._lock:
+            if update.update_id in self._seen:
+                return 200
+            try:
+                self.updates.put_nowait(update)
+            except queue.Full:
+                logger.error(f"Webhook: очередь переполнена, update_id {update.update_id} отклонён")
+                return 503
+            self._seen.add(update.update_id)
+            self._seen_order.append(update.update_id)
+            if len(self._seen_order) > self._dedupe_size:
+                self._seen.discard(self._seen_order.popleft())
+        return 200
+
+    def _process(self):
+        while True:
+            update = self.updates.get()
+            if update is None:
+                return
+            batch = [update]
+            while len(batch) < self.batch_size:
+                try:
+                    update = self.updates.get_nowait()
+                except queue.Empty:
+                    break
+                if update is None:
+                    self.updates.put(None)
+                    break
+                batch.append(update)
+            try:
+                self.bot.process_new_updates(batch)
+            except Exception as e:
+                logger.error(f"Webhook: ошибка обработки обновлений: {str(e)}", exc_info=True)
+
+    def start(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                # Тело читается всегда: непрочитанный остаток сломал бы следующий запрос в том же соединении
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path != receiver.url_path:
+                    status = 404
+                else:
+                    status = receiver.receive(body, self.headers.get('X-Telegram-Bot-Api-Secret-Token'))
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.listen, self.port), Handler)
+        self._server.daemon_threads = True
+        if self.certificate:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.certificate, self.certificate_key)
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+        self._worker = threading.Thread(target=self._process, name='WebhookWorker', daemon=True)
+        self._worker.start()
+        return self._server
+
+    def run(self, webhook_url=None, **webhook_kwargs):
+        # Если передан адрес - регистрируем вебхук в Telegram, иначе только слушаем порт
+        server = self.start()
+        if webhook_url:
+            self.bot.remove_webhook()
+            self.bot.set_webhook(
+                url=webhook_url + self.url_path,
+                secret_token=self.secret_token,
+                certificate=open(self.certificate, 'r') if self.certificate else None,
+                **webhook_kwargs
+            )
+        try:
+            server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.server_close()
+        if self._worker is not None:
+            self.updates.put(None)